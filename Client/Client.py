@@ -9,63 +9,124 @@ from bokeh.plotting import figure
 import pandas as pd
 
 from datetime import datetime, timedelta
+import logging
 from math import radians
 from random import randint
 import time
 
 from include.configuration import *
+from include.log_format import log_to_dataframe
+from include.metrics import metrics
+from include.registry import RegistryCache
+from include.subscription import start_receiver
 
+logger = logging.getLogger(__name__)
 
-def _gh_block_dt_proxy_generator(block_id):
-    ns = pyro.locate_ns()
 
-    dt_list = list(ns.yplookup(meta_all=["DT:GH_block",
-                                         "greenhouse:" + block_id.value[0],
-                                         "block:" + block_id.value[1]
-                                         ]
-                               ).keys())
+def _gh_block_dt_proxy_generator(block_id):
+    dt_list = list(registry.yplookup(["DT:GH_block",
+                                      "greenhouse:" + block_id.value[0],
+                                      "block:" + block_id.value[1]
+                                      ]
+                                     ).keys())
 
     while len(dt_list) > 0:
         dt_name = dt_list.pop(randint(0, len(dt_list) - 1))
-        dt_proxy = pyro.Proxy(dt_name)
+        dt_proxy = registry.proxy(dt_name)
         yield dt_proxy
 
 
-# Creating a preriodic update function
+def _subscribe(rem_source, since):
+    global subscription
+    global last_push_time
+
+    _unsubscribe()
+    try:
+        subscription_id = rem_source.subscribe(select_sensor.value,
+                                               str(receiver_uri),
+                                               since=since.to_pydatetime() if not pd.isna(since) else None
+                                               )
+        subscription = (rem_source, subscription_id)
+        last_push_time = time.monotonic()
+        metrics.inc("subscriptions_total")
+    except CommunicationError:
+        metrics.inc("subscription_failures_total")
+        logger.error("Failed to subscribe to the DT, polling it instead")
+
+
+def _unsubscribe():
+    global subscription
+
+    if subscription is not None:
+        try:
+            subscription[0].unsubscribe(subscription[1])
+        except CommunicationError:
+            logger.error("Failed to unsubscribe from the DT")
+        subscription = None
+
+
+# Creating a periodic function processing the entries pushed by the DT
+def drain_pushes():
+    global latest_timestamp
+    global last_push_time
+
+    for subscription_id, feed_id, log in receiver.drain():
+        if subscription is None or subscription_id != subscription[1]:  # Late pushes of a previous subscription
+            continue
+        last_push_time = time.monotonic()
+
+        new_data_df = log_to_dataframe(log, columns=STREAM_DATA_COLUMNS)
+        new_data_df = new_data_df[new_data_df["timestamp"] > latest_timestamp]
+        metrics.inc("pushed_entries_total", new_data_df.shape[0])
+        if new_data_df.shape[0] > 0:
+            latest_timestamp = new_data_df["timestamp"].max()
+            source.stream(new_data_df.to_dict(orient="list"), rollover=GRAPH_ROLLOVER)
+
+
+# Creating a preriodic update function (used only while the subscription isn't working)
 def update():
     global latest_timestamp
     global select_block_id
     global select_sensor
     global source
 
+    if subscription is not None and time.monotonic() - last_push_time < SUBSCRIPTION_STALE_SECONDS:
+        return
+
     proxy_gen = _gh_block_dt_proxy_generator(select_block_id)
 
     current_try = 0
 
     for rem_source in proxy_gen:
         try:
-            new_data_df = pd.DataFrame(rem_source.get_sensor_log(select_sensor.value,
-                                                                 seconds=30
-                                                                 ),
-                                       columns=STREAM_DATA_COLUMNS
-                                       )
-
-            new_data_df["values"] = new_data_df["values"].astype(float)
-            new_data_df["timestamp"] = new_data_df["timestamp"].apply(lambda x: datetime.fromisoformat(x))
+            metrics.inc("polls_total")
+            with metrics.timer("poll_seconds"):
+                new_data_df = log_to_dataframe(rem_source.get_sensor_log(select_sensor.value,
+                                                                         seconds=30,
+                                                                         columnar=True
+                                                                         ),
+                                               columns=STREAM_DATA_COLUMNS
+                                               )
+            polled_until = new_data_df["timestamp"].max()
+
             new_data_df = new_data_df[new_data_df["timestamp"] > latest_timestamp]
             latest_timestamp = new_data_df["timestamp"].min() + timedelta(seconds=MIN_DELTA_BETWEEN_SAMPLES_SECS)
             new_data = new_data_df.to_dict(orient="list")
 
             source.stream(new_data, rollover=GRAPH_ROLLOVER)
 
+            _subscribe(rem_source, polled_until)  # Trying to get back to the pushed entries
             break
 
-        except (CommunicationError, ValueError):
-            print("ERROR: Failed data retrieval from the DT")
+        except (CommunicationError, ValueError) as e:
+            metrics.inc("poll_failures_total")
+            logger.error("Failed data retrieval from the DT")
+            if isinstance(e, CommunicationError):
+                registry.invalidate(rem_source._pyroUri)
 
             current_try += 1
             if current_try >= GET_LOGS_MAX_TRIES:
-                print("ERROR: Failed to retrieve new data")
+                logger.error("Failed to retrieve new data")
                 break
 
 
@@ -76,22 +137,32 @@ def _initialize_graph_data(rem_source):
 
     # TODO: Sia qui che nell'update esiste il caso in cui vengono restituiti zero log
     try:
-        new_data = pd.DataFrame(rem_source.get_sensor_log(select_sensor.value, hours=24), columns=["values", "timestamp"])
-        new_data["values"] = new_data["values"].astype(float)
-        new_data["timestamp"] = new_data["timestamp"].apply(lambda x: datetime.fromisoformat(x))
+        # The 24 hours window is downsampled by the DT to the amount of points the graph keeps
+        with metrics.timer("initial_load_seconds"):
+            new_data = log_to_dataframe(rem_source.get_sensor_log(select_sensor.value,
+                                                                  hours=24,
+                                                                  columnar=True,
+                                                                  aggregate=GRAPH_AGGREGATION
+                                                                  ),
+                                        columns=STREAM_DATA_COLUMNS
+                                        )
         latest_timestamp = new_data["timestamp"].min()
         source.data = new_data.to_dict(orient="list")
         plot.title.text = f"Block: {select_block_id.value}  Sensor: {select_sensor.value}"
 
+        _subscribe(rem_source, new_data["timestamp"].max())  # From now on the new entries are pushed by the DT
+
         return True
     except NamingError:
-        print("ERROR: Failed to find the DT")
+        logger.error("Failed to find the DT")
         return False
     except CommunicationError:
-        print("ERROR: Failed communication with the DT")
+        metrics.inc("initial_load_failures_total")
+        logger.error("Failed communication with the DT")
+        registry.invalidate(rem_source._pyroUri)
         return False
     except ValueError:
-        print("ERROR: Failed the initial data retrieval (The loggers or the DTs may have some issues!)")
+        logger.error("Failed the initial data retrieval (The loggers or the DTs may have some issues!)")
 
 
 def change_source(attrname, old, new):
@@ -101,8 +172,21 @@ def change_source(attrname, old, new):
         if _initialize_graph_data(rem_source):
             break
         else:
-            print("ERROR: Source change failed!")
+            logger.error("Source change failed!")
+
 
+# Leveled logging and optional Prometheus endpoint (started once for all the sessions of the bokeh server)
+logging.basicConfig(level=LOGGING_LEVEL, format=LOGGING_FORMAT)
+if METRICS_HTTP_PORT is not None:
+    metrics.serve(METRICS_HTTP_HOST, METRICS_HTTP_PORT)
+
+# Cached name server lookups and pooled proxies of the digital twins
+registry = RegistryCache()
+
+# Callback object receiving the entries pushed by the DT, and the current subscription (proxy, subscription ID)
+receiver_daemon, receiver, receiver_uri = start_receiver()
+subscription = None
+last_push_time = time.monotonic()
 
 # Plot creation
 plot = figure(x_axis_type="datetime", width=900, height=350)
@@ -129,7 +213,7 @@ latest_timestamp = datetime.min
 
 # Initializing the graph for the first time
 while not _initialize_graph_data(remote_source):
-    print("Failed to get the initial set of data! Retrying . . .")
+    logger.warning("Failed to get the initial set of data! Retrying . . .")
     time.sleep(3)
 
 # Defining the plots
@@ -157,3 +241,12 @@ plot.yaxis.axis_label = "Values"
 lay = layout(column(plot, select_block_id, select_sensor))
 curdoc().add_root(lay)
 curdoc().add_periodic_callback(update, UPDATE_PERIOD)
+curdoc().add_periodic_callback(drain_pushes, SUBSCRIPTION_DRAIN_PERIOD)
+
+
+def _close_session(session_context):
+    _unsubscribe()
+    receiver_daemon.shutdown()
+
+
+curdoc().on_session_destroyed(_close_session)
@@ -0,0 +1,194 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from random import Random
+import numpy as np
+import paho.mqtt.client as mqtt
+import Pyro5.api as pyro
+from Pyro5 import config, nameserver
+
+from include.configuration import STREAM_DATA_COLUMNS
+from include.log_format import log_to_dataframe
+from mqtt_broker_stub import MQTTBrokerStub
+from sensor_data_simulation import sensor_topics
+
+# End-to-end benchmark: a name server and an MQTT broker stand-in are started in process, then L loggers and T twins of
+# block A1 as separate processes, and the load generator runs for the given duration while:
+#  - a probe feed of block A1 is published with the publishing time as value and pushed back through a twin
+#    subscription (sample-to-dashboard latency: MQTT -> logger -> twin cache -> push)
+#  - Q query threads ask random twins for 10 minute windows of random A1 feeds (query latency)
+# The published and stored message rates are reported along with the latency percentiles.
+# Usage (from the Client directory): python benchmark_end_to_end.py [--greenhouses N] [--blocks M] [--sensors K]
+#     [--rate MSG_S] [--processes P] [--seed S] [--loggers L] [--twins T] [--query-threads Q] [--duration SECONDS]
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_LOGGER_SCRIPT = os.path.join(ROOT_DIR, "Data_logger", "data_logger.py")
+GH_BLOCK_DT_SCRIPT = os.path.join(ROOT_DIR, "GH_block_DT", "GH_block_DT.py")
+PROBE_TOPIC = "greenhouses/A/1/sensors/f/probe"
+PROBE_PERIOD_SECONDS = 0.1
+
+
+class _ProbeReceiver(object):
+
+    def __init__(self):
+        self.latencies = list()
+
+    @pyro.expose
+    @pyro.oneway
+    def push_sensor_log(self, subscription_id, feed_id, log):
+        received = time.time()
+        self.latencies.extend(received - log_to_dataframe(log)[STREAM_DATA_COLUMNS[0]].to_numpy())
+
+
+def _wait_registrations(ns, metadata, amount, processes, timeout=60):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        names = list(ns.yplookup(meta_all=metadata).keys())
+        if len(names) >= amount:
+            return names
+        if any(process.poll() is not None for process in processes):
+            raise RuntimeError(f"a process terminated before registering with {metadata}")
+        time.sleep(0.1)
+    raise RuntimeError(f"only {len(names)} of {amount} objects registered with {metadata}")
+
+
+def _probe(broker_port, stop_event):
+    client = mqtt.Client("benchmark_probe")
+    client.connect("localhost", broker_port)
+    client.loop_start()
+    while not stop_event.wait(PROBE_PERIOD_SECONDS):
+        client.publish(PROBE_TOPIC, repr(time.time()))
+    client.loop_stop()
+    client.disconnect()
+
+
+def _query(twin_names, feed_ids, seed, stop_event, latencies):
+    rng = Random(seed)
+    proxies = [pyro.Proxy(name) for name in twin_names]  # Owned by this thread
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        try:
+            rng.choice(proxies).get_sensor_log(rng.choice(feed_ids), minutes=10, columnar=True)
+            latencies.append(time.perf_counter() - start)
+        except Exception as error:
+            print("ERROR: query failed\n", error)
+            time.sleep(0.1)
+
+
+def _committed_rows(logger_name, timeout=30):
+    # Rows committed by the writer of a logger, once it stored everything it received (or the timeout expired)
+    start = time.perf_counter()
+    with pyro.Proxy(logger_name) as logger:
+        while True:
+            stats = logger.get_writer_stats()
+            if (stats["queue_depth"] == 0 and stats["pending_rows"] == 0) or time.perf_counter() - start > timeout:
+                return stats["committed_rows"]
+            time.sleep(0.1)
+
+
+def _percentiles_ms(latencies):
+    if len(latencies) == 0:
+        return "n/a"
+    latencies_ms = np.array(latencies) * 1000
+    return "  ".join(f"p{percentile} {np.percentile(latencies_ms, percentile):.1f} ms" for percentile in (50, 95, 99))
+
+
+def run(args):
+    ns_uri, ns_daemon, _ = nameserver.start_ns(host="localhost", port=args.ns_port, enableBroadcast=False)
+    threading.Thread(target=ns_daemon.requestLoop, daemon=True).start()
+    config.NS_PORT = args.ns_port
+    ns = pyro.Proxy(ns_uri)
+    broker = MQTTBrokerStub(port=args.broker_port)
+    broker.start()
+
+    logger_nodes = [f"logger-{index + 1}" for index in range(args.loggers)]
+    env = dict(os.environ, PYRO_NS_PORT=str(args.ns_port), MQTT_BROKER_PORT=str(args.broker_port),
+               SHARD_RING_NODES=",".join(logger_nodes), GREENHOUSE_ID="A", BLOCK_ID="1")
+    output = None if args.verbose else subprocess.DEVNULL
+    processes = list()
+    log_dir = tempfile.TemporaryDirectory()
+    try:
+        for logger_node in logger_nodes:
+            os.mkdir(os.path.join(log_dir.name, logger_node))
+            processes.append(subprocess.Popen([sys.executable, DATA_LOGGER_SCRIPT],
+                                              cwd=os.path.join(log_dir.name, logger_node),
+                                              env=dict(env, LOGGER_NODE_ID=logger_node),
+                                              stdout=output, stderr=output))
+        logger_names = _wait_registrations(ns, ["datalogger"], args.loggers, processes)
+        for _ in range(args.twins):
+            processes.append(subprocess.Popen([sys.executable, GH_BLOCK_DT_SCRIPT], env=env,
+                                              stdout=output, stderr=output))
+        twin_names = _wait_registrations(ns, ["DT:GH_block", "greenhouse:A", "block:1"], args.twins, processes)
+
+        # Probe subscription (through any twin, it is forwarded to the master)
+        receiver_daemon = pyro.Daemon()
+        receiver = _ProbeReceiver()
+        receiver_uri = receiver_daemon.register(receiver)
+        threading.Thread(target=receiver_daemon.requestLoop, daemon=True).start()
+        with pyro.Proxy(twin_names[0]) as twin:
+            twin.subscribe("PROBE", receiver_uri)
+
+        stored_before = {logger_name: _committed_rows(logger_name) for logger_name in logger_names}
+
+        stop_event = threading.Event()
+        query_latencies = list()
+        feed_ids = sorted(set(topic.split("/")[-1].upper() for topic, _, _ in
+                              sensor_topics(args.greenhouses, args.blocks, args.sensors)))
+        threads = [threading.Thread(target=_probe, args=(args.broker_port, stop_event))]
+        threads += [threading.Thread(target=_query, args=(twin_names, feed_ids, args.seed + index, stop_event,
+                                                          query_latencies))
+                    for index in range(args.query_threads)]
+
+        generator = subprocess.Popen([sys.executable, "sensor_data_simulation.py",
+                                      "--greenhouses", str(args.greenhouses), "--blocks", str(args.blocks),
+                                      "--sensors", str(args.sensors), "--rate", str(args.rate),
+                                      "--processes", str(args.processes), "--seed", str(args.seed),
+                                      "--duration", str(args.duration), "--port", str(args.broker_port), "--quiet"],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        broker_before = broker.get_stats()["received"]
+        benchmark_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        generator.wait()
+        elapsed = time.perf_counter() - benchmark_start
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        time.sleep(2)  # Last pushes of the probe feed
+
+        stored = sum(_committed_rows(logger_name) - stored_before[logger_name] for logger_name in logger_names)
+
+        print(f"\nBroker received:    {(broker.get_stats()['received'] - broker_before) / elapsed:.0f} msg/s")
+        print(f"Loggers stored:     {stored / elapsed:.0f} msg/s ({args.loggers} loggers)")
+        print(f"Sample-to-push:     {_percentiles_ms(receiver.latencies)} ({len(receiver.latencies)} samples)")
+        print(f"Twin queries:       {_percentiles_ms(query_latencies)} "
+              f"({len(query_latencies) / elapsed:.0f} queries/s, {args.twins} twins)")
+    finally:
+        for process in processes:
+            process.kill()
+        for process in processes:
+            process.wait()
+        log_dir.cleanup()
+        broker.stop()
+        ns_daemon.shutdown()
+
+
+parser = argparse.ArgumentParser(description="End-to-end throughput and latency benchmark")
+parser.add_argument("--greenhouses", type=int, default=4)
+parser.add_argument("--blocks", type=int, default=4, help="Blocks of each greenhouse")
+parser.add_argument("--sensors", type=int, default=3, help="Sensors of each block")
+parser.add_argument("--rate", type=float, default=1000, help="Messages per second (all the sensors together)")
+parser.add_argument("--processes", type=int, default=2, help="Load generator processes")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--loggers", type=int, default=1)
+parser.add_argument("--twins", type=int, default=2, help="Twins of block A1")
+parser.add_argument("--query-threads", type=int, default=4)
+parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+parser.add_argument("--ns-port", type=int, default=9290)
+parser.add_argument("--broker-port", type=int, default=18830)
+parser.add_argument("--verbose", action="store_true", help="Show the output of the loggers and twins")
+run(parser.parse_args())
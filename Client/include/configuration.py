@@ -1,3 +1,5 @@
+import os
+
 GET_LOGS_MAX_TRIES = 5
 STREAM_DATA_COLUMNS = ["values", "timestamp"]
 SENSOR_LOGS_TIMESTAMP_COLUMN = "timestamp"
@@ -6,3 +8,16 @@ SENSOR_OPTIONS = [("AIRHUMIDITY", "Air humidity"), ("LUX", "Lux"), ("TEMPERATURE
 BLOCK_ID_OPTIONS = [("A1", "A1"), ("A2", "A2"), ("B1", "B1"), ("B2", "B2")]
 UPDATE_PERIOD = 30000  # UPDATE PERIOD IN MILLISECONDS
 MIN_DELTA_BETWEEN_SAMPLES_SECS = 1
+COLUMNAR_FORMAT_TAG = "columnar-v1"
+ISO_TIMESTAMP_FORMAT = "ISO8601"  # Explicit format for pd.to_datetime (pandas >= 2.0, see include/log_format.py)
+NS_LOOKUP_TTL_SECONDS = 5  # Time a name server lookup result is reused
+GRAPH_AGGREGATION = {"method": "lttb", "points": GRAPH_ROLLOVER}  # Server-side downsampling of the initial window
+SUBSCRIPTION_DRAIN_PERIOD = 500  # PERIOD IN MILLISECONDS OF THE PUSHED DATA PROCESSING
+SUBSCRIPTION_STALE_SECONDS = 15  # Time without pushes (or heartbeats) after which the dashboard falls back to polling
+METRICS_NAMESPACE = "gh_dashboard"
+METRICS_LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_HTTP_HOST = "localhost"
+# Port of the Prometheus text endpoint (/metrics), disabled if not set
+METRICS_HTTP_PORT = int(os.environ["METRICS_HTTP_PORT"]) if "METRICS_HTTP_PORT" in os.environ else None
+LOGGING_LEVEL = os.environ.get("LOGGING_LEVEL", "INFO")
+LOGGING_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import serpent
+
+from include.configuration import STREAM_DATA_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN, COLUMNAR_FORMAT_TAG, \
+    ISO_TIMESTAMP_FORMAT
+
+# The "ISO8601" format needs pandas >= 2.0: older versions infer the (same) format from the first timestamp instead
+_TIMESTAMP_FORMAT = ISO_TIMESTAMP_FORMAT if int(pd.__version__.split(".")[0]) >= 2 else None
+
+
+def iso_format_col_to_datetime(df, column):
+    """
+    Converts a column of timestamps in iso format (as shipped by the serpent serializer) to datetime64, with a single
+    vectorized parsing pass instead of a python call for each row
+    :param df: Dataframe containing the column
+    :param column: Name of the column to convert
+    :return: The dataframe with the converted column
+    """
+    df[column] = pd.to_datetime(df[column], format=_TIMESTAMP_FORMAT)
+    return df
+
+
+def decode_log_columnar(encoded_log):
+    """
+    Rebuilds a log dataframe from its columnar wire format, without any per-row conversion
+    :param encoded_log: Dictionary produced by encode_log_columnar (possibly after a trip through Pyro)
+    :return: Dataframe containing the log entries
+    """
+    data = dict()
+    for column, buffer in encoded_log["columns"]:
+        raw = serpent.tobytes(buffer)  # The serpent serializer ships bytes as base64 dictionaries
+        if column == SENSOR_LOGS_TIMESTAMP_COLUMN:
+            data[column] = np.frombuffer(raw, dtype="<i8").astype("datetime64[ns]")
+        else:
+            data[column] = np.frombuffer(raw, dtype="<f8").astype("float64")
+
+    return pd.DataFrame(data, columns=[column for column, _ in encoded_log["columns"]])
+
+
+def log_to_dataframe(received_log, columns=STREAM_DATA_COLUMNS):
+    """
+    Turns a log received from a remote object in a dataframe with a datetime timestamp column, whichever the format
+    used to transfer it (columnar or list of rows)
+    :param received_log: Log as returned by a remote get_sensor_log call
+    :param columns: Column names to use in case the log was sent as a list of rows
+    :return: Dataframe containing the log entries
+    """
+    if isinstance(received_log, dict) and received_log.get("format") == COLUMNAR_FORMAT_TAG:
+        return decode_log_columnar(received_log)
+
+    # Legacy format: rows of values and timestamps (in iso format)
+    return iso_format_col_to_datetime(pd.DataFrame(received_log, columns=columns), SENSOR_LOGS_TIMESTAMP_COLUMN)
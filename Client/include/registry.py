@@ -0,0 +1,92 @@
+import threading
+import time
+import Pyro5.api as pyro
+from Pyro5.errors import CommunicationError
+
+from include.configuration import NS_LOOKUP_TTL_SECONDS
+
+
+class RegistryCache(object):
+
+    def __init__(self, lookup_ttl=NS_LOOKUP_TTL_SECONDS):
+        """
+        Cache layer over the Pyro name server: lookup results are kept for a short time and proxies are pooled by
+        URI, so that a query doesn't pay a name server lookup and a new connection every time.
+        Pyro proxies can't be shared among threads, so each thread has its own pool (and name server proxy).
+        Communication errors invalidate the failing proxy and every cached lookup (the registrations probably
+        changed).
+        :param lookup_ttl: Amount of seconds a lookup result is reused
+        """
+        self.__lookup_ttl = lookup_ttl
+        self.__lookups = dict()
+        self.__lookups_lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __name_server(self, renew=False):
+        if renew or getattr(self.__local, "name_server", None) is None:
+            self.__local.name_server = pyro.locate_ns()
+        return self.__local.name_server
+
+    def yplookup(self, meta_all, fresh=False):
+        """
+        Cached version of the name server yplookup
+        :param meta_all: Metadata the registrations must have
+        :param fresh: If True the name server is always contacted (the result is cached anyway)
+        :return: Dictionary of the matching registrations (name: (uri, metadata))
+        """
+        lookup_key = tuple(sorted(meta_all))
+        if not fresh:
+            with self.__lookups_lock:
+                cached_lookup = self.__lookups.get(lookup_key)
+            if cached_lookup is not None and cached_lookup[0] > time.monotonic():
+                return cached_lookup[1]
+
+        try:
+            result = self.__name_server().yplookup(meta_all=list(meta_all))
+        except CommunicationError:  # The name server may have been restarted, locate it again
+            result = self.__name_server(renew=True).yplookup(meta_all=list(meta_all))
+
+        with self.__lookups_lock:
+            self.__lookups[lookup_key] = (time.monotonic() + self.__lookup_ttl, result)
+        return result
+
+    def proxy(self, uri):
+        """
+        :param uri: URI (or registered name) of the remote object
+        :return: The proxy of the remote object pooled for the current thread
+        """
+        pool = getattr(self.__local, "proxies", None)
+        if pool is None:
+            pool = self.__local.proxies = dict()
+
+        uri = str(uri)
+        proxy = pool.get(uri)
+        if proxy is None:
+            proxy = pool[uri] = pyro.Proxy(uri)
+        return proxy
+
+    def invalidate(self, uri=None):
+        """
+        Drops the pooled proxy of a remote object (for the current thread) and every cached lookup
+        :param uri: URI of the remote object whose proxy failed (if None only the lookups are dropped)
+        """
+        if uri is not None:
+            proxy = getattr(self.__local, "proxies", dict()).pop(str(uri), None)
+            if proxy is not None:
+                proxy._pyroRelease()
+
+        with self.__lookups_lock:
+            self.__lookups.clear()
+
+    def call(self, uri, method, *args, **kwargs):
+        """
+        Calls a remote method through a pooled proxy, rebuilding the proxy and retrying once on communication errors
+        :param uri: URI (or registered name) of the remote object
+        :param method: Name of the remote method
+        :return: The result of the remote method
+        """
+        try:
+            return getattr(self.proxy(uri), method)(*args, **kwargs)
+        except CommunicationError:
+            self.invalidate(uri)
+            return getattr(self.proxy(uri), method)(*args, **kwargs)
@@ -0,0 +1,53 @@
+import threading
+from queue import Queue, Empty
+import Pyro5.api as pyro
+
+from include.metrics import metrics
+
+
+class SensorLogReceiver(object):
+
+    def __init__(self):
+        """
+        Callback object receiving the entries pushed by the digital twins (see GHBlockDT.subscribe).
+        Pushes arrive on the Pyro daemon threads, so they are only queued here: the dashboard drains them from its
+        own periodic callback (bokeh documents can't be modified from other threads).
+        """
+        self.__pushes = Queue()
+
+    @pyro.expose
+    @pyro.oneway
+    def push_sensor_log(self, subscription_id, feed_id, log):
+        metrics.inc("pushes_total")
+        self.__pushes.put((subscription_id, feed_id, log))
+
+    @pyro.expose
+    def get_metrics(self):
+        """
+        Remote method to retrieve the metrics of the dashboard process (pushes, polls, failures and their latencies)
+        :return: Dictionary of the metrics (see include/metrics.py)
+        """
+        return metrics.snapshot()
+
+    def drain(self):
+        """
+        :return: List of the pushes received since the last call, as (subscription_id, feed_id, log) tuples
+        """
+        pushes = list()
+        try:
+            while True:
+                pushes.append(self.__pushes.get_nowait())
+        except Empty:
+            return pushes
+
+
+def start_receiver():
+    """
+    Starts a Pyro daemon (on its own thread) serving a new receiver
+    :return: Tuple containing the daemon, the receiver and its URI
+    """
+    daemon = pyro.Daemon()
+    receiver = SensorLogReceiver()
+    uri = daemon.register(receiver)
+    threading.Thread(target=daemon.requestLoop, daemon=True).start()
+    return daemon, receiver, uri
@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import threading
+
+# Minimal MQTT 3.1.1 broker standing in for mosquitto in the local benchmarks: it routes QoS 0 (and acknowledges QoS 1)
+# publications to the matching subscriptions, with the + and # wildcards; there are no retained messages, persistent
+# sessions or authentication. It can run in process (see benchmark_end_to_end.py) or on its own.
+# Usage: python mqtt_broker_stub.py [--host localhost] [--port 1883]
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = \
+    1, 2, 3, 4, 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for position, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if position >= len(topic_levels) or (level != "+" and level != topic_levels[position]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _packet(packet_type, flags, body):
+    remaining_length = len(body)
+    encoded_length = bytearray()
+    while True:
+        byte = remaining_length % 128
+        remaining_length //= 128
+        encoded_length.append(byte | 0x80 if remaining_length > 0 else byte)
+        if remaining_length == 0:
+            break
+    return bytes([packet_type << 4 | flags]) + bytes(encoded_length) + body
+
+
+def _topic_filters(body, requested_qos):
+    # Topic filters of a SUBSCRIBE (each one followed by the requested QoS) or UNSUBSCRIBE packet body
+    position = 2  # After the packet identifier
+    while position < len(body):
+        filter_length = int.from_bytes(body[position:position + 2], "big")
+        yield body[position + 2:position + 2 + filter_length].decode("utf-8")
+        position += 2 + filter_length + (1 if requested_qos else 0)
+
+
+class MQTTBrokerStub(object):
+
+    def __init__(self, host="localhost", port=1883):
+        """
+        :param host: Address the broker listens on
+        :param port: Port the broker listens on
+        """
+        self.__host = host
+        self.__port = port
+        self.__subscriptions = dict()  # Topic filters of each connected client (by stream writer)
+        self.__loop = None
+        self.__server = None
+        self.__ready = threading.Event()
+        self.__stats = {"received": 0, "delivered": 0}
+
+    @staticmethod
+    async def __read_packet(reader):
+        header = (await reader.readexactly(1))[0]
+        multiplier = 1
+        remaining_length = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            remaining_length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if byte & 0x80 == 0:
+                break
+        return header >> 4, header & 0x0F, await reader.readexactly(remaining_length)
+
+    def __route(self, topic, payload):
+        self.__stats["received"] += 1
+        message = None
+        for subscriber, topic_filters in list(self.__subscriptions.items()):
+            if any(topic_matches(topic_filter, topic) for topic_filter in topic_filters):
+                if message is None:  # Encoded once for all the subscribers
+                    encoded_topic = topic.encode("utf-8")
+                    message = _packet(PUBLISH, 0, len(encoded_topic).to_bytes(2, "big") + encoded_topic + payload)
+                subscriber.write(message)
+                self.__stats["delivered"] += 1
+
+    async def __handle_client(self, reader, writer):
+        self.__subscriptions[writer] = set()
+        try:
+            while True:
+                packet_type, flags, body = await self.__read_packet(reader)
+                if packet_type == CONNECT:
+                    writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+                elif packet_type == PUBLISH:
+                    topic_length = int.from_bytes(body[:2], "big")
+                    payload_start = 2 + topic_length
+                    if (flags >> 1) & 0x03 > 0:  # QoS 1 (QoS 2 is handled as 1): acknowledged
+                        writer.write(_packet(PUBACK, 0, body[payload_start:payload_start + 2]))
+                        payload_start += 2
+                    self.__route(body[2:2 + topic_length].decode("utf-8"), body[payload_start:])
+                elif packet_type == SUBSCRIBE:
+                    granted_qos = bytearray()
+                    for topic_filter in _topic_filters(body, requested_qos=True):
+                        self.__subscriptions[writer].add(topic_filter)
+                        granted_qos.append(0)
+                    writer.write(_packet(SUBACK, 0, body[:2] + bytes(granted_qos)))
+                elif packet_type == UNSUBSCRIBE:
+                    for topic_filter in _topic_filters(body, requested_qos=False):
+                        self.__subscriptions[writer].discard(topic_filter)
+                    writer.write(_packet(UNSUBACK, 0, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.__subscriptions.pop(writer, None)
+            writer.close()
+
+    def __run(self):
+        self.__loop = asyncio.new_event_loop()
+        self.__server = self.__loop.run_until_complete(asyncio.start_server(self.__handle_client,
+                                                                            self.__host,
+                                                                            self.__port
+                                                                            ))
+        self.__ready.set()
+        self.__loop.run_forever()
+
+    def start(self):
+        """
+        Starts the broker on its own thread, returning once it accepts connections
+        """
+        threading.Thread(target=self.__run, daemon=True).start()
+        self.__ready.wait()
+
+    def stop(self):
+        self.__loop.call_soon_threadsafe(self.__server.close)
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the amount of publications received and of messages delivered to the subscribers
+        """
+        return dict(self.__stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal MQTT broker for local benchmarks")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    MQTTBrokerStub(args.host, args.port).start()
+    print(f"MQTT broker stub listening on {args.host}:{args.port}")
+    threading.Event().wait()
@@ -1,22 +1,111 @@
-import paho.mqtt.client as mqtt
+import argparse
+import multiprocessing
 import time
-from numpy.random import normal
-
-client = mqtt.Client("sensor_data_sim")
-client.connect("localhost")
-sensor_variables = {"temperature": (30, 0.8), "lux": (10000, 100), "airhumidity": (80, 1)}
-greenhouses = ["A", "B"]
-blocks_for_each_GH = ["1", "2"]
-
-while True:
-    for gh in greenhouses:
-        for block in blocks_for_each_GH:
-            for sensor in sensor_variables.keys():
-                topic = "greenhouses/" + gh + "/" + block + "/sensors/f/" + sensor
-                value = normal(sensor_variables[sensor][0], sensor_variables[sensor][1])
-                client.publish(topic,
-                               value
-                               )
-                print(topic + " --- " + str(value))
-    print("\n================================================================================================\n")
-    time.sleep(10)
+import paho.mqtt.client as mqtt
+from numpy.random import default_rng
+
+# Simulated sensor feeds: every sensor of every block of every greenhouse publishes on its MQTT topic, with the
+# messages spread evenly in time to reach the target rate. The sensors are split among the processes, each one with its
+# own MQTT client and random generator (seeded from the base seed, so that runs are repeatable).
+# The defaults reproduce the original simulation: 2 greenhouses (A, B) with 2 blocks each (1, 2) and 3 sensors per
+# block, publishing 12 messages every 10 seconds.
+# Usage: python sensor_data_simulation.py [--greenhouses N] [--blocks M] [--sensors K] [--rate MSG_S]
+#                                         [--processes P] [--seed S] [--duration SECONDS] [--broker HOST] [--port PORT]
+
+SENSOR_VARIABLES = {"temperature": (30, 0.8), "lux": (10000, 100), "airhumidity": (80, 1)}
+EXTRA_SENSOR_VARIABLE = (50, 1)  # Mean and standard deviation of the sensors after the known ones
+TOPIC_FORMAT = "greenhouses/{greenhouse}/{block}/sensors/f/{sensor}"
+
+
+def _letters(index):
+    # A, B, ..., Z, AA, AB, ... (greenhouse identifiers have no digits, so that they stay separable from the blocks)
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def sensor_topics(greenhouses, blocks, sensors):
+    """
+    :param greenhouses: Amount of greenhouses
+    :param blocks: Amount of blocks of each greenhouse
+    :param sensors: Amount of sensors of each block (the known sensors first, then "sensorA", "sensorB", ...)
+    :return: List of (topic, mean, standard deviation) tuples, one for each simulated sensor
+    """
+    sensor_variables = list(SENSOR_VARIABLES.items())[:sensors]
+    sensor_variables += [("sensor" + _letters(index).lower(), EXTRA_SENSOR_VARIABLE)
+                         for index in range(sensors - len(sensor_variables))]
+    return [(TOPIC_FORMAT.format(greenhouse=_letters(greenhouse), block=block + 1, sensor=sensor), mean, std)
+            for greenhouse in range(greenhouses)
+            for block in range(blocks)
+            for sensor, (mean, std) in sensor_variables]
+
+
+def publish(process_index, topics, rate, seed, duration, broker, port, verbose):
+    """
+    Publishes the values of some sensors, in turn, at a fixed rate
+    :param process_index: Index of the process (used to derive its MQTT client ID and random seed)
+    :param topics: List of (topic, mean, standard deviation) tuples of the sensors to simulate
+    :param rate: Messages per second to publish
+    :param seed: Base random seed
+    :param duration: Time to publish for in seconds (0 means forever)
+    :param broker: Address of the MQTT broker
+    :param port: Port of the MQTT broker
+    :param verbose: If True every published value is printed
+    :return: Amount of published messages
+    """
+    rng = default_rng([seed, process_index])
+    client = mqtt.Client(f"sensor_data_sim_{seed}_{process_index}")
+    client.connect(broker, port)
+    client.loop_start()
+
+    period = 1 / rate
+    start = time.perf_counter()
+    next_publish = start
+    published = 0
+    while duration == 0 or time.perf_counter() - start < duration:
+        topic, mean, std = topics[published % len(topics)]
+        value = float(rng.normal(mean, std))
+        client.publish(topic, value)
+        if verbose:
+            print(topic + " --- " + str(value))
+        published += 1
+
+        next_publish += period
+        time.sleep(max(0.0, next_publish - time.perf_counter()))
+
+    client.loop_stop()
+    client.disconnect()
+    return published
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated greenhouse sensor feeds")
+    parser.add_argument("--greenhouses", type=int, default=2)
+    parser.add_argument("--blocks", type=int, default=2, help="Blocks of each greenhouse")
+    parser.add_argument("--sensors", type=int, default=3, help="Sensors of each block")
+    parser.add_argument("--rate", type=float, default=1.2, help="Messages per second (all the sensors together)")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=0, help="Seconds to run for (0 means forever)")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--quiet", action="store_true", help="Don't print the published values")
+    args = parser.parse_args()
+
+    all_topics = sensor_topics(args.greenhouses, args.blocks, args.sensors)
+    processes = min(args.processes, len(all_topics))
+    jobs = [(process_index, all_topics[process_index::processes], args.rate / processes, args.seed, args.duration,
+             args.broker, args.port, not args.quiet)
+            for process_index in range(processes)]
+
+    publishing_start = time.perf_counter()
+    if processes == 1:
+        total_published = publish(*jobs[0])
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            total_published = sum(pool.starmap(publish, jobs))
+    elapsed = time.perf_counter() - publishing_start
+    print(f"Published {total_published} messages in {elapsed:.1f} s ({total_published / elapsed:.0f} msg/s)")
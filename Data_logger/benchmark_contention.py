@@ -0,0 +1,94 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from random import Random
+import numpy as np
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_VALUES_COLUMN, SENSOR_LOGS_TIMESTAMP_COLUMN, \
+    LOG_PARTITION_FORMAT
+from include.storage import SensorLogStorage
+
+# Contention benchmark: N query threads ask for 24 hour windows of random feeds while a live stream of entries is
+# ingested, the query latencies and the achieved ingest rate are reported for each amount of query threads.
+# Usage (from the Data_logger directory): python benchmark_contention.py [--feeds F] [--threads 1 2 4 8]
+
+
+def _prepopulate(storage_dir, feeds, rows_per_feed):
+    now = datetime.now()
+    timestamps = pd.Series(pd.date_range(end=now, periods=rows_per_feed, freq=timedelta(hours=24) / rows_per_feed))
+    for partition_date, partition_timestamps in timestamps.groupby(timestamps.dt.date):
+        with pd.HDFStore(os.path.join(storage_dir, partition_date.strftime(LOG_PARTITION_FORMAT))) as partition:
+            for feed in range(feeds):
+                partition.append(f"G{feed}_TEMPERATURE",
+                                 pd.DataFrame({SENSOR_LOGS_VALUES_COLUMN: np.random.normal(25, 1,
+                                                                                           len(partition_timestamps)),
+                                               SENSOR_LOGS_TIMESTAMP_COLUMN: partition_timestamps.to_numpy()
+                                               }, columns=SENSOR_LOGS_COLUMNS),
+                                 format='t',
+                                 data_columns=True
+                                 )
+
+
+def _ingest(storage, feeds, rate, stop_event, counter):
+    period = 1 / rate
+    next_put = time.perf_counter()
+    while not stop_event.is_set():
+        storage.put(f"G{counter[0] % feeds}_TEMPERATURE", (20.0, datetime.now()))
+        counter[0] += 1
+        next_put += period
+        time.sleep(max(0.0, next_put - time.perf_counter()))
+
+
+def _query(storage, feeds, seed, stop_event, latencies):
+    rng = Random(seed)
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        storage.select_since(f"G{rng.randrange(feeds)}_TEMPERATURE", datetime.now() - timedelta(hours=24))
+        latencies.append(time.perf_counter() - start)
+
+
+def run(storage_dir, feeds, query_threads, rate, duration):
+    storage = SensorLogStorage(storage_dir, LOG_PARTITION_FORMAT)
+    stop_event = threading.Event()
+    ingested = [0]
+    latencies = list()
+
+    threads = [threading.Thread(target=_ingest, args=(storage, feeds, rate, stop_event, ingested))]
+    threads += [threading.Thread(target=_query, args=(storage, feeds, seed, stop_event, latencies))
+                for seed in range(query_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    storage.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {"queries_s": len(latencies) / duration,
+            "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies) > 0 else float("nan"),
+            "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies) > 0 else float("nan"),
+            "ingest_msg_s": ingested[0] / duration
+            }
+
+
+parser = argparse.ArgumentParser(description="Per-feed locking contention benchmark")
+parser.add_argument("--feeds", type=int, default=12)
+parser.add_argument("--rows-per-feed", type=int, default=86400)
+parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+parser.add_argument("--ingest-rate", type=float, default=1000, help="Target ingest rate (entries per second)")
+parser.add_argument("--duration", type=float, default=10, help="Duration of each run (seconds)")
+arguments = parser.parse_args()
+
+for thread_amount in arguments.threads:
+    with tempfile.TemporaryDirectory() as benchmark_dir:
+        _prepopulate(benchmark_dir, arguments.feeds, arguments.rows_per_feed)
+        results = run(benchmark_dir, arguments.feeds, thread_amount, arguments.ingest_rate, arguments.duration)
+
+    print(f"{thread_amount} query threads: {results['queries_s']:.1f} queries/s "
+          f"(p50 {results['p50_ms']:.1f} ms, p99 {results['p99_ms']:.1f} ms), "
+          f"ingest {results['ingest_msg_s']:.0f} msg/s")
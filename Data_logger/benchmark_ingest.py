@@ -0,0 +1,99 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, LOG_PARTITION_FORMAT
+from include.callbacks import on_sensor_message_hdf5
+from include.storage import SensorLogStorage
+
+# Sustained ingest benchmark: the same stream of MQTT messages is handed to the old synchronous callback (spilling
+# every 10 entries of a key, with an fsync each time, inside the MQTT thread) and to the batched writer thread.
+# Usage (from the Data_logger directory): python benchmark_ingest.py [--messages N] [--feeds F]
+
+LEGACY_SENSOR_CACHE_SIZE = 10
+
+
+def _generate_messages(amount, feeds):
+    messages = list()
+    for i in range(amount):
+        feed = i % feeds
+        topic = f"greenhouses/G{feed // 3}/1/sensors/f/sensor{feed % 3}"
+        messages.append(SimpleNamespace(topic=topic, payload=str(20.0 + (i % 100) / 10).encode("utf-8")))
+    return messages
+
+
+def _legacy_on_sensor_message(message, log_storage, cache, storage_lock):
+    topic = message.topic.split("/")
+    _id_begin = topic.index("greenhouses")
+    log_key = topic[_id_begin + 1] + topic[_id_begin + 2] + "_" + topic[topic.index("f") + 1].upper()
+    sensor_cache = cache.setdefault(log_key, list())
+    sensor_cache.append((float(message.payload.decode('utf-8')), datetime.now()))
+
+    if len(sensor_cache) >= LEGACY_SENSOR_CACHE_SIZE:
+        with storage_lock:
+            log_storage.append(log_key,
+                               pd.DataFrame(sensor_cache, columns=SENSOR_LOGS_COLUMNS),
+                               format='t',
+                               append=True,
+                               encoding='utf-8',
+                               data_columns=True
+                               )
+            log_storage.flush(fsync=True)
+        cache[log_key] = list()
+
+
+def benchmark_legacy(messages, storage_path):
+    storage = pd.HDFStore(storage_path)
+    lock = threading.Lock()
+    cache = dict()
+
+    start = time.perf_counter()
+    for message in messages:
+        _legacy_on_sensor_message(message, storage, cache, lock)
+    elapsed = time.perf_counter() - start
+
+    storage.close()
+    return {"intake_msg_s": len(messages) / elapsed, "sustained_msg_s": len(messages) / elapsed}
+
+
+def benchmark_writer(messages, storage_dir):
+    storage = SensorLogStorage(storage_dir, LOG_PARTITION_FORMAT)
+
+    start = time.perf_counter()
+    for message in messages:
+        on_sensor_message_hdf5(None, None, message, log_storage=storage)
+    intake_elapsed = time.perf_counter() - start
+    storage.close()  # Waits for every entry to be committed
+    sustained_elapsed = time.perf_counter() - start
+
+    stats = storage.get_writer_stats()
+    return {"intake_msg_s": len(messages) / intake_elapsed,
+            "sustained_msg_s": len(messages) / sustained_elapsed,
+            "commits": stats["commits"],
+            "blocked_puts": stats["blocked_puts"],
+            "dropped": stats["dropped"]
+            }
+
+
+parser = argparse.ArgumentParser(description="HDF5 ingest throughput benchmark")
+parser.add_argument("--messages", type=int, default=20000)
+parser.add_argument("--feeds", type=int, default=36)
+arguments = parser.parse_args()
+
+benchmark_messages = _generate_messages(arguments.messages, arguments.feeds)
+
+with tempfile.TemporaryDirectory() as benchmark_dir:
+    legacy_results = benchmark_legacy(benchmark_messages, os.path.join(benchmark_dir, "legacy.h5"))
+    writer_results = benchmark_writer(benchmark_messages, benchmark_dir)
+
+print(f"{arguments.messages} messages over {arguments.feeds} feeds")
+print(f"legacy callback: {legacy_results['sustained_msg_s']:.0f} msg/s")
+print(f"batched writer:  {writer_results['intake_msg_s']:.0f} msg/s intake, "
+      f"{writer_results['sustained_msg_s']:.0f} msg/s sustained "
+      f"({writer_results['commits']} commits, {writer_results['blocked_puts']} blocked puts, "
+      f"{writer_results['dropped']} dropped)")
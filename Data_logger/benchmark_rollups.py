@@ -0,0 +1,61 @@
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from include.configuration import LOG_PARTITION_FORMAT
+from include.downsampling import aggregate_buckets
+from include.storage import SensorLogStorage
+
+# Rollup benchmark: a feed is populated with some days of entries (through the storage, so the rollup tiers are
+# maintained as in the logger), then the same bucketed aggregation of the whole period is computed from the raw
+# entries (read and aggregated on the fly) and from the rollup tiers.
+# Usage (from the Data_logger directory): python benchmark_rollups.py [--days 7] [--rate 1] [--bucket-seconds 3600]
+
+LOG_KEY = "A1_TEMPERATURE"
+
+
+def _populate(storage, days, rate):
+    now = datetime.now()
+    rows_per_day = int(86400 * rate)
+    for day in range(days, 0, -1):
+        timestamps = pd.date_range(end=now - timedelta(days=day - 1), periods=rows_per_day, freq=f"{1 / rate}s")
+        storage.append_entries(LOG_KEY, list(zip(np.random.normal(25, 1, rows_per_day), timestamps)))
+    storage.flush()
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+parser = argparse.ArgumentParser(description="Raw vs rollup aggregation benchmark")
+parser.add_argument("--days", type=int, default=7)
+parser.add_argument("--rate", type=float, default=1, help="Entries per second of the feed")
+parser.add_argument("--bucket-seconds", type=int, nargs="+", default=[60, 900, 3600])
+parser.add_argument("--repetitions", type=int, default=5)
+arguments = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as benchmark_dir:
+    log_storage = SensorLogStorage(benchmark_dir, LOG_PARTITION_FORMAT)
+    populate_seconds, _ = _timed(_populate, log_storage, arguments.days, arguments.rate)
+    print(f"Populated {arguments.days} days at {arguments.rate} entries/s in {populate_seconds:.1f} s")
+
+    threshold = datetime.now() - timedelta(days=arguments.days)
+    for bucket_seconds in arguments.bucket_seconds:
+        raw_seconds, rollup_seconds = list(), list()
+        for _ in range(arguments.repetitions):
+            raw_time, raw_df = _timed(lambda: aggregate_buckets(log_storage.select_since(LOG_KEY, threshold),
+                                                                bucket_seconds))
+            rollup_time, rollup_df = _timed(log_storage.select_rollup_since, LOG_KEY, threshold, bucket_seconds)
+            raw_seconds.append(raw_time)
+            rollup_seconds.append(rollup_time)
+
+        print(f"{bucket_seconds:>5} s buckets: raw {np.median(raw_seconds) * 1000:9.1f} ms ({raw_df.shape[0]} buckets) | "
+              f"rollup {np.median(rollup_seconds) * 1000:7.1f} ms ({rollup_df.shape[0]} buckets) | "
+              f"{np.median(raw_seconds) / np.median(rollup_seconds):6.1f}x")
+
+    log_storage.close()
@@ -1,47 +1,68 @@
 import Pyro5.api as pyro
+import logging
 import os
-import threading
 import paho.mqtt.client as mqtt
-import pandas as pd
 from datetime import datetime, timedelta
 import time
 
 from include.configuration import *
-from include.decorators import AutoRemoveOldLogsHDF5, SetLogHDF5Storage
+from include.decorators import AutoRemoveOldLogsHDF5, SetLogHDF5Storage, SetLogShardFilter
 from include.callbacks import on_sensor_message_hdf5
+from include.downsampling import downsample
+from include.hash_ring import HashRing
+from include.load import LoadTracker
+from include.log_format import format_log
+from include.metrics import metrics
+from include.storage import SensorLogStorage
+
+logger = logging.getLogger(__name__)
 
 
 class DataLogger(object):
 
-    def __init__(self, log_dir, storage_filename, mqtt_broker_ip):
+    def __init__(self, log_dir, partition_format, mqtt_broker_ip, node_id=LOGGER_NODE_ID,
+                 mqtt_broker_port=MQTT_BROKER_PORT):
 
         # == STORAGE SETUP ==
-        self.__cache = (dict() if SENSOR_CACHE_SIZE > 1 else None)  # Cache to keep messages before batch-storing
-        self.__lock = threading.Lock()                              # Lock to synchronize read and write operations
-
         self.__log_dir = os.getcwd() + str(log_dir)   # The /log directory will be positioned in the working directory
         if not os.path.isdir(self.__log_dir):         # If the directory doesn't exist, create it
             os.mkdir(self.__log_dir)
 
-        self.__storage = pd.HDFStore(self.__log_dir + "/" + str(storage_filename))   # Creating a HDFS5 storage
+        if os.path.isfile(self.__log_dir + "/" + LOG_STORAGE):  # Logs kept in the storage used before the partitions
+            raise RuntimeError(f"Found the single-file storage {LOG_STORAGE}, "
+                               f"migrate it with migrate_storage.py before starting the logger")
+
+        # Storage of the logs (partitioned by day), with per-log reader/writer locking and a writer thread
+        # batch-storing the new entries
+        self.__storage = SensorLogStorage(self.__log_dir, str(partition_format))
+        self.__load = LoadTracker()  # Queries in flight and recent latencies, reported to the twins
+        metrics.gauge("writer_queue_depth", lambda: self.__storage.get_writer_stats()["queue_depth"])
+        metrics.gauge("writer_pending_rows", lambda: self.__storage.get_writer_stats()["pending_rows"])
+        metrics.gauge("wal_bytes", lambda: self.__storage.get_writer_stats()["wal_bytes"])
+        metrics.gauge("queries_in_flight", lambda: self.__load.get_load()["in_flight"])
+
+        # == SHARDING SETUP ==
+        # The feeds are spread among the loggers with consistent hashing, this logger only stores the feeds whose
+        # owners (as many as the replication factor) include its node
+        self.__node_id = str(node_id)
+        self.__hash_ring = HashRing(SHARD_RING_NODES)
+        if self.__node_id not in self.__hash_ring.nodes():
+            raise RuntimeError(f"Logger node {self.__node_id} is not in SHARD_RING_NODES")
 
         # == MQTT SETUP ==
         # MQTT client setup
         self.__MQTTclient = mqtt.Client()          # MQTT client creation
-        self.__MQTTclient.connect(mqtt_broker_ip)  # Connecting the client to the MQTT broker
+        self.__MQTTclient.connect(mqtt_broker_ip, mqtt_broker_port)  # Connecting the client to the MQTT broker
         self.__MQTTclient.loop_start()             # Starting the thread that processes incoming and outgoing messages
         # MQTT subscriptions setup
         self.__MQTTclient.subscribe(SENSOR_FEED_TOPIC_PATTERN)   # Subscription to the topics regarding sensor feeds
         # MQTT callbacks setup
-        # Those are two decorators which also take configuration parameters
+        # Those are three decorators which also take configuration parameters
+        on_sensor_message_callback = SetLogShardFilter(is_owned=self.owns)(on_sensor_message_hdf5)
         on_sensor_message_callback = AutoRemoveOldLogsHDF5(hdf5_storage=self.__storage,
-                                                           storage_lock=self.__lock,
                                                            logs_ttl=STORAGE_TIME_PERIOD_DAYS
-                                                           )(SetLogHDF5Storage(storage_lock=self.__lock,
-                                                                               log_storage=self.__storage,
-                                                                               cache=self.__cache,
-                                                                               sensor_cache_size=SENSOR_CACHE_SIZE
-                                                                               )(on_sensor_message_hdf5)
+                                                           )(SetLogHDF5Storage(log_storage=self.__storage
+                                                                               )(on_sensor_message_callback)
                                                              )
         self.__MQTTclient.message_callback_add(SENSOR_FEED_TOPIC_PATTERN,  # Adding a callback for sensor feeds
                                                on_sensor_message_callback
@@ -55,66 +76,68 @@ class DataLogger(object):
             pass
 
         try:
-            self.__lock.acquire()  # Acquire lock
-
-            for key in self.__cache.keys():
-                # Storing all cached values before closing
-                if len(self.__cache[key]) > 0:
-                    self.__storage.append(key,
-                                          pd.DataFrame(self.__cache[key], columns=SENSOR_LOGS_COLUMNS),
-                                          format='t',
-                                          append=True,
-                                          encoding='utf-8',
-                                          data_columns=True,
-                                          min_itemsize=SENSOR_LOGS_COLUMNS_SIZES
-                                          )
-            self.__storage.close()  # Storage flushed and closed
+            self.__storage.close()  # Pending values stored, then storage flushed and closed
         except AttributeError:
             pass
-        finally:
-            if self.__lock.locked():
-                self.__lock.release()  # Lock release
 
     def __get_sensor_log_threshold(self, storage_key, threshold):
         try:
-            self.__lock.acquire()  # Lock acquisition
-
-            cached_vals = self.__cache.get(storage_key)
-
-            # Data retrieval from storage (first check if the key is in the storage, or it is only in cache)
-            if (storage_key if storage_key[0] == "/" else "/" + storage_key) in self.__storage.keys():
-                ret = self.__storage.select(storage_key,
-                                            SENSOR_LOGS_TIMESTAMP_COLUMN + f" >= '{threshold}'"
-                                            ).values.tolist()
-            else:
-                ret = []
-
-            # If the retrieval from storage returned at least a value, all cached values match the query
-            if len(ret) > 0:
-                ret = ret + (cached_vals if cached_vals is not None else [])
-            elif cached_vals is not None:  # If no storage values are returned, some cached values may match the query
-                cached_vals_df = pd.DataFrame(cached_vals, columns=SENSOR_LOGS_COLUMNS)
-                mask = cached_vals_df[SENSOR_LOGS_TIMESTAMP_COLUMN] >= threshold
-                ret = cached_vals_df[mask].values.tolist()
-
+            ret = self.__storage.select_since(storage_key, threshold)
         except KeyError as remote_error:
-            error_string = "(client) KeyError: " + str(remote_error)
-            print(error_string)
+            logger.warning("(client) KeyError: %s", remote_error)
             raise remote_error
-        finally:
-            if self.__lock.locked():
-                self.__lock.release()  # Lock release
 
-        print(f"ANSWERED QUERY - results: {len(ret)}")
+        metrics.inc("queries_total")
+        logger.debug("Answered query - results: %d", ret.shape[0])
+
+        return ret
+
+    def __rollup_bucket_seconds(self, aggregate):
+        # Bucketed aggregations are answered by the rollup tiers, if one of them fits the requested resolution
+        if aggregate is None or aggregate.get("method") != "buckets":
+            return None
+        bucket_seconds = aggregate.get("bucket_seconds", AGGREGATE_DEFAULT_BUCKET_SECONDS)
+        return bucket_seconds if self.__storage.has_rollup_tier(bucket_seconds) else None
+
+    def __get_sensor_log_aggregated(self, storage_key, threshold, aggregate):
+        bucket_seconds = self.__rollup_bucket_seconds(aggregate)
+        if bucket_seconds is None:
+            return downsample(self.__get_sensor_log_threshold(storage_key, threshold), aggregate)
+
+        ret = self.__storage.select_rollup_since(storage_key, threshold, bucket_seconds)
+        metrics.inc("rollup_queries_total")
+        logger.debug("Answered rollup query - buckets: %d", ret.shape[0])
 
         return ret
 
+    def __get_sensor_logs_thresholds(self, thresholds):
+        ret = self.__storage.select_since_many(thresholds)
+
+        metrics.inc("batch_queries_total")
+        logger.debug("Answered batch query - feeds: %d, results: %d", len(ret), sum(df.shape[0] for df in ret.values()))
+
+        return ret
+
+    @staticmethod
+    def __storage_key(source_id, feed_id):
+        source_id_str = str(source_id)
+        feed_id_str = str(feed_id)
+        return source_id_str + "_" + (feed_id_str.upper() if feed_id_str.isalpha() else feed_id_str)
+
+    def owns(self, log_key):
+        return self.__hash_ring.owns(self.__node_id, log_key, SHARD_REPLICATION_FACTOR)
+
     @pyro.expose
     def ping(self):
         return True
 
     @pyro.expose
-    def get_sensor_log(self, source_id, feed_id, days=0, hours=0, minutes=0, seconds=0):
+    def get_node_id(self):
+        return self.__node_id
+
+    @pyro.expose
+    def get_sensor_log(self, source_id, feed_id, days=0, hours=0, minutes=0, seconds=0, columnar=False,
+                       aggregate=None):
         """
         Remote method to retrieve entries matching a specific time slice from a specific log
         :param source_id: Identifier of the sensor feed source
@@ -123,6 +146,8 @@ class DataLogger(object):
         :param hours: Time slice to retrieve from the log in hours
         :param minutes: Time slice to retrieve from the log in minutes
         :param seconds: Time slice to retrieve from the log in seconds
+        :param columnar: If True the entries are returned in the columnar format (see include/log_format.py)
+        :param aggregate: Aggregation computed on the entries before sending them (see include/downsampling.py)
         :return: List of the log entries from the selected source and kind of feed matching the selected time slice
         """
         threshold = datetime.now() - timedelta(days=float(days),
@@ -130,68 +155,200 @@ class DataLogger(object):
                                                minutes=float(minutes),
                                                seconds=float(seconds))
 
-        source_id_str = str(source_id)
-        feed_id_str = str(feed_id)
-        storage_key = source_id_str + "_" + (feed_id_str.upper() if feed_id_str.isalpha() else feed_id_str)
+        storage_key = self.__storage_key(source_id, feed_id)
 
-        return self.__get_sensor_log_threshold(storage_key, threshold)
+        with self.__load.track():
+            return format_log(self.__get_sensor_log_aggregated(storage_key, threshold, aggregate), columnar=columnar)
 
     @pyro.expose
-    def get_sensor_log_till_timestamp(self, source_id, feed_id, timestamp):
-        source_id_str = str(source_id)
-        feed_id_str = str(feed_id)
-        storage_key = source_id_str + "_" + (feed_id_str.upper() if feed_id_str.isalpha() else feed_id_str)
+    def get_sensor_log_till_timestamp(self, source_id, feed_id, timestamp, columnar=False, aggregate=None):
+        storage_key = self.__storage_key(source_id, feed_id)
 
-        return self.__get_sensor_log_threshold(storage_key, timestamp)
+        with self.__load.track():
+            return format_log(self.__get_sensor_log_aggregated(storage_key, timestamp, aggregate), columnar=columnar)
 
     @pyro.expose
-    def get_sensor_source_logs(self, source_id, days=0, hours=0, minutes=0, seconds=0):
-        storage_keys = [key.strip("/") for key in self.__storage.keys()]
-        cached_keys = list(self.__cache.keys())
-        logs = dict()
-
-        for key in set(storage_keys + cached_keys):
-            key_components = key.split("_")
-            if key_components[0] == source_id:
-                logs[key] = self.get_sensor_log(source_id=key_components[0],
-                                                feed_id=key_components[1],
-                                                days=days,
-                                                hours=hours,
-                                                minutes=minutes,
-                                                seconds=seconds
-                                                )
-
-        return logs
+    def get_sensor_logs_batch(self, source_id, queries, columnar=False, aggregate=None):
+        """
+        Remote method to retrieve the entries of many feeds of a source with a single call (and a single pass over
+        the storage)
+        :param source_id: Identifier of the sensor feed source
+        :param queries: List of (feed_id, since) pairs, since being either the time slice to retrieve in seconds or the
+                        oldest timestamp to retrieve
+        :param columnar: If True the entries are returned in the columnar format (see include/log_format.py)
+        :param aggregate: Aggregation computed on the entries before sending them (see include/downsampling.py)
+        :return: Dictionary of the log entries of each requested feed
+        """
+        now = datetime.now()
+        storage_keys = dict()
+        thresholds = dict()
+        for feed_id, since in queries:
+            storage_key = self.__storage_key(source_id, feed_id)
+            storage_keys[str(feed_id)] = storage_key
+            thresholds[storage_key] = (now - timedelta(seconds=float(since)) if isinstance(since, (int, float))
+                                       else since)
+
+        with self.__load.track():
+            if self.__rollup_bucket_seconds(aggregate) is not None:
+                return {feed_id: format_log(self.__get_sensor_log_aggregated(storage_key,
+                                                                             thresholds[storage_key],
+                                                                             aggregate
+                                                                             ), columnar=columnar)
+                        for feed_id, storage_key in storage_keys.items()}
+
+            logs = self.__get_sensor_logs_thresholds(thresholds)
+
+            return {feed_id: format_log(downsample(logs[storage_key], aggregate), columnar=columnar)
+                    for feed_id, storage_key in storage_keys.items()}
 
     @pyro.expose
-    def get_sensor_source_logs_till_timestamp(self, source_id, timestamp):
-        storage_keys = [key.strip("/") for key in self.__storage.keys()]
-        cached_keys = list(self.__cache.keys())
-        logs = dict()
-
-        for key in set(storage_keys + cached_keys):
-            key_components = key.split("_")
-            if key_components[0] == source_id:
-                logs[key] = self.get_sensor_log_till_timestamp(source_id=key_components[0],
-                                                               feed_id=key_components[1],
-                                                               timestamp=timestamp
-                                                               )
-        return logs
+    def get_sensor_log_since(self, source_id, feed_id, seq, epoch, columnar=False):
+        """
+        Remote method to retrieve exactly the entries of a feed following the newest one the caller has, identified
+        by its sequence number (assigned at ingest, increasing for each feed)
+        :param source_id: Identifier of the sensor feed source
+        :param feed_id: Identifier of the kind of sensor feed (kind of measurement)
+        :param seq: Sequence number of the newest entry the caller has (0 if it has none of this epoch)
+        :param epoch: Epoch of the sequence number (see get_sensor_logs_since_batch)
+        :param columnar: If True the entries are returned in the columnar format (see include/log_format.py)
+        :return: Dictionary with the new entries ("log"), the sequence number of the newest one ("seq"), the epoch and
+                 the node of the logger, or None if the entries can't be retrieved by sequence number (other epoch, or
+                 entries no longer in the hot tier): the caller has to retrieve them by time
+        """
+        with self.__load.track():
+            delta = self.__storage.select_after_seq(self.__storage_key(source_id, feed_id), (epoch, seq))
+        if delta is None:
+            return None
+
+        metrics.inc("delta_queries_total")
+        return {"log": format_log(delta[0], columnar=columnar),
+                "seq": delta[1],
+                "epoch": self.__storage.epoch,
+                "node_id": self.__node_id
+                }
+
+    @pyro.expose
+    def get_sensor_logs_since_batch(self, source_id, queries, columnar=False):
+        """
+        Remote method to bring up to date the copies of many feeds of a source with a single call: the feeds whose
+        newest entry is known get exactly the following ones (see get_sensor_log_since), the others (or those whose
+        entries can't be retrieved by sequence number) get their time-window, along with the sequence number of its
+        newest entry
+        :param source_id: Identifier of the sensor feed source
+        :param queries: List of (feed_id, since, seq_mark) tuples, since being the time slice in seconds or the oldest
+                        timestamp to retrieve by time, and seq_mark the (epoch, seq) pair of the newest entry the
+                        caller has (or None)
+        :param columnar: If True the entries are returned in the columnar format (see include/log_format.py)
+        :return: Dictionary with the epoch and the node of the logger, and the entries ("log"), the (epoch, seq) pair
+                 of the newest entry ("seq") and whether they follow the known one ("delta") for each feed
+        """
+        now = datetime.now()
+        feeds = dict()
+        storage_keys = dict()
+        thresholds = dict()
+        with self.__load.track():
+            for feed_id, since, seq_mark in queries:
+                storage_key = self.__storage_key(source_id, feed_id)
+                if seq_mark is not None:
+                    delta = self.__storage.select_after_seq(storage_key, seq_mark)
+                    if delta is not None:
+                        feeds[str(feed_id)] = {"log": format_log(delta[0], columnar=columnar),
+                                               "seq": (self.__storage.epoch, delta[1]),
+                                               "delta": True
+                                               }
+                        continue
+                storage_keys[str(feed_id)] = storage_key
+                thresholds[storage_key] = (now - timedelta(seconds=float(since)) if isinstance(since, (int, float))
+                                           else since)
+
+            logs, seqs = self.__storage.select_since_many_with_seq(thresholds)
+            for feed_id, storage_key in storage_keys.items():
+                feeds[feed_id] = {"log": format_log(logs[storage_key], columnar=columnar),
+                                  "seq": (self.__storage.epoch, seqs[storage_key]),
+                                  "delta": False
+                                  }
+
+        metrics.inc("delta_queries_total", len(feeds) - len(storage_keys))
+        metrics.inc("window_queries_total", len(storage_keys))
+        logger.debug("Answered delta batch query - feeds: %d, by time: %d", len(feeds), len(storage_keys))
+        return {"epoch": self.__storage.epoch, "node_id": self.__node_id, "feeds": feeds}
+
+    @pyro.expose
+    def get_sensor_source_logs(self, source_id, days=0, hours=0, minutes=0, seconds=0, columnar=False):
+        threshold = datetime.now() - timedelta(days=float(days),
+                                               hours=float(hours),
+                                               minutes=float(minutes),
+                                               seconds=float(seconds))
+
+        return self.get_sensor_source_logs_till_timestamp(source_id, threshold, columnar=columnar)
+
+    @pyro.expose
+    def get_sensor_source_logs_till_timestamp(self, source_id, timestamp, columnar=False):
+        # Every feed of the source is read with a single pass over the storage
+        with self.__load.track():
+            logs = self.__get_sensor_logs_thresholds({key: timestamp for key in self.__storage.keys()
+                                                      if key.split("_")[0] == source_id})
+
+            return {key: format_log(log_df, columnar=columnar) for key, log_df in logs.items()}
 
     @pyro.expose
     def get_sensor_source_feed_keys(self, source_id):
-        return [key.split("_")[1] for key in self.__storage.keys() if key.startswith("/" + str(source_id))]
+        return [key.split("_")[1] for key in self.__storage.keys() if key.startswith(str(source_id) + "_")]
+
+    @pyro.expose
+    def get_writer_stats(self):
+        """
+        Remote method to retrieve the counters of the writer thread (queue depth, dropped entries, commits, ...)
+        :return: Dictionary of the writer counters
+        """
+        return self.__storage.get_writer_stats()
+
+    @pyro.expose
+    def get_hot_tier_stats(self):
+        """
+        Remote method to retrieve the hit/miss counters of the in-memory hot tier
+        :return: Dictionary of the hot tier counters
+        """
+        return self.__storage.get_hot_tier_stats()
+
+    @pyro.expose
+    def get_load(self):
+        """
+        Remote method to retrieve the current load of the logger, used by the twins to choose among the replicas of a
+        feed (see GH_block_DT/include/load_balancer.py)
+        :return: Dictionary with the queries in flight, the recent p95 query latency (ms), the writer queue depth
+                 (and fill ratio) and whether the retention sweep is running
+        """
+        load = self.__load.get_load()
+        load["queue_depth"] = self.__storage.get_writer_stats()["queue_depth"]
+        load["queue_fill"] = load["queue_depth"] / WRITER_QUEUE_SIZE
+        load["sweeping"] = self.__storage.is_sweeping()
+        return load
+
+    @pyro.expose
+    def get_metrics(self):
+        """
+        Remote method to retrieve the metrics of the logger: counters (MQTT ingest, queries, ...), gauges (writer
+        queue, ...) and latency histograms (ingest, HDF5 append/flush/select, commits, sweeps, queries)
+        :return: Dictionary of the metrics (see include/metrics.py)
+        """
+        return metrics.snapshot()
 
     @pyro.expose
     def get_current_time(self):
         return datetime.now()
 
 
+logging.basicConfig(level=LOGGING_LEVEL, format=LOGGING_FORMAT)
+if METRICS_HTTP_PORT is not None:
+    metrics.serve(METRICS_HTTP_HOST, METRICS_HTTP_PORT)
+
 daemon = pyro.Daemon()
 ns = pyro.locate_ns()
-logger_obj = DataLogger(LOG_DIR, LOG_STORAGE, MQTT_BROKER_IP)
+logger_obj = DataLogger(LOG_DIR, LOG_PARTITION_FORMAT, MQTT_BROKER_IP)
 uri = daemon.register(logger_obj)
 
-ns.register(str(uri), uri, metadata=DATA_LOGGER_METADATA)
-print(f"Data logger {uri}: READY")
+# The node of the logger on the hash ring is advertised in its metadata, so that the twins can route the queries
+ns.register(str(uri), uri, metadata=DATA_LOGGER_METADATA | {SHARD_NODE_METADATA_KEY + LOGGER_NODE_ID})
+logger.info("Data logger %s: READY", uri)
 daemon.requestLoop()
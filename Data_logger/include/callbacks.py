@@ -1,8 +1,10 @@
+import logging
 import os
 from datetime import datetime
-import pandas as pd
 
-from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_COLUMNS_SIZES
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 
 def on_sensor_message(client, userdata, message, log_dir):
@@ -23,13 +25,19 @@ def on_sensor_message(client, userdata, message, log_dir):
             log.write(f"{message.payload.decode('utf-8')}, {datetime.now()}\n")
             log.close()
         except OSError:
-            print(f'ERROR: failed to open {log_file}')
+            logger.error("Failed to open %s", log_file)
 
     except (ValueError, IndexError):
-        print('ERROR: "on_sensor_message" callback received a message from a topic with incompatible structure')
+        logger.error('"on_sensor_message" callback received a message from a topic with incompatible structure')
+
+
+def on_sensor_message_hdf5(client, userdata, message, log_storage, is_owned=None):
+    with metrics.timer("mqtt_ingest_seconds"):
+        _on_sensor_message_hdf5(message, log_storage, is_owned)
 
 
-def on_sensor_message_hdf5(client, userdata, message, log_storage, cache, sensor_cache_size, storage_lock):
+def _on_sensor_message_hdf5(message, log_storage, is_owned):
+    metrics.inc("mqtt_messages_total")
 
     topic = message.topic.split("/")  # Get the topic as a list of strings representing each topic level
     try:
@@ -41,50 +49,25 @@ def on_sensor_message_hdf5(client, userdata, message, log_storage, cache, sensor
         sensor_type = topic[topic.index("f") + 1].upper()
         log_key = greenhouse_id + "_" + sensor_type
 
-        # Creation of the new tuple
-        new_entry = (message.payload.decode('utf-8'), datetime.now())
-
-        if cache is not None:  # If a cache has been defined fill it before spilling to the actual storage
-            sensor_cache = cache.get(log_key)
-
-            if sensor_cache is not None:
-                sensor_cache.append(new_entry)
-
-                if len(sensor_cache) >= sensor_cache_size:
-                    storage_lock.acquire()  # Acquire the lock before writing (this way there won't be any faulty reads)
-
-                    # Put the cached entries in the storage then flush the modifications to disk
-                    log_storage.append(log_key,
-                                       pd.DataFrame(sensor_cache, columns=SENSOR_LOGS_COLUMNS),
-                                       format='t',
-                                       append=True,
-                                       encoding='utf-8',
-                                       data_columns=True,
-                                       min_itemsize=SENSOR_LOGS_COLUMNS_SIZES
-                                       )
-                    log_storage.flush(fsync=True)
-
-                    storage_lock.release()  # Release the lock after the writing operation ended
-
-                    cache[log_key] = list()  # Clean the cache
-            else:  # The cache size is greater than one, so a new cache can't be spilled upon creation
-                cache[log_key] = list((new_entry,))
-
-        else:  # If no cache has been defined just put the value in the memory
-            storage_lock.acquire()
-            log_storage.append(log_key,
-                               pd.DataFrame(new_entry, columns=SENSOR_LOGS_COLUMNS),
-                               format='t',
-                               append=True,
-                               encoding='utf-8',
-                               data_columns=True
-                               )
-            log_storage.flush(fsync=True)
-            storage_lock.release()
+        if is_owned is not None and not is_owned(log_key):  # The log belongs to the shard of other loggers
+            metrics.inc("mqtt_foreign_messages_total")
+            return
+
+        # Creation of the new tuple (the payload is parsed here, so that the storage keeps a float64 column)
+        try:
+            new_entry = (float(message.payload.decode('utf-8')), datetime.now())
+        except (ValueError, UnicodeDecodeError):
+            metrics.inc("mqtt_invalid_messages_total")
+            logger.warning('"on_sensor_message" callback received a non numeric payload on %s', message.topic)
+            return
+
+        # The entry is handed to the writer thread of the storage, which will batch-store it (the MQTT loop is never
+        # stalled by the storage, unless the writing queue is full)
+        if not log_storage.put(log_key, new_entry):
+            metrics.inc("mqtt_dropped_messages_total")
+            logger.error("Writing queue full, dropped entry for %s", log_key)
 
     except (ValueError, IndexError) as error:
-        print('ERROR: "on_sensor_message" callback received a message from a topic with incompatible structure\n',
-              error)
-    finally:
-        if storage_lock.locked():
-            storage_lock.release()
\ No newline at end of file
+        metrics.inc("mqtt_invalid_messages_total")
+        logger.warning('"on_sensor_message" callback received a message from a topic with incompatible structure: %s',
+                       error)
@@ -1,10 +1,50 @@
-LOG_DIR = "/log"
-LOG_STORAGE = "sensor_logs.h5"
-SENSOR_CACHE_SIZE = 10
+import os
+
+LOG_DIR = os.environ.get("LOG_DIR", "/log")  # Relative to the working directory
+LOG_STORAGE = "sensor_logs.h5"  # Single-file storage used before the daily partitions (see migrate_storage.py)
+LOG_PARTITION_FORMAT = "sensor_logs_%Y-%m-%d.h5"
 SENSOR_LOGS_TIMESTAMP_COLUMN = "timestamp"
-SENSOR_LOGS_COLUMNS = list(["values", SENSOR_LOGS_TIMESTAMP_COLUMN])
-SENSOR_LOGS_COLUMNS_SIZES = {"values": 15}
+SENSOR_LOGS_VALUES_COLUMN = "values"
+SENSOR_LOGS_COLUMNS = list([SENSOR_LOGS_VALUES_COLUMN, SENSOR_LOGS_TIMESTAMP_COLUMN])
 STORAGE_TIME_PERIOD_DAYS = 7
-MQTT_BROKER_IP = "localhost"
+MQTT_BROKER_IP = os.environ.get("MQTT_BROKER_IP", "localhost")
+MQTT_BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", 1883))
 SENSOR_FEED_TOPIC_PATTERN = "greenhouses/+/+/sensors/f/+"
 DATA_LOGGER_METADATA = {"datalogger"}
+COLUMNAR_FORMAT_TAG = "columnar-v1"
+MIGRATION_CHUNK_ROWS = 100000
+MIGRATION_TEMPORARY_SUFFIX = ".migrating"  # Suffix of the partitions being migrated (renamed once complete)
+WRITER_QUEUE_SIZE = 10000
+WRITER_BATCH_ROWS = 500
+WRITER_BATCH_SECONDS = 2
+WRITER_QUEUE_PUT_TIMEOUT_SECONDS = 1
+WRITER_MAX_DEFERRED_COMMITS = 5
+WAL_FILE = "sensor_logs.wal"  # Write-ahead log of the entries not yet durably stored (see include/wal.py)
+WAL_SYNC_SECONDS = 0.5  # Maximum time the new entries wait for an fsync of the write-ahead log
+WAL_CHECKPOINT_SECONDS = 30  # Maximum time between two fsyncs of the storage (the write-ahead log is then truncated)
+WAL_CHECKPOINT_BYTES = 64 * 1024 * 1024  # Size of the write-ahead log triggering an early checkpoint
+STORAGE_READ_CHUNK_ROWS = 50000
+HOT_TIER_SPAN_MINUTES = 60
+HOT_TIER_CAPACITY_ROWS = 65536
+AGGREGATE_BUCKET_COLUMNS = ["values", "min", "max", "last", "timestamp"]  # "values" holds the mean of the bucket
+AGGREGATE_DEFAULT_BUCKET_SECONDS = 60
+AGGREGATE_DEFAULT_POINTS = 500
+ROLLUP_STORAGE_FORMAT = "sensor_rollups_{seconds}s.h5"  # Single-file tiers used before the periods (migrated at start)
+ROLLUP_PARTITION_FORMAT = "sensor_rollups_{seconds}s_%Y-%m-%d.h5"  # Period files of the tiers (named after their start)
+ROLLUP_TIERS_PERIOD_DAYS = {60: 7, 900: 30, 3600: 90}  # Days covered by each period file of the tiers
+ROLLUP_COLUMNS = ["timestamp", "count", "sum", "min", "max", "last"]
+ROLLUP_TIERS_RETENTION_DAYS = {60: 30, 900: 180, 3600: 730}  # Rollup tiers (bucket seconds: days of retention)
+SHARD_RING_NODES = os.environ.get("SHARD_RING_NODES", "logger-1").split(",")  # Logger nodes sharing the feeds
+                                                                            # (same list on every logger and twin)
+SHARD_REPLICATION_FACTOR = 1     # Amount of loggers storing each feed
+SHARD_VIRTUAL_NODES = 64
+SHARD_NODE_METADATA_KEY = "shard_node:"
+LOAD_LATENCY_WINDOW = 256  # Amount of recent queries whose latency is used for the reported p95
+LOGGER_NODE_ID = os.environ.get("LOGGER_NODE_ID", SHARD_RING_NODES[0])  # Node of this logger on the ring
+METRICS_NAMESPACE = "gh_data_logger"
+METRICS_LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_HTTP_HOST = "localhost"
+# Port of the Prometheus text endpoint (/metrics), disabled if not set
+METRICS_HTTP_PORT = int(os.environ["METRICS_HTTP_PORT"]) if "METRICS_HTTP_PORT" in os.environ else None
+LOGGING_LEVEL = os.environ.get("LOGGING_LEVEL", "INFO")  # DEBUG also logs every answered query
+LOGGING_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
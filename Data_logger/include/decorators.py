@@ -1,8 +1,6 @@
 import os
 from datetime import datetime, timedelta
 
-from include.configuration import SENSOR_LOGS_TIMESTAMP_COLUMN
-
 
 def _process_log_dir_str(log_dir):
     dir_name = str(log_dir)
@@ -39,28 +37,35 @@ class SetLogDir(object):
 
 class SetLogHDF5Storage(object):
 
-    def __init__(self, storage_lock, log_storage, cache=None, sensor_cache_size=10):
+    def __init__(self, log_storage):
         """
         *DECORATOR*
-        Sets a wrapper function around a callback, setting automatically all the configuration variables and objects
-        necessary to access a HDFS5 storage through pandas and pytables
-        :param storage_lock: Lock necessary to avoid read inconsistencies upon read-write concurrent access
-        :param log_storage: Storage object which will keep the logs
-        :param cache: Cache used to store new log entries and store them in batch when filled
-        :param sensor_cache_size: Maximum cache size, once reached the cache is spilled to the storage
+        Sets a wrapper function around a callback, passing automatically the storage object which batch-stores the
+        log entries in a HDFS5 storage through pandas and pytables
+        :param log_storage: Storage object which will keep the logs (see include/storage.py)
         """
-        self.__storage_lock = storage_lock
-        self.__hdf5_storage = log_storage
-        self.__cache = cache
-        self.__sensor_cache_size = sensor_cache_size
+        self.__log_storage = log_storage
 
     def __call__(self, func):
         def wrapper(*args, **kwargs):
-            return func(log_storage=self.__hdf5_storage,
-                        cache=self.__cache,
-                        sensor_cache_size=self.__sensor_cache_size,
-                        storage_lock=self.__storage_lock,
-                        *args, **kwargs)
+            return func(log_storage=self.__log_storage, *args, **kwargs)
+        return wrapper
+
+
+class SetLogShardFilter(object):
+
+    def __init__(self, is_owned):
+        """
+        *DECORATOR*
+        Sets a wrapper function around a callback, passing automatically the function telling whether a log belongs
+        to the shard of this logger (entries of the other logs are discarded by the callback)
+        :param is_owned: Function taking a log key and returning True if this logger has to store the log
+        """
+        self.__is_owned = is_owned
+
+    def __call__(self, func):
+        def wrapper(*args, **kwargs):
+            return func(is_owned=self.__is_owned, *args, **kwargs)
         return wrapper
 
 
@@ -77,19 +82,17 @@ class SetLogSensorType(object):
 
 class AutoRemoveOldLogsHDF5(object):
     
-    def __init__(self, hdf5_storage, storage_lock, logs_ttl=7):
+    def __init__(self, hdf5_storage, logs_ttl=7):
         """
         *DECORATOR*
         The wrapper function will execute a cleaning of the storage after the execution of the decorated function,
         this will happen only if a specified time delta has passed since the last operation (frequency).
 
-        :param hdf5_storage: Storage object to access the logs
-        :param storage_lock: Lock to synchronize accesses to the storage (in order to avoid faulty reads)
+        :param hdf5_storage: Storage object to access the logs (partitioned by day, see include/storage.py)
         :param logs_ttl: Amount of days before the elimination of a log entry
         """
 
         self.__hdf5_storage = hdf5_storage
-        self.__storage_lock = storage_lock
         self.__logs_ttl = logs_ttl
         self.__cleaning_timedelta = timedelta(days=1)
         self.__last_cleaning_timestamp = datetime.now() - timedelta(days=999)
@@ -99,17 +102,13 @@ class AutoRemoveOldLogsHDF5(object):
             ret = func(*args, **kwargs)  # Execute the decorated function first (and save possible return values)
 
             if self.__last_cleaning_timestamp <= (datetime.now() - self.__cleaning_timedelta):
-                self.__storage_lock.acquire()  # Storage lock acquisition
-
                 # Define a date threshold according to the logs ttl
                 threshold = (datetime.now().date() - timedelta(days=self.__logs_ttl))
 
-                for log_key in self.__hdf5_storage.keys():  # For each sensor log
-                    # Remove all records older than the specified threshold
-                    self.__hdf5_storage.remove(log_key, where=SENSOR_LOGS_TIMESTAMP_COLUMN + f" <= '{threshold}'")
-                    self.__hdf5_storage.flush(fsync=True)  # Flush the changes to disk
-
-                self.__storage_lock.release()  # Storage lock release
+                # Drop the daily partitions older than the specified threshold
+                self.__hdf5_storage.drop_partitions_older_than(threshold)
+                # The rollups have their own retention (see ROLLUP_TIERS_RETENTION_DAYS)
+                self.__hdf5_storage.drop_expired_rollups()
 
                 self.__last_cleaning_timestamp = datetime.now()
 
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN, AGGREGATE_BUCKET_COLUMNS, \
+    AGGREGATE_DEFAULT_BUCKET_SECONDS, AGGREGATE_DEFAULT_POINTS
+
+
+def _sorted_arrays(log_df):
+    # Values (float64) and timestamps (int64 epoch-ns) of a log, sorted by timestamp
+    values = log_df[SENSOR_LOGS_COLUMNS[0]].to_numpy(dtype="float64")
+    timestamps = log_df[SENSOR_LOGS_TIMESTAMP_COLUMN].to_numpy(dtype="datetime64[ns]").view("int64")
+    if np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind="stable")
+        values, timestamps = values[order], timestamps[order]
+    return values, timestamps
+
+
+def aggregate_buckets(log_df, bucket_seconds):
+    """
+    Aggregates the entries of a log in fixed time buckets (aligned to the epoch), computing mean, min, max and last
+    value of each non-empty bucket
+    :param log_df: Dataframe containing the log entries
+    :param bucket_seconds: Length of the buckets in seconds
+    :return: Dataframe with a row for each bucket (the mean is in the values column, the timestamp is the bucket start)
+    """
+    values, timestamps = _sorted_arrays(log_df)
+    if values.shape[0] == 0:
+        return pd.DataFrame([], columns=AGGREGATE_BUCKET_COLUMNS)
+
+    bucket_ns = int(pd.Timedelta(seconds=float(bucket_seconds)).value)
+    if bucket_ns <= 0:
+        raise ValueError("the aggregation buckets must be longer than zero")
+
+    buckets = timestamps // bucket_ns
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])  # First entry of each bucket
+    ends = np.append(starts[1:], values.shape[0])
+
+    return pd.DataFrame({AGGREGATE_BUCKET_COLUMNS[0]: np.add.reduceat(values, starts) / (ends - starts),
+                         AGGREGATE_BUCKET_COLUMNS[1]: np.minimum.reduceat(values, starts),
+                         AGGREGATE_BUCKET_COLUMNS[2]: np.maximum.reduceat(values, starts),
+                         AGGREGATE_BUCKET_COLUMNS[3]: values[ends - 1],
+                         AGGREGATE_BUCKET_COLUMNS[4]: (buckets[starts] * bucket_ns).astype("datetime64[ns]")
+                         }, columns=AGGREGATE_BUCKET_COLUMNS)
+
+
+def lttb(log_df, points):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last entries and, for each of the points - 2
+    buckets in between, the entry forming the largest triangle with the previously kept entry and the average of the
+    next bucket (the shape of the series is preserved far better than by decimation)
+    :param log_df: Dataframe containing the log entries
+    :param points: Amount of entries to keep (at least 3)
+    :return: Dataframe with the kept entries
+    """
+    points = int(points)
+    if points < 3:
+        raise ValueError("LTTB needs at least 3 points")
+
+    values, timestamps = _sorted_arrays(log_df)
+    rows = values.shape[0]
+    if rows <= points:
+        return pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: values,
+                             SENSOR_LOGS_TIMESTAMP_COLUMN: timestamps.astype("datetime64[ns]")
+                             }, columns=SENSOR_LOGS_COLUMNS)
+
+    x = (timestamps - timestamps[0]).astype("float64")
+    edges = np.floor(np.linspace(1, rows - 1, points - 1)).astype("int64")  # Bucket bounds, excluding first and last
+    selected = np.empty(points, dtype="int64")
+    selected[0], selected[-1] = 0, rows - 1
+
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < edges.shape[0] else rows
+        next_x, next_y = x[end:next_end].mean(), values[end:next_end].mean()
+
+        areas = np.abs((x[previous] - next_x) * (values[start:end] - values[previous])
+                       - (x[previous] - x[start:end]) * (next_y - values[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: values[selected],
+                         SENSOR_LOGS_TIMESTAMP_COLUMN: timestamps[selected].astype("datetime64[ns]")
+                         }, columns=SENSOR_LOGS_COLUMNS)
+
+
+def downsample(log_df, aggregate=None):
+    """
+    Applies the aggregation requested by a query to a log
+    :param log_df: Dataframe containing the log entries
+    :param aggregate: None for the raw entries, {"method": "buckets", "bucket_seconds": s} for the bucketed
+                      mean/min/max/last or {"method": "lttb", "points": n} for the LTTB downsampling to n entries
+    :return: Dataframe containing the (possibly aggregated) log entries
+    """
+    if aggregate is None:
+        return log_df
+
+    method = aggregate.get("method")
+    if method == "buckets":
+        return aggregate_buckets(log_df, aggregate.get("bucket_seconds", AGGREGATE_DEFAULT_BUCKET_SECONDS))
+    if method == "lttb":
+        return lttb(log_df, aggregate.get("points", AGGREGATE_DEFAULT_POINTS))
+    raise ValueError(f"unknown aggregation method: {method}")
@@ -0,0 +1,47 @@
+import hashlib
+from bisect import bisect_right
+
+from include.configuration import SHARD_VIRTUAL_NODES
+
+
+class HashRing(object):
+
+    def __init__(self, nodes, virtual_nodes=SHARD_VIRTUAL_NODES):
+        """
+        Consistent hashing ring assigning the feed keys to the logger nodes: every node is placed on the ring in many
+        points (virtual nodes, hashed with md5), and a key belongs to the first nodes found going clockwise from its
+        own hash. Keys spread evenly among the nodes, and adding or removing a node only moves the keys of its arcs.
+        Loggers and twins build the ring from the same node list, so they agree on the owners of every key.
+        :param nodes: Identifiers of the logger nodes
+        :param virtual_nodes: Amount of points of each node on the ring
+        """
+        self.__nodes = sorted(set(nodes))
+        points = sorted((self.__hash(f"{node}#{point}"), node)
+                        for node in self.__nodes for point in range(virtual_nodes))
+        self.__points = [point for point, _ in points]
+        self.__point_nodes = [node for _, node in points]
+
+    @staticmethod
+    def __hash(key):
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def nodes(self):
+        return list(self.__nodes)
+
+    def owners(self, key, replicas=1):
+        """
+        :param key: Key to place on the ring (e.g. "A1_TEMPERATURE")
+        :param replicas: Amount of distinct nodes keeping the key (replication factor)
+        :return: List of the nodes owning the key, the primary one first
+        """
+        owners = list()
+        position = bisect_right(self.__points, self.__hash(key))
+        while len(owners) < min(replicas, len(self.__nodes)):
+            node = self.__point_nodes[position % len(self.__points)]
+            if node not in owners:
+                owners.append(node)
+            position += 1
+        return owners
+
+    def owns(self, node, key, replicas=1):
+        return node in self.owners(key, replicas)
@@ -0,0 +1,169 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_VALUES_COLUMN, SENSOR_LOGS_TIMESTAMP_COLUMN, HOT_TIER_SPAN_MINUTES, \
+    HOT_TIER_CAPACITY_ROWS
+from include.metrics import metrics
+
+
+def _entries_dataframe(values, timestamps):
+    return pd.DataFrame({SENSOR_LOGS_VALUES_COLUMN: values,
+                         SENSOR_LOGS_TIMESTAMP_COLUMN: timestamps.astype("datetime64[ns]")
+                         })
+
+
+class FeedBuffer(object):
+
+    def __init__(self, capacity, covered_since_ns):
+        """
+        Buffer of the most recent entries of a feed, kept in two NumPy arrays (float64 values and int64 epoch-ns
+        timestamps). New entries are appended at the end and old ones are evicted from the beginning, the live
+        section is compacted back to the start of the arrays only when the end is reached.
+        Every appended entry gets the next sequence number of the feed (starting from 1): since entries are only
+        evicted from the beginning, the live ones have consecutive numbers, ending with the last assigned one.
+        :param capacity: Maximum amount of entries kept in the buffer
+        :param covered_since_ns: Every entry of the feed newer than this timestamp is kept in the buffer
+        """
+        self.__values = np.empty(capacity, dtype="float64")
+        self.__timestamps = np.empty(capacity, dtype="int64")
+        self.__start = 0
+        self.__end = 0
+        self.__covered_since = covered_since_ns
+        self.__last_seq = 0  # Sequence number of the newest entry
+        self.__lock = threading.Lock()
+
+    def __evict(self, amount):
+        if amount > 0:
+            self.__covered_since = max(self.__covered_since, int(self.__timestamps[self.__start + amount - 1]))
+            self.__start += amount
+
+    def append(self, value, timestamp_ns, span_ns):
+        with self.__lock:
+            if self.__end == self.__timestamps.shape[0]:
+                if self.__start == 0:  # The buffer is full, the oldest entry has to go
+                    self.__evict(1)
+                live = self.__end - self.__start
+                self.__values[:live] = self.__values[self.__start:self.__end]
+                self.__timestamps[:live] = self.__timestamps[self.__start:self.__end]
+                self.__start, self.__end = 0, live
+
+            self.__values[self.__end] = value
+            self.__timestamps[self.__end] = timestamp_ns
+            self.__end += 1
+            self.__last_seq += 1
+
+            # Time-based eviction of the entries older than the span of the buffer
+            self.__evict(int(np.searchsorted(self.__timestamps[self.__start:self.__end], timestamp_ns - span_ns)))
+
+    def select_since(self, threshold_ns):
+        """
+        :param threshold_ns: Oldest timestamp to retrieve (epoch-ns)
+        :return: Tuple with the values and timestamps (copies) newer than the threshold, the timestamp since which
+                 the buffer is complete (older entries have to be retrieved elsewhere) and the sequence number of the
+                 newest entry
+        """
+        with self.__lock:
+            first = self.__start + int(np.searchsorted(self.__timestamps[self.__start:self.__end], threshold_ns))
+            return (self.__values[first:self.__end].copy(),
+                    self.__timestamps[first:self.__end].copy(),
+                    self.__covered_since,
+                    self.__last_seq
+                    )
+
+    def select_after(self, seq):
+        """
+        :param seq: Sequence number of the newest entry the caller already has
+        :return: Tuple with the values and timestamps (copies) of the entries following it and the sequence number of
+                 the newest entry, or None if some of those entries were already evicted (or seq was never assigned)
+        """
+        with self.__lock:
+            if seq > self.__last_seq or seq < self.__last_seq - (self.__end - self.__start):
+                return None
+            first = self.__end - (self.__last_seq - seq)
+            return self.__values[first:self.__end].copy(), self.__timestamps[first:self.__end].copy(), self.__last_seq
+
+
+class HotTier(object):
+
+    def __init__(self, span_minutes=HOT_TIER_SPAN_MINUTES, capacity=HOT_TIER_CAPACITY_ROWS):
+        """
+        In-memory tier keeping the last minutes of every feed, so that queries on recent windows don't touch the
+        storage. Entries are added as soon as they are ingested (before being committed to the storage), and get
+        their sequence number (see FeedBuffer): the recent entries can be retrieved after a known one, without
+        timestamps. Sequence numbers restart at every start of the logger.
+        :param span_minutes: Time span kept in memory for each feed
+        :param capacity: Maximum amount of entries kept in memory for each feed
+        """
+        self.__span_ns = int(pd.Timedelta(minutes=span_minutes).value)
+        self.__capacity = capacity
+        self.__started_at = pd.Timestamp.now().value  # Entries ingested before this moment are only in the storage
+        self.__buffers = dict()
+        self.__buffers_lock = threading.Lock()
+        self.__stats_lock = threading.Lock()
+        self.__stats = {"hits": 0,       # Queries answered by the hot tier alone
+                        "partial": 0,    # Queries merging the hot tier with older entries from the storage
+                        "misses": 0,     # Queries on feeds the hot tier knows nothing about
+                        "deltas": 0,     # Queries answered after a sequence number
+                        "gaps": 0        # Queries after a sequence number no longer (or never) in the hot tier
+                        }
+
+    @property
+    def started_at(self):
+        # Every entry of a feed ingested since then is in its buffer (feeds without buffer had no new entries)
+        return pd.Timestamp(self.__started_at)
+
+    def append(self, log_key, value, timestamp):
+        buffer = self.__buffers.get(log_key)
+        if buffer is None:
+            with self.__buffers_lock:
+                buffer = self.__buffers.setdefault(log_key, FeedBuffer(self.__capacity, self.__started_at))
+        buffer.append(value, pd.Timestamp(timestamp).value, self.__span_ns)
+
+    def select_since(self, log_key, threshold):
+        """
+        :param log_key: Key of the log
+        :param threshold: Oldest timestamp to retrieve
+        :return: Tuple with a dataframe of the buffered entries matching the threshold, the timestamp since which
+                 the buffer is complete and the sequence number of the newest entry, or None if the feed isn't buffered
+        """
+        buffer = self.__buffers.get(log_key)
+        if buffer is None:
+            self.__count("misses")
+            return None
+
+        threshold_ns = pd.Timestamp(threshold).value
+        values, timestamps, covered_since, last_seq = buffer.select_since(threshold_ns)
+        self.__count("hits" if threshold_ns > covered_since else "partial")
+
+        return _entries_dataframe(values, timestamps), pd.Timestamp(covered_since), last_seq
+
+    def select_after(self, log_key, seq):
+        """
+        :param log_key: Key of the log
+        :param seq: Sequence number of the newest entry the caller already has (0 if it has none)
+        :return: Tuple with a dataframe of the entries following it and the sequence number of the newest entry, or
+                 None if they aren't all in the hot tier any more
+        """
+        buffer = self.__buffers.get(log_key)
+        if buffer is None:  # No new entries since the start
+            selected = (np.empty(0, dtype="float64"), np.empty(0, dtype="int64"), 0) if seq == 0 else None
+        else:
+            selected = buffer.select_after(seq)
+        if selected is None:
+            self.__count("gaps")
+            return None
+
+        self.__count("deltas")
+        return _entries_dataframe(selected[0], selected[1]), selected[2]
+
+    def __count(self, outcome):
+        metrics.inc("hot_tier_" + outcome + "_total")
+        with self.__stats_lock:
+            self.__stats[outcome] += 1
+
+    def get_stats(self):
+        with self.__stats_lock:
+            stats = dict(self.__stats)
+        stats["feeds"] = len(self.__buffers)
+        return stats
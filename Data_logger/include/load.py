@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+from include.configuration import LOAD_LATENCY_WINDOW
+from include.metrics import metrics
+
+
+class LoadTracker(object):
+
+    def __init__(self, window=LOAD_LATENCY_WINDOW):
+        """
+        Tracks the query load of the logger: the queries being answered and the latency of the most recent ones.
+        The twins read it (see DataLogger.get_load) to send their queries to the least loaded replica of a feed.
+        :param window: Amount of recent query latencies kept for the percentile
+        """
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        self.__latencies = deque(maxlen=window)  # Seconds
+
+    @contextmanager
+    def track(self):
+        """
+        Context manager accounting a query for the whole time it is answered (its latency also goes in the
+        query_seconds histogram of the metrics)
+        """
+        with self.__lock:
+            self.__in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency = time.perf_counter() - start
+            metrics.observe("query_seconds", latency)
+            with self.__lock:
+                self.__in_flight -= 1
+                self.__latencies.append(latency)
+
+    def get_load(self):
+        """
+        :return: Dictionary with the queries in flight and the 95th percentile of the recent latencies (ms)
+        """
+        with self.__lock:
+            in_flight = self.__in_flight
+            latencies = list(self.__latencies)
+        return {"in_flight": in_flight,
+                "p95_ms": float(np.percentile(latencies, 95)) * 1000 if len(latencies) > 0 else 0.0
+                }
@@ -0,0 +1,85 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock(object):
+
+    def __init__(self):
+        """
+        Lock allowing either many concurrent readers or a single writer.
+        Waiting writers have priority over new readers, so that a steady flow of queries can't starve the writes.
+        """
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__writer_active = False
+        self.__writers_waiting = 0
+
+    def acquire_read(self):
+        with self.__condition:
+            while self.__writer_active or self.__writers_waiting > 0:
+                self.__condition.wait()
+            self.__readers += 1
+
+    def release_read(self):
+        with self.__condition:
+            self.__readers -= 1
+            if self.__readers == 0:
+                self.__condition.notify_all()
+
+    def acquire_write(self, blocking=True):
+        """
+        :param blocking: If False the method returns immediately when the lock is held by someone else
+        :return: True if the lock was acquired
+        """
+        with self.__condition:
+            if not blocking and (self.__writer_active or self.__readers > 0):
+                return False
+
+            self.__writers_waiting += 1
+            while self.__writer_active or self.__readers > 0:
+                self.__condition.wait()
+            self.__writers_waiting -= 1
+            self.__writer_active = True
+            return True
+
+    def release_write(self):
+        with self.__condition:
+            self.__writer_active = False
+            self.__condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class FeedLocks(object):
+
+    def __init__(self):
+        """
+        Registry of the reader/writer locks guarding each sensor log (one lock for each storage key)
+        """
+        self.__locks = dict()
+        self.__registry_lock = threading.Lock()
+
+    def get(self, log_key):
+        log_key = log_key.strip("/")
+        with self.__registry_lock:
+            return self.__locks.setdefault(log_key, ReadWriteLock())
+
+    def read(self, log_key):
+        return self.get(log_key).read()
+
+    def write(self, log_key):
+        return self.get(log_key).write()
@@ -0,0 +1,31 @@
+from include.configuration import SENSOR_LOGS_TIMESTAMP_COLUMN, COLUMNAR_FORMAT_TAG
+
+
+def encode_log_columnar(log_df):
+    """
+    Encodes a log dataframe in the columnar wire format, where each column travels as a single raw little-endian
+    buffer (int64 epoch-nanoseconds for the timestamp column, float64 for all the other columns)
+    :param log_df: Dataframe containing the log entries
+    :return: Dictionary representing the encoded log, ready to be sent through Pyro
+    """
+    columns = list()
+    for column in log_df.columns:
+        if column == SENSOR_LOGS_TIMESTAMP_COLUMN:
+            buffer = log_df[column].to_numpy(dtype="datetime64[ns]").view("int64").astype("<i8")
+        else:
+            buffer = log_df[column].astype("float64").to_numpy().astype("<f8")
+        columns.append([column, buffer.tobytes()])
+
+    return {"format": COLUMNAR_FORMAT_TAG, "rows": int(log_df.shape[0]), "columns": columns}
+
+
+def format_log(log_df, columnar=False):
+    """
+    Turns a log dataframe in the representation requested by the client
+    :param log_df: Dataframe containing the log entries
+    :param columnar: If True the log is encoded in the columnar format, otherwise it is turned in a list of rows
+    :return: The log in the requested representation
+    """
+    if columnar:
+        return encode_log_columnar(log_df)
+    return log_df.values.tolist()
@@ -0,0 +1,71 @@
+import os
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_VALUES_COLUMN, SENSOR_LOGS_TIMESTAMP_COLUMN, \
+    MIGRATION_CHUNK_ROWS, MIGRATION_TEMPORARY_SUFFIX
+
+
+def migrate_storage(storage_path, partition_format, chunk_rows=MIGRATION_CHUNK_ROWS):
+    """
+    Rewrites a single-file sensor logs storage in the layout used by the logger: the values column is turned in a
+    float64 one (it used to keep 15 characters strings) and the entries are split in daily partition files, created
+    in the same directory of the original storage. The original storage is then renamed with a ".bak" suffix.
+    Values that can't be parsed as numbers are dropped.
+    The partitions are written with a ".migrating" suffix and only renamed once every row is migrated, so a failed
+    migration can just be run again. It is refused if any of the partitions already exists (e.g. created by the
+    logger), since appending the migrated rows to it could duplicate them.
+    :param storage_path: Path of the HDF5 storage to migrate
+    :param partition_format: Name of the partition files, as a strftime format
+    :param chunk_rows: Amount of rows read and converted at once
+    :return: Dictionary with the amount of migrated and dropped rows for each log
+    """
+    storage_dir = os.path.dirname(os.path.abspath(storage_path))
+    partitions = dict()
+    report = dict()
+
+    try:
+        with pd.HDFStore(storage_path, mode="r") as old_storage:
+            for log_key in old_storage.keys():
+                migrated_rows = 0
+                dropped_rows = 0
+
+                for chunk in old_storage.select(log_key, chunksize=chunk_rows):
+                    # Always float64: chunks of integer strings would be parsed as int64 ones otherwise
+                    chunk[SENSOR_LOGS_VALUES_COLUMN] = pd.to_numeric(chunk[SENSOR_LOGS_VALUES_COLUMN],
+                                                                     errors="coerce").astype("float64")
+                    valid_rows = chunk[SENSOR_LOGS_VALUES_COLUMN].notna()
+                    dropped_rows += int((~valid_rows).sum())
+                    migrated_rows += int(valid_rows.sum())
+
+                    chunk = chunk.loc[valid_rows, SENSOR_LOGS_COLUMNS]
+                    for partition_date, partition_entries in chunk.groupby(chunk[SENSOR_LOGS_TIMESTAMP_COLUMN].dt.date):
+                        if partition_date not in partitions:
+                            partition_path = os.path.join(storage_dir, partition_date.strftime(partition_format))
+                            if os.path.exists(partition_path):
+                                raise FileExistsError(f"Partition {partition_path} already exists, move it away "
+                                                      f"before migrating {storage_path}")
+                            # Leftovers of a failed migration are overwritten
+                            partitions[partition_date] = pd.HDFStore(partition_path + MIGRATION_TEMPORARY_SUFFIX,
+                                                                     mode="w")
+                        partitions[partition_date].append(log_key,
+                                                          partition_entries,
+                                                          format='t',
+                                                          append=True,
+                                                          encoding='utf-8',
+                                                          data_columns=True
+                                                          )
+
+                report[log_key] = {"migrated": migrated_rows, "dropped": dropped_rows}
+    except BaseException:
+        for partition in partitions.values():
+            partition.close()
+            os.remove(partition.filename)
+        raise
+
+    for partition in partitions.values():
+        partition.close()
+        os.replace(partition.filename, partition.filename[:-len(MIGRATION_TEMPORARY_SUFFIX)])
+
+    os.replace(storage_path, storage_path + ".bak")
+
+    return report
@@ -0,0 +1,296 @@
+import logging
+import os
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN, AGGREGATE_BUCKET_COLUMNS, \
+    ROLLUP_COLUMNS, ROLLUP_STORAGE_FORMAT, ROLLUP_PARTITION_FORMAT, ROLLUP_TIERS_RETENTION_DAYS, \
+    ROLLUP_TIERS_PERIOD_DAYS
+from include.locks import ReadWriteLock
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _entries_to_rows(entries_df):
+    # Raw entries as rollup rows (each one is a bucket containing a single value)
+    values = entries_df[SENSOR_LOGS_COLUMNS[0]].to_numpy(dtype="float64")
+    return pd.DataFrame({ROLLUP_COLUMNS[0]: entries_df[SENSOR_LOGS_TIMESTAMP_COLUMN].to_numpy(dtype="datetime64[ns]"),
+                         ROLLUP_COLUMNS[1]: np.ones(values.shape[0], dtype="int64"),
+                         ROLLUP_COLUMNS[2]: values,
+                         ROLLUP_COLUMNS[3]: values,
+                         ROLLUP_COLUMNS[4]: values,
+                         ROLLUP_COLUMNS[5]: values
+                         }, columns=ROLLUP_COLUMNS)
+
+
+def _reduce_rows(rows, bucket_ns):
+    """
+    Merges the rollup rows falling in the same bucket (coarser buckets, or rows of a bucket written more than once)
+    :param rows: Dataframe of rollup rows, the ones of the same bucket in arrival order
+    :param bucket_ns: Length of the buckets in nanoseconds
+    :return: Dataframe with a rollup row for each non-empty bucket, sorted by timestamp
+    """
+    if rows.shape[0] == 0:
+        return pd.DataFrame([], columns=ROLLUP_COLUMNS)
+
+    timestamps = rows[ROLLUP_COLUMNS[0]].to_numpy(dtype="datetime64[ns]").view("int64")
+    order = np.argsort(timestamps, kind="stable")  # Stable, so that "last" is taken from the newest row
+    buckets = timestamps[order] // bucket_ns
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+    ends = np.append(starts[1:], buckets.shape[0])
+    counts, sums, minimums, maximums, lasts = [rows[column].to_numpy(dtype="int64" if column == ROLLUP_COLUMNS[1]
+                                                                      else "float64")[order]
+                                               for column in ROLLUP_COLUMNS[1:]]
+
+    return pd.DataFrame({ROLLUP_COLUMNS[0]: (buckets[starts] * bucket_ns).astype("datetime64[ns]"),
+                         ROLLUP_COLUMNS[1]: np.add.reduceat(counts, starts),
+                         ROLLUP_COLUMNS[2]: np.add.reduceat(sums, starts),
+                         ROLLUP_COLUMNS[3]: np.minimum.reduceat(minimums, starts),
+                         ROLLUP_COLUMNS[4]: np.maximum.reduceat(maximums, starts),
+                         ROLLUP_COLUMNS[5]: lasts[ends - 1]
+                         }, columns=ROLLUP_COLUMNS)
+
+
+class RollupTiers(object):
+
+    def __init__(self, storage_dir, io_lock, retention_days=ROLLUP_TIERS_RETENTION_DAYS,
+                 period_days=ROLLUP_TIERS_PERIOD_DAYS, partition_format=ROLLUP_PARTITION_FORMAT,
+                 legacy_storage_format=ROLLUP_STORAGE_FORMAT):
+        """
+        Rollups of the logs at several resolutions (tiers), kept up to date as the entries are committed: each tier
+        is partitioned in periods of some days, each one with its own HDF5 file with a table for each log, containing
+        count/sum/min/max/last of every time bucket. The retention just deletes the period files entirely expired
+        (like the raw partitions, see include/storage.py), so it never holds the I/O lock for long.
+        The newest bucket of each log is kept in memory (open) until an entry of a following bucket arrives, so the
+        tables get a single row for each bucket (except for late entries, whose rows are merged at query time). The
+        open buckets lost by a crash are rebuilt from the raw entries (see open_bucket_starts and restore_open_buckets).
+        :param storage_dir: Directory keeping the rollup files
+        :param io_lock: Lock serializing the pytables calls (shared with the log storage)
+        :param retention_days: Dictionary of the days of retention of each tier, by bucket length in seconds
+        :param period_days: Dictionary of the days covered by each period file of each tier, by bucket length
+        :param partition_format: Name of the period files, formatted with the bucket length in seconds then as a
+                                 strftime format with the first day of the period
+        :param legacy_storage_format: Name of the single-file tiers used before the periods, formatted with the bucket
+                                      length in seconds (their rows are moved to the period files)
+        """
+        self.__storage_dir = storage_dir
+        self.__io_lock = io_lock
+        self.__retention_days = dict(retention_days)
+        self.__period_days = {seconds: period_days.get(seconds, 1) for seconds in self.__retention_days.keys()}
+        self.__partition_format = partition_format
+        self.__tiers = sorted(self.__retention_days.keys(), reverse=True)  # Coarsest tier first
+        self.__partitions_lock = ReadWriteLock()  # Held exclusively only while dropping period files
+        self.__partitions = {seconds: dict() for seconds in self.__tiers}  # Opened period files, by first day
+        self.__missing_tiers = list()  # Tiers without any file yet (to be built from the raw logs)
+        # Period files written since the last flush and since the last fsync, as (tier, first day) pairs
+        self.__dirty_partitions = set()
+        self.__unsynced_partitions = set()
+        self.__open_buckets = {seconds: dict() for seconds in self.__tiers}
+
+        for seconds in self.__tiers:
+            tier_format = self.__partition_format.format(seconds=seconds)
+            for file_name in sorted(os.listdir(self.__storage_dir)):
+                try:
+                    period_start = datetime.strptime(file_name, tier_format).date()
+                except ValueError:  # Not a period file of this tier
+                    continue
+                self.__open_partition(seconds, period_start)
+
+            legacy_path = os.path.join(self.__storage_dir, legacy_storage_format.format(seconds=seconds))
+            if os.path.isfile(legacy_path):
+                self.__migrate_legacy_tier(seconds, legacy_path)
+            elif len(self.__partitions[seconds]) == 0:
+                self.__missing_tiers.append(seconds)
+
+    def __period_start(self, seconds, day):
+        # First day of the period of a tier containing a day (periods are aligned on the ordinal of the days)
+        return date.fromordinal(day.toordinal() // self.__period_days[seconds] * self.__period_days[seconds])
+
+    def __partition_path(self, seconds, period_start):
+        return os.path.join(self.__storage_dir,
+                            period_start.strftime(self.__partition_format.format(seconds=seconds)))
+
+    def __open_partition(self, seconds, period_start):
+        # Must be called holding the I/O lock (or before the rollups are shared). New files are written by the next
+        # flush, so that a crash can't leave them unreadable
+        partition = self.__partitions[seconds].get(period_start)
+        if partition is None:
+            partition = pd.HDFStore(self.__partition_path(seconds, period_start))
+            self.__partitions[seconds][period_start] = partition
+            self.__dirty_partitions.add((seconds, period_start))
+            self.__unsynced_partitions.add((seconds, period_start))
+        return partition
+
+    def __migrate_legacy_tier(self, seconds, legacy_path):
+        # Moves the rows of a single-file tier to the period files (before the rollups are shared)
+        with pd.HDFStore(legacy_path, mode="r") as legacy_store:
+            for log_key in legacy_store.keys():
+                self.__append(seconds, log_key.strip("/"), legacy_store.select(log_key))
+        self.flush()
+        os.remove(legacy_path)
+        logger.info("Moved the rollup tier %s to period files", os.path.basename(legacy_path))
+
+    def missing_tiers(self):
+        return list(self.__missing_tiers)
+
+    def tier_for(self, bucket_seconds):
+        """
+        :param bucket_seconds: Requested resolution in seconds
+        :return: Coarsest tier whose buckets exactly divide the requested ones, None if there isn't any
+        """
+        for seconds in self.__tiers:
+            if seconds <= bucket_seconds and bucket_seconds % seconds == 0:
+                return seconds
+        return None
+
+    def add(self, log_key, entries_df, tiers=None):
+        """
+        Adds new log entries to the rollups (the storage calls it holding the log write lock)
+        :param log_key: Key of the log
+        :param entries_df: Dataframe of the new entries
+        :param tiers: Tiers to update (all of them if None)
+        """
+        if entries_df.shape[0] == 0:
+            return
+
+        entries_rows = _entries_to_rows(entries_df)
+        for seconds in (tiers if tiers is not None else self.__tiers):
+            rows = _reduce_rows(pd.concat([self.__open_buckets[seconds].get(log_key), entries_rows],
+                                          ignore_index=True),
+                                int(pd.Timedelta(seconds=seconds).value))
+            self.__open_buckets[seconds][log_key] = rows.iloc[-1:].reset_index(drop=True)
+            if rows.shape[0] > 1:  # Every bucket but the newest one is closed
+                self.__append(seconds, log_key, rows.iloc[:-1])
+
+    def __append(self, seconds, log_key, rows):
+        period_starts = rows[ROLLUP_COLUMNS[0]].dt.date.map(lambda day: self.__period_start(seconds, day))
+        with self.__partitions_lock.read():
+            for period_start, period_rows in rows.groupby(period_starts):
+                with self.__io_lock:
+                    self.__open_partition(seconds, period_start).append(log_key, period_rows, format='t',
+                                                                        append=True, data_columns=True)
+                    self.__dirty_partitions.add((seconds, period_start))
+                    self.__unsynced_partitions.add((seconds, period_start))
+
+    def flush(self, fsync=True):
+        """
+        :param fsync: If False the written period files are only flushed to the OS
+        """
+        with self.__partitions_lock.read(), self.__io_lock:
+            for seconds, period_start in (self.__unsynced_partitions if fsync else self.__dirty_partitions):
+                self.__partitions[seconds][period_start].flush(fsync=fsync)
+            if fsync:
+                self.__unsynced_partitions = set()
+            self.__dirty_partitions = set()
+
+    def open_bucket_starts(self, log_key):
+        """
+        :param log_key: Key of the log
+        :return: Dictionary of the start of the open bucket of a log (the one following its newest stored bucket,
+                 or None if it has no stored bucket) for each tier, except the missing ones
+        """
+        starts = dict()
+        with self.__partitions_lock.read():
+            for seconds in self.__tiers:
+                if seconds in self.__missing_tiers:
+                    continue
+                starts[seconds] = None
+                for period_start in sorted(self.__partitions[seconds].keys(), reverse=True):
+                    with self.__io_lock:
+                        partition = self.__partitions[seconds][period_start]
+                        if "/" + log_key not in partition.keys():
+                            continue
+                        rows = partition.get_storer(log_key).nrows
+                        if rows == 0:
+                            continue
+                        newest_bucket = partition.select(log_key, start=rows - 1, stop=rows)[ROLLUP_COLUMNS[0]].iloc[0]
+                    starts[seconds] = newest_bucket + pd.Timedelta(seconds=seconds)
+                    break
+        return starts
+
+    def restore_open_buckets(self, log_key, entries_df, starts):
+        """
+        Rebuilds the open buckets of a log, lost by a crash, from its raw entries (before the rollups are shared)
+        :param log_key: Key of the log
+        :param entries_df: Dataframe of the stored entries of the log, at least from the oldest of the starts on
+        :param starts: Dictionary of the start of the open bucket of each tier (see open_bucket_starts)
+        """
+        for seconds, start in starts.items():
+            tier_entries_df = (entries_df if start is None
+                               else entries_df[entries_df[SENSOR_LOGS_TIMESTAMP_COLUMN] >= start])
+            self.add(log_key, tier_entries_df, tiers=[seconds])
+
+    def select(self, log_key, threshold, bucket_seconds, pending_df, recent_df=None, recent_since=None):
+        """
+        Aggregates a log from the best fitting tier (the storage calls it holding the log read lock)
+        :param log_key: Key of the log
+        :param threshold: Oldest timestamp to retrieve (the first bucket is the one containing it)
+        :param bucket_seconds: Requested resolution in seconds (see tier_for)
+        :param pending_df: Dataframe of the entries not yet committed (not yet in the rollups)
+        :param recent_df: Dataframe of every entry of the log newer than recent_since, including the ones still
+                          queued (see include/hot_tier.py): the buckets starting after recent_since are aggregated from
+                          them only, instead of the rollups and the pending entries (None if there are none)
+        :param recent_since: Timestamp since which recent_df has every entry of the log
+        :return: Dataframe with a row for each bucket (same columns as include/downsampling.py aggregate_buckets)
+        """
+        seconds = self.tier_for(bucket_seconds)
+        tier_ns = int(pd.Timedelta(seconds=seconds).value)
+        bucket_ns = int(pd.Timedelta(seconds=bucket_seconds).value)
+        since = pd.Timestamp((pd.Timestamp(threshold).value // bucket_ns) * bucket_ns)
+        until = pd.Timestamp.max if recent_df is None else pd.Timestamp(
+            (pd.Timestamp(recent_since).value // bucket_ns + 1) * bucket_ns)  # First bucket entirely after it
+
+        stored_rows = list()
+        with self.__partitions_lock.read():
+            for period_start, partition in sorted(self.__partitions[seconds].items(), key=lambda item: item[0]):
+                if period_start + timedelta(days=self.__period_days[seconds]) <= since.date():
+                    continue
+                with self.__io_lock:
+                    if "/" + log_key in partition.keys():
+                        stored_rows.append(partition.select(log_key, where=ROLLUP_COLUMNS[0] + f" >= '{since}'"))
+
+        rows = _reduce_rows(pd.concat(stored_rows + [self.__open_buckets[seconds].get(log_key),
+                                                     _reduce_rows(_entries_to_rows(pending_df), tier_ns)],
+                                      ignore_index=True), bucket_ns)
+        rows = rows[(rows[ROLLUP_COLUMNS[0]] >= since) & (rows[ROLLUP_COLUMNS[0]] < until)]
+        if recent_df is not None:
+            recent_df = recent_df[recent_df[SENSOR_LOGS_TIMESTAMP_COLUMN] >= max(since, until)]
+            rows = pd.concat([rows, _reduce_rows(_entries_to_rows(recent_df), bucket_ns)], ignore_index=True)
+
+        means = (rows[ROLLUP_COLUMNS[2]] / rows[ROLLUP_COLUMNS[1]]).to_numpy(dtype="float64")
+        return pd.DataFrame({AGGREGATE_BUCKET_COLUMNS[0]: means,
+                             AGGREGATE_BUCKET_COLUMNS[1]: rows[ROLLUP_COLUMNS[3]].to_numpy(),
+                             AGGREGATE_BUCKET_COLUMNS[2]: rows[ROLLUP_COLUMNS[4]].to_numpy(),
+                             AGGREGATE_BUCKET_COLUMNS[3]: rows[ROLLUP_COLUMNS[5]].to_numpy(),
+                             AGGREGATE_BUCKET_COLUMNS[4]: rows[ROLLUP_COLUMNS[0]].to_numpy()
+                             }, columns=AGGREGATE_BUCKET_COLUMNS)
+
+    def drop_expired(self):
+        """
+        Deletes the period files whose rows are all older than the retention of their tier (the rows of the period
+        containing the retention threshold are kept until the whole period expires)
+        """
+        with self.__partitions_lock.write():
+            with self.__io_lock:
+                for seconds in self.__tiers:
+                    threshold = (datetime.now() - timedelta(days=self.__retention_days[seconds])).date()
+                    for period_start in [period_start for period_start in self.__partitions[seconds].keys()
+                                         if period_start + timedelta(days=self.__period_days[seconds]) <= threshold]:
+                        self.__partitions[seconds].pop(period_start).close()
+                        self.__dirty_partitions.discard((seconds, period_start))
+                        self.__unsynced_partitions.discard((seconds, period_start))
+                        os.remove(self.__partition_path(seconds, period_start))
+                        metrics.inc("dropped_rollup_partitions_total")
+                        logger.info("Dropped rollup period %s of the %d s tier", period_start, seconds)
+
+    def close(self):
+        for seconds in self.__tiers:  # The open buckets are stored (entries of the same buckets may come later)
+            for log_key, open_bucket in self.__open_buckets[seconds].items():
+                self.__append(seconds, log_key, open_bucket)
+        self.__open_buckets = {seconds: dict() for seconds in self.__tiers}
+        with self.__io_lock:
+            for tier_partitions in self.__partitions.values():
+                for partition in tier_partitions.values():
+                    partition.close()
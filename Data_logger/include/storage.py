@@ -0,0 +1,398 @@
+import logging
+import os
+import threading
+from contextlib import ExitStack
+from datetime import datetime
+from uuid import uuid4
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN, STORAGE_READ_CHUNK_ROWS, WAL_FILE
+from include.hot_tier import HotTier
+from include.locks import FeedLocks, ReadWriteLock
+from include.metrics import metrics
+from include.rollups import RollupTiers
+from include.wal import WriteAheadLog
+from include.writer import HDF5BatchWriter
+
+logger = logging.getLogger(__name__)
+
+
+class SensorLogStorage(object):
+
+    def __init__(self, storage_dir, partition_format):
+        """
+        HDF5 storage of the sensor logs, shared by the MQTT ingestion (through the writer thread), the retention sweep
+        and the remote queries.
+        The logs are partitioned by day: each day has its own HDF5 file (named after partition_format) containing a
+        table for each log. Queries only open the partitions overlapping the requested window, and the retention
+        sweep just deletes whole partition files.
+        Every log (storage key) is guarded by its own reader/writer lock: queries on different feeds run in parallel,
+        and queries on the same feed don't block each other. The pytables handles themselves aren't thread-safe, so
+        the actual storage calls are serialized by a short-lived I/O lock, which readers take one chunk at a time.
+        Recent entries are also kept in an in-memory hot tier (see include/hot_tier.py): queries on recent windows are
+        answered without touching the storage, older windows are merged from the two sources.
+        Committed entries also update the rollup tiers (see include/rollups.py), which answer the bucketed
+        aggregations without reading the raw entries.
+        The entries not yet durably stored are kept in a write-ahead log (see include/wal.py), replayed into the
+        storage when it is opened again after a crash.
+        :param storage_dir: Directory keeping the partition files
+        :param partition_format: Name of the partition files, as a strftime format (e.g. "sensor_logs_%Y-%m-%d.h5")
+        """
+        self.__storage_dir = storage_dir
+        self.__partition_format = partition_format
+
+        self.__io_lock = threading.Lock()
+        self.__feed_locks = FeedLocks()
+        self.__partitions_lock = ReadWriteLock()  # Held exclusively only while dropping partitions
+        self.__partitions = dict()                # Opened partitions, by date
+        self.__dirty_partitions = set()           # Partitions written since the last flush
+        self.__unsynced_partitions = set()        # Partitions written since the last fsync
+        self.__known_keys = set()
+        self.__hot_tier = HotTier()
+        self.__epoch = uuid4().hex                # Sequence numbers of the hot tier are only valid in this epoch
+        self.__sweeping = False                   # True while the retention sweep runs (reported in the load)
+
+        for file_name in sorted(os.listdir(self.__storage_dir)):
+            try:
+                partition_date = datetime.strptime(file_name, self.__partition_format).date()
+            except ValueError:  # Not a partition file
+                continue
+            partition = self.__open_partition(partition_date)
+            self.__known_keys.update(log_key.strip("/") for log_key in partition.keys())
+
+        self.__rollups = RollupTiers(self.__storage_dir, self.__io_lock)
+        missing_tiers = self.__rollups.missing_tiers()
+        if len(missing_tiers) > 0:  # New rollup tiers are built from the logs already stored
+            for partition_date in sorted(self.__partitions.keys()):
+                for log_key in self.__partitions[partition_date].keys():
+                    self.__rollups.add(log_key.strip("/"), self.__partitions[partition_date].select(log_key),
+                                       tiers=missing_tiers)
+            self.__rollups.flush()
+        for log_key in self.__known_keys:  # The open buckets of the other tiers were lost if the logger crashed
+            open_bucket_starts = self.__rollups.open_bucket_starts(log_key)
+            if len(open_bucket_starts) == 0:
+                continue
+            starts = list(open_bucket_starts.values())
+            since = pd.Timestamp.min if any(start is None for start in starts) else min(starts)
+            self.__rollups.restore_open_buckets(log_key, self.__select_stored({log_key: (since, None)})[log_key],
+                                                open_bucket_starts)
+
+        self.__wal = WriteAheadLog(os.path.join(self.__storage_dir, WAL_FILE))
+        self.__replay_wal()
+
+        # Thread batch-storing the new log entries (it keeps them pending until they are committed to the storage)
+        self.__writer = HDF5BatchWriter(self, self.__feed_locks, self.__wal)
+        self.__writer.start()
+
+    def __partition_path(self, partition_date):
+        return os.path.join(self.__storage_dir, partition_date.strftime(self.__partition_format))
+
+    def __open_partition(self, partition_date):
+        # Must be called holding the I/O lock (or before the storage is shared)
+        partition = self.__partitions.get(partition_date)
+        if partition is None:
+            partition = pd.HDFStore(self.__partition_path(partition_date))  # Creating a HDFS5 storage
+            self.__partitions[partition_date] = partition
+        return partition
+
+    def row_counts(self):
+        """
+        :return: Dictionary of the amount of stored rows of each partition date, by log key (see include/wal.py)
+        """
+        row_counts = dict()
+        with self.__partitions_lock.read():
+            with self.__io_lock:
+                for partition_date, partition in self.__partitions.items():
+                    for log_key in partition.keys():
+                        row_counts.setdefault(log_key.strip("/"), dict())[partition_date] = \
+                            int(partition.get_storer(log_key).nrows)
+        return row_counts
+
+    def __replay_wal(self):
+        # Stores the entries of the write-ahead log left by a crash (before the storage is shared). The entries of a
+        # log are committed in the order of the write-ahead log, so the rows stored since its checkpoint (committed
+        # but maybe not synced before the crash) are its first entries: they are skipped
+        checkpoint_row_counts, wal_entries = self.__wal.read()
+        row_counts = self.row_counts()
+        replayed_rows = 0
+        for log_key, entries in wal_entries.items():
+            checkpoint_rows = checkpoint_row_counts.get(log_key, dict())
+            stored_rows = sum(max(0, rows - checkpoint_rows.get(partition_date, 0))  # Dropped partitions are old
+                              for partition_date, rows in row_counts.get(log_key, dict()).items())
+            if len(entries) > stored_rows:
+                self.append_entries(log_key, entries[stored_rows:])
+                replayed_rows += len(entries) - stored_rows
+
+        self.flush(fsync=True)
+        self.__wal.checkpoint(dict(), self.row_counts())
+        metrics.inc("wal_replayed_rows_total", replayed_rows)
+        if replayed_rows > 0:
+            logger.warning("Replayed %d entries from the write-ahead log", replayed_rows)
+
+    def put(self, log_key, entry):
+        queued = self.__writer.put(log_key, entry)
+        if queued:  # Only entries that will reach the storage are made visible in the hot tier
+            self.__hot_tier.append(log_key.strip("/"), *entry)
+        return queued
+
+    def keys(self):
+        with self.__io_lock:
+            stored_keys = list(self.__known_keys)
+        return list(set(stored_keys + self.__writer.pending_keys()))
+
+    def append_entries(self, log_key, entries):
+        """
+        Appends log entries to the partitions matching their timestamps (the writer thread calls it holding the log
+        write lock)
+        :param log_key: Key of the log
+        :param entries: List of tuples containing the sensor value and its timestamp
+        """
+        entries_df = pd.DataFrame(entries, columns=SENSOR_LOGS_COLUMNS)
+        entries_dates = entries_df[SENSOR_LOGS_TIMESTAMP_COLUMN].dt.date
+
+        with self.__partitions_lock.read(), metrics.timer("hdf5_append_seconds"):
+            for partition_date, partition_entries in entries_df.groupby(entries_dates):
+                with self.__io_lock:
+                    self.__open_partition(partition_date).append(log_key,
+                                                                 partition_entries,
+                                                                 format='t',
+                                                                 append=True,
+                                                                 encoding='utf-8',
+                                                                 data_columns=True
+                                                                 )
+                    self.__known_keys.add(log_key.strip("/"))
+                    self.__dirty_partitions.add(partition_date)
+                    self.__unsynced_partitions.add(partition_date)
+
+        try:
+            self.__rollups.add(log_key.strip("/"), entries_df)
+        except Exception as error:  # The entries are stored: a retry of the commit would store them twice
+            metrics.inc("rollup_errors_total")
+            logger.error("Failed to update the rollups of %s: %s", log_key, error)
+
+    def flush(self, fsync=True):
+        """
+        Flushes the partitions (and the rollup tiers) written since the last flush
+        :param fsync: If False they are only flushed to the OS, the fsync of every partition written since the last
+                      one is left to the next call with fsync=True (see include/writer.py)
+        """
+        with self.__partitions_lock.read(), metrics.timer("hdf5_fsync_seconds" if fsync else "hdf5_flush_seconds"):
+            with self.__io_lock:
+                for partition_date in (self.__unsynced_partitions if fsync else self.__dirty_partitions):
+                    self.__partitions[partition_date].flush(fsync=fsync)
+                if fsync:
+                    self.__unsynced_partitions = set()
+                self.__dirty_partitions = set()
+        self.__rollups.flush(fsync=fsync)
+
+    def __select_partition(self, partition, log_key, where):
+        with self.__io_lock:
+            if "/" + log_key not in partition.keys():
+                return None
+            if where is None:
+                coordinates = range(partition.get_storer(log_key).nrows)
+            else:
+                coordinates = partition.select_as_coordinates(log_key, where)
+
+        # The rows are read in chunks, releasing the I/O lock in between (the coordinates stay valid since rows are
+        # only appended while the feed read lock is held)
+        chunks = list()
+        for chunk_start in range(0, len(coordinates), STORAGE_READ_CHUNK_ROWS):
+            chunk_coordinates = coordinates[chunk_start:chunk_start + STORAGE_READ_CHUNK_ROWS]
+            with self.__io_lock:
+                if where is None:
+                    chunks.append(partition.select(log_key, start=chunk_coordinates[0], stop=chunk_coordinates[-1] + 1))
+                else:
+                    chunks.append(partition.select(log_key, where=chunk_coordinates))
+        return chunks
+
+    def __select_stored(self, windows):
+        # windows: dictionary log_key: (threshold, until), until being None for windows reaching the last entry.
+        # Every partition overlapping at least one window is visited once, reading all the logs it is needed for
+        chunks = {log_key: list() for log_key in windows.keys()}
+        with self.__partitions_lock.read():
+            with self.__io_lock:
+                partitions = sorted(self.__partitions.items(), key=lambda item: item[0])
+
+            for partition_date, partition in partitions:
+                for log_key, (threshold, until) in windows.items():
+                    if partition_date < threshold.date() or (until is not None and partition_date > until.date()):
+                        continue
+
+                    # Only the partitions containing the window bounds need to be filtered, the others are read
+                    # entirely
+                    conditions = list()
+                    if partition_date == threshold.date():
+                        conditions.append(SENSOR_LOGS_TIMESTAMP_COLUMN + f" >= '{threshold}'")
+                    if until is not None and partition_date == until.date():
+                        conditions.append(SENSOR_LOGS_TIMESTAMP_COLUMN + f" <= '{until}'")
+                    where = " & ".join(conditions) if len(conditions) > 0 else None
+
+                    chunks[log_key] += self.__select_partition(partition, log_key, where) or list()
+
+        return {log_key: (pd.concat(log_chunks, ignore_index=True) if len(log_chunks) > 0
+                          else pd.DataFrame([], columns=SENSOR_LOGS_COLUMNS))
+                for log_key, log_chunks in chunks.items()}
+
+    def select_since(self, log_key, threshold):
+        """
+        Retrieves the entries of a log (stored, still pending or in the hot tier) not older than a threshold
+        :param log_key: Key of the log
+        :param threshold: Oldest timestamp to retrieve
+        :return: Dataframe containing the matching log entries
+        """
+        log_key = log_key.strip("/")
+        return self.select_since_many({log_key: threshold})[log_key]
+
+    def select_since_many(self, thresholds):
+        """
+        Retrieves the entries of many logs (stored, still pending or in the hot tier), each one not older than its own
+        threshold, with a single pass over the partitions
+        :param thresholds: Dictionary of the oldest timestamp to retrieve for each log key
+        :return: Dictionary of the dataframes containing the matching entries of each log
+        """
+        return self.select_since_many_with_seq(thresholds)[0]
+
+    def select_since_many_with_seq(self, thresholds):
+        """
+        Same as select_since_many, also returning the sequence number of the newest entry of each log (see
+        include/hot_tier.py): the retrieved entries are exactly the ones of the window up to it, so the following
+        ones can be retrieved with select_after_seq
+        :param thresholds: Dictionary of the oldest timestamp to retrieve for each log key
+        :return: Tuple with the dictionary of the dataframes containing the matching entries of each log and the
+                 dictionary of their sequence numbers
+        """
+        results = dict()
+        seqs = dict()
+        hot_tier_entries = dict()
+        windows = dict()
+        for log_key, threshold in thresholds.items():
+            log_key = log_key.strip("/")
+            threshold = pd.Timestamp(threshold)
+
+            # The hot tier is read first: every entry newer than covered_since is in hot_vals_df, so the other sources
+            # only have to provide the older ones (a feed without buffer had no entries since the hot tier started)
+            hot_entries = self.__hot_tier.select_since(log_key, threshold)
+            if hot_entries is None:
+                hot_entries = (pd.DataFrame([], columns=SENSOR_LOGS_COLUMNS), self.__hot_tier.started_at, 0)
+            seqs[log_key] = hot_entries[2]
+            if threshold > hot_entries[1]:  # The whole window is in memory
+                results[log_key] = hot_entries[0]
+                continue
+            hot_tier_entries[log_key] = hot_entries
+            windows[log_key] = (threshold, hot_entries[1])
+
+        if len(windows) == 0:
+            return results, seqs
+
+        with ExitStack() as feed_read_locks:
+            for log_key in sorted(windows.keys()):  # Always acquired in the same order
+                feed_read_locks.enter_context(self.__feed_locks.read(log_key))
+
+            with metrics.timer("hdf5_select_seconds"):
+                stored = self.__select_stored(windows)
+            pending = {log_key: pd.DataFrame(self.__writer.pending_entries(log_key), columns=SENSOR_LOGS_COLUMNS)
+                       for log_key in windows.keys()}
+
+        for log_key, (threshold, covered_since) in windows.items():
+            pending_vals_df = pending[log_key]
+            mask = ((pending_vals_df[SENSOR_LOGS_TIMESTAMP_COLUMN] >= threshold)
+                    & (pending_vals_df[SENSOR_LOGS_TIMESTAMP_COLUMN] <= covered_since))
+
+            results[log_key] = pd.concat([stored[log_key], pending_vals_df[mask], hot_tier_entries[log_key][0]],
+                                         ignore_index=True)
+
+        return results, seqs
+
+    @property
+    def epoch(self):
+        # Identifier of this opening of the storage: the sequence numbers restart with the hot tier
+        return self.__epoch
+
+    def select_after_seq(self, log_key, seq_mark):
+        """
+        Retrieves the entries of a log following a sequence number, from the hot tier
+        :param log_key: Key of the log
+        :param seq_mark: (epoch, seq) pair of the newest entry the caller already has
+        :return: Tuple with the dataframe of the following entries and the sequence number of the newest one, or None
+                 if the sequence number is of another epoch or the entries aren't all in the hot tier any more (they
+                 have to be retrieved by time)
+        """
+        if seq_mark[0] != self.__epoch:
+            return None
+        return self.__hot_tier.select_after(log_key.strip("/"), seq_mark[1])
+
+    def has_rollup_tier(self, bucket_seconds):
+        return self.__rollups.tier_for(bucket_seconds) is not None
+
+    def select_rollup_since(self, log_key, threshold, bucket_seconds):
+        """
+        Retrieves the bucketed aggregation of a log (mean/min/max/last of each bucket) from the rollup tiers. As for
+        the raw entries, the buckets the hot tier entirely covers are aggregated from it, so that the entries still
+        queued for the writer are included as well
+        :param log_key: Key of the log
+        :param threshold: Oldest timestamp to retrieve (the first bucket is the one containing it)
+        :param bucket_seconds: Length of the buckets in seconds (see has_rollup_tier)
+        :return: Dataframe with a row for each non-empty bucket
+        """
+        log_key = log_key.strip("/")
+        since = pd.Timestamp(threshold).floor(pd.Timedelta(seconds=bucket_seconds))
+        with self.__feed_locks.read(log_key):
+            hot_entries = self.__hot_tier.select_since(log_key, since)
+            pending_vals_df = pd.DataFrame(self.__writer.pending_entries(log_key), columns=SENSOR_LOGS_COLUMNS)
+            if hot_entries is None:  # No new entries since the start: every entry is stored or pending
+                return self.__rollups.select(log_key, threshold, bucket_seconds, pending_vals_df)
+            return self.__rollups.select(log_key, threshold, bucket_seconds, pending_vals_df, hot_entries[0],
+                                         hot_entries[1])
+
+    def drop_expired_rollups(self):
+        self.__sweeping = True
+        try:
+            with metrics.timer("rollup_sweep_seconds"):
+                self.__rollups.drop_expired()
+        finally:
+            self.__sweeping = False
+
+    def drop_partitions_older_than(self, threshold_date):
+        """
+        Deletes the partitions of the days preceding a threshold date (whatever the amount of data they contain,
+        this only takes the time needed to close and delete their files)
+        :param threshold_date: Date of the oldest partition to keep
+        """
+        self.__sweeping = True
+        try:
+            with metrics.timer("partition_sweep_seconds"):
+                self.__drop_partitions_older_than(threshold_date)
+        finally:
+            self.__sweeping = False
+
+    def __drop_partitions_older_than(self, threshold_date):
+        with self.__partitions_lock.write():
+            with self.__io_lock:
+                for partition_date in [partition_date for partition_date in self.__partitions.keys()
+                                       if partition_date < threshold_date]:
+                    self.__partitions.pop(partition_date).close()
+                    self.__dirty_partitions.discard(partition_date)
+                    self.__unsynced_partitions.discard(partition_date)
+                    os.remove(self.__partition_path(partition_date))
+                    metrics.inc("dropped_partitions_total")
+                    logger.info("Dropped log partition %s", partition_date)
+
+                self.__known_keys = set(log_key.strip("/") for partition in self.__partitions.values()
+                                        for log_key in partition.keys())
+
+    def is_sweeping(self):
+        return self.__sweeping
+
+    def get_writer_stats(self):
+        return self.__writer.get_stats()
+
+    def get_hot_tier_stats(self):
+        return self.__hot_tier.get_stats()
+
+    def close(self):
+        self.__writer.stop()  # Storing all pending values before closing
+        self.__rollups.close()
+        with self.__io_lock:
+            for partition in self.__partitions.values():
+                partition.close()  # Storage flushed and closed
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+from include.configuration import WAL_SYNC_SECONDS
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RECORD_HEADER = struct.Struct("<II")  # Length of the record body and CRC32 of the body
+_RECORD_ENTRY = struct.Struct("<dqH")  # Sensor value, timestamp (microseconds since the epoch) and log key length
+_ENTRY_RECORD = b"E"                   # First byte of the body of the entry records
+_CHECKPOINT_RECORD = b"C"              # First byte of the body of the checkpoint record (stored row counts, JSON)
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _record(body):
+    return _RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def _encode(log_key, entry):
+    encoded_key = log_key.encode("utf-8")
+    return _record(_ENTRY_RECORD
+                   + _RECORD_ENTRY.pack(entry[0], (entry[1] - _EPOCH) // _MICROSECOND, len(encoded_key))
+                   + encoded_key)
+
+
+class WriteAheadLog(object):
+
+    def __init__(self, path, sync_seconds=WAL_SYNC_SECONDS):
+        """
+        Append-only log of the entries received but not yet durably stored in the HDF5 storage, so that the writer
+        can commit large batches without an fsync each (see include/writer.py).
+        Every entry is appended as a record checked by a CRC32 (a torn record at the end of the file, left by a crash,
+        ends the replay). Appends are buffered and made durable by a single fsync at most every sync_seconds, which
+        bounds the entries lost by a crash of the machine (a crash of the process only loses the buffered ones).
+        Once the storage is synced, a checkpoint rewrites the log with the amount of rows stored for each log (and
+        partition) followed by the entries still pending: on replay, the rows stored since the checkpoint are the
+        first entries of each log in the write-ahead log, which are skipped (whatever their timestamps).
+        :param path: Path of the log file
+        :param sync_seconds: Maximum time (in seconds) between two fsyncs of the appended records
+        """
+        self.__path = path
+        self.__sync_seconds = sync_seconds
+        self.__file = open(self.__path, "ab")
+        self.__size = self.__file.tell()  # Kept aside, so that other threads can read it
+        self.__unsynced = False
+        self.__last_sync = time.monotonic()
+
+    def size(self):
+        return self.__size
+
+    def append(self, log_key, entry):
+        """
+        Appends an entry (made durable by the next sync)
+        :param log_key: Key of the log the entry belongs to
+        :param entry: Tuple containing the sensor value and its timestamp
+        """
+        record = _encode(log_key, entry)
+        self.__file.write(record)
+        self.__size += len(record)
+        self.__unsynced = True
+
+    def sync(self, force=False):
+        """
+        Makes the appended records durable, if the last sync is older than sync_seconds (or always, if forced)
+        :return: True if an fsync was done
+        """
+        if not self.__unsynced or (not force and time.monotonic() - self.__last_sync < self.__sync_seconds):
+            return False
+
+        with metrics.timer("wal_sync_seconds"):
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        self.__unsynced = False
+        self.__last_sync = time.monotonic()
+        return True
+
+    def read(self):
+        """
+        Reads the log, up to the first torn or corrupted record
+        :return: Tuple with the row counts of the last checkpoint (dictionary of the amount of stored rows of each
+                 partition date, by log key) and the dictionary of the entries (tuples containing the sensor value and
+                 its timestamp) of each log key, in the order they were appended
+        """
+        self.__file.flush()
+        with open(self.__path, "rb") as log_file:
+            data = log_file.read()
+
+        row_counts = dict()
+        entries = dict()
+        position = 0
+        while position + _RECORD_HEADER.size <= len(data):
+            body_length, crc = _RECORD_HEADER.unpack_from(data, position)
+            body = data[position + _RECORD_HEADER.size:position + _RECORD_HEADER.size + body_length]
+            if body_length == 0 or len(body) < body_length or zlib.crc32(body) != crc:
+                break
+            if body[:1] == _ENTRY_RECORD and body_length >= 1 + _RECORD_ENTRY.size:
+                value, timestamp, key_length = _RECORD_ENTRY.unpack_from(body, 1)
+                log_key = body[1 + _RECORD_ENTRY.size:1 + _RECORD_ENTRY.size + key_length].decode("utf-8")
+                entries.setdefault(log_key, list()).append((value, _EPOCH + timestamp * _MICROSECOND))
+            elif body[:1] == _CHECKPOINT_RECORD:
+                row_counts = {log_key: {date.fromisoformat(partition_date): rows
+                                        for partition_date, rows in partition_rows.items()}
+                              for log_key, partition_rows in json.loads(body[1:].decode("utf-8")).items()}
+            else:
+                break
+            position += _RECORD_HEADER.size + body_length
+
+        if position < len(data):
+            metrics.inc("wal_torn_records_total")
+            logger.warning("Write-ahead log %s: discarded %d bytes after the last valid record",
+                           self.__path, len(data) - position)
+        return row_counts, entries
+
+    def checkpoint(self, pending, row_counts):
+        """
+        Replaces the log with the entries not yet stored, once every other entry is durably stored (the new log is
+        written aside, then atomically renamed over the old one)
+        :param pending: Dictionary of the entries not yet stored of each log key
+        :param row_counts: Dictionary of the amount of stored rows of each partition date, by log key
+        """
+        with metrics.timer("wal_checkpoint_seconds"):
+            checkpoint_path = self.__path + ".checkpoint"
+            records = _record(_CHECKPOINT_RECORD
+                              + json.dumps({log_key: {partition_date.isoformat(): rows
+                                                      for partition_date, rows in partition_rows.items()}
+                                            for log_key, partition_rows in row_counts.items()}).encode("utf-8"))
+            records += b"".join(_encode(log_key, entry) for log_key, entries in pending.items() for entry in entries)
+            with open(checkpoint_path, "wb") as checkpoint_file:
+                checkpoint_file.write(records)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+
+            self.__file.close()
+            try:
+                os.replace(checkpoint_path, self.__path)
+            finally:  # Appends go on in the old log if it couldn't be replaced
+                self.__file = open(self.__path, "ab")
+                self.__size = self.__file.tell()
+            directory = os.open(os.path.dirname(os.path.abspath(self.__path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)  # The rename itself must be durable
+            finally:
+                os.close(directory)
+        self.__unsynced = False
+        self.__last_sync = time.monotonic()
+
+    def close(self):
+        self.sync(force=True)
+        self.__file.close()
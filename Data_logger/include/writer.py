@@ -0,0 +1,245 @@
+import logging
+import threading
+import time
+from queue import Queue, Empty, Full
+
+from include.configuration import WRITER_QUEUE_SIZE, WRITER_BATCH_ROWS, WRITER_BATCH_SECONDS, \
+    WRITER_QUEUE_PUT_TIMEOUT_SECONDS, WRITER_MAX_DEFERRED_COMMITS, WAL_SYNC_SECONDS, WAL_CHECKPOINT_SECONDS, \
+    WAL_CHECKPOINT_BYTES
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class HDF5BatchWriter(threading.Thread):
+
+    def __init__(self, log_storage, feed_locks, wal=None, queue_size=WRITER_QUEUE_SIZE, batch_rows=WRITER_BATCH_ROWS,
+                 batch_seconds=WRITER_BATCH_SECONDS, put_timeout=WRITER_QUEUE_PUT_TIMEOUT_SECONDS,
+                 checkpoint_seconds=WAL_CHECKPOINT_SECONDS, checkpoint_bytes=WAL_CHECKPOINT_BYTES):
+        """
+        Thread owning every write to the HDF5 storage.
+        New log entries are pushed in a bounded queue (by the MQTT callback) and committed to the storage in group,
+        as soon as either a certain amount of rows is pending or the oldest pending row waited a certain time.
+        Every commit writes the entries of all the keys and flushes them with a single fsync. With a write-ahead log
+        (see include/wal.py) the entries are appended to it as soon as they leave the queue, and the commits don't
+        fsync: the storage is only synced by the checkpoints (after a commit, at most every checkpoint_seconds or once
+        the log reaches checkpoint_bytes), which then truncate the log to the entries still pending.
+        A key whose log is being read is skipped (its entries stay pending and readable) unless it was already
+        skipped for too many commits in a row, so a long query on a feed doesn't stall the ingestion of the others.
+        :param log_storage: Storage object which will keep the logs (see include/storage.py)
+        :param feed_locks: Reader/writer locks of each log (see include/locks.py)
+        :param wal: Write-ahead log of the entries not yet durably stored (None to fsync every commit)
+        :param queue_size: Maximum amount of entries waiting in the queue, once reached the producers are blocked
+        :param batch_rows: Amount of pending rows triggering a commit
+        :param batch_seconds: Maximum time (in seconds) a row can stay pending before being committed
+        :param put_timeout: Maximum time (in seconds) a producer waits on a full queue before dropping the entry
+        :param checkpoint_seconds: Maximum time (in seconds) between two checkpoints of the write-ahead log
+        :param checkpoint_bytes: Size of the write-ahead log triggering a checkpoint
+        """
+        super().__init__(daemon=True)
+
+        self.__storage = log_storage
+        self.__feed_locks = feed_locks
+        self.__queue = Queue(maxsize=queue_size)
+        self.__batch_rows = batch_rows
+        self.__batch_seconds = batch_seconds
+        self.__put_timeout = put_timeout
+        self.__wal = wal
+        self.__checkpoint_seconds = checkpoint_seconds
+        self.__checkpoint_bytes = checkpoint_bytes
+        self.__last_checkpoint = time.monotonic()
+
+        self.__pending = dict()                 # Entries received but not yet committed, grouped by log key
+        self.__pending_rows = 0
+        self.__pending_since = None             # Arrival time of the oldest pending entry
+        self.__pending_lock = threading.Lock()  # Lock to allow readers to copy the pending entries
+        self.__deferred_commits = dict()        # Amount of consecutive commits in which a key was skipped
+
+        self.__stop_event = threading.Event()
+        self.__stats_lock = threading.Lock()
+        self.__stats = {"enqueued": 0,            # Entries accepted by the queue
+                        "dropped": 0,             # Entries dropped because the queue stayed full for too long
+                        "blocked_puts": 0,        # Producers that found the queue full (and had to wait)
+                        "max_queue_depth": 0,
+                        "commits": 0,
+                        "committed_rows": 0,
+                        "commit_errors": 0,
+                        "deferred_keys": 0,       # Keys skipped by a commit because they were being read
+                        "checkpoints": 0,         # Storage syncs truncating the write-ahead log
+                        "last_commit_seconds": 0.0
+                        }
+
+    def put(self, log_key, entry):
+        """
+        Pushes a new log entry in the writing queue, blocking the caller (backpressure) if the queue is full
+        :param log_key: Key of the log the entry belongs to
+        :param entry: Tuple containing the sensor value and its timestamp
+        :return: True if the entry was queued, False if it was dropped
+        """
+        blocked = self.__queue.full()
+        try:
+            self.__queue.put((log_key, entry), timeout=self.__put_timeout)
+            queued = True
+        except Full:
+            queued = False
+
+        with self.__stats_lock:
+            self.__stats["blocked_puts"] += int(blocked)
+            self.__stats["enqueued" if queued else "dropped"] += 1
+            self.__stats["max_queue_depth"] = max(self.__stats["max_queue_depth"], self.__queue.qsize())
+
+        return queued
+
+    def pending_entries(self, log_key):
+        with self.__pending_lock:
+            return list(self.__pending.get(log_key, ()))
+
+    def pending_keys(self):
+        with self.__pending_lock:
+            return [log_key for log_key in self.__pending.keys() if len(self.__pending[log_key]) > 0]
+
+    def get_stats(self):
+        with self.__stats_lock:
+            stats = dict(self.__stats)
+        stats["queue_depth"] = self.__queue.qsize()
+        stats["pending_rows"] = self.__pending_rows
+        stats["wal_bytes"] = self.__wal.size() if self.__wal is not None else 0
+        return stats
+
+    def stop(self):
+        """
+        Stops the thread after committing every entry still queued or pending
+        """
+        self.__stop_event.set()
+        self.__queue.put(None)  # Wakes up the thread if it is waiting on an empty queue
+        self.join()
+
+    def __add_pending(self, item):
+        if item is None:  # Wake-up sentinel pushed by stop
+            return
+        log_key, entry = item
+        if self.__wal is not None:
+            try:
+                self.__wal.append(log_key, entry)
+            except OSError as error:  # The entry is still committed, it just isn't protected until then
+                metrics.inc("wal_errors_total")
+                logger.error("Failed to append to the write-ahead log: %s", error)
+        with self.__pending_lock:
+            self.__pending.setdefault(log_key, list()).append(entry)
+        self.__pending_rows += 1
+        if self.__pending_since is None:
+            self.__pending_since = time.monotonic()
+
+    def __commit_log(self, log_key):
+        feed_lock = self.__feed_locks.get(log_key)
+        must_commit = self.__deferred_commits.get(log_key, 0) >= WRITER_MAX_DEFERRED_COMMITS
+
+        if not feed_lock.acquire_write(blocking=must_commit):  # The log is being read, try again on next commit
+            self.__deferred_commits[log_key] = self.__deferred_commits.get(log_key, 0) + 1
+            with self.__stats_lock:
+                self.__stats["deferred_keys"] += 1
+            return
+
+        try:
+            with self.__pending_lock:
+                entries = self.__pending.get(log_key, list())
+            # The entries are appended one partition (run of entries of the same day) at a time, each run leaving the
+            # pending entries once stored: if a later run fails, the retry only stores the remaining ones
+            while len(entries) > 0:
+                run_date = entries[0][1].date()
+                run_length = next((i for i, entry in enumerate(entries) if entry[1].date() != run_date), len(entries))
+                self.__storage.append_entries(log_key, entries[:run_length])
+                with self.__pending_lock:  # Committed entries are now visible in the storage
+                    del entries[:run_length]
+                    if len(entries) == 0:
+                        del self.__pending[log_key]
+                self.__pending_rows -= run_length
+        finally:
+            feed_lock.release_write()
+
+        self.__deferred_commits.pop(log_key, None)
+
+    def __checkpoint(self):
+        # Every entry committed so far is made durable in the storage, so the write-ahead log only has to keep the
+        # pending ones. If anything fails the log is left as is (it is a superset of the entries not yet durable)
+        try:
+            self.__storage.flush(fsync=True)
+            with self.__pending_lock:
+                pending = {log_key: list(entries) for log_key, entries in self.__pending.items()}
+            self.__wal.checkpoint(pending, self.__storage.row_counts())
+        except Exception as error:
+            logger.error("Checkpoint of the write-ahead log failed: %s", error)
+            return
+        finally:
+            self.__last_checkpoint = time.monotonic()
+
+        with self.__stats_lock:
+            self.__stats["checkpoints"] += 1
+
+    def __commit(self):
+        if self.__pending_rows == 0:
+            return
+
+        commit_start = time.monotonic()
+        pending_rows = self.__pending_rows
+        failed = False
+        try:
+            for log_key in self.pending_keys():
+                self.__commit_log(log_key)
+            # A single fsync (for each written partition) for the whole group of entries, or none if the write-ahead
+            # log keeps them until the next checkpoint
+            self.__storage.flush(fsync=self.__wal is None)
+        except Exception as error:  # The entries not yet committed are kept pending, the commit will be retried
+            logger.error("HDF5 writer failed to commit %d entries: %s", self.__pending_rows, error)
+            failed = True
+        finally:
+            committed_rows = pending_rows - self.__pending_rows  # Entries stored, even by an interrupted commit
+            self.__pending_since = time.monotonic() if self.__pending_rows > 0 else None
+
+        commit_seconds = time.monotonic() - commit_start
+        metrics.observe("writer_commit_seconds", commit_seconds)
+        metrics.inc("writer_committed_rows_total", committed_rows)
+        with self.__stats_lock:
+            self.__stats["commit_errors" if failed else "commits"] += 1
+            self.__stats["committed_rows"] += committed_rows
+            self.__stats["last_commit_seconds"] = commit_seconds
+
+        if not failed and self.__wal is not None and (
+                time.monotonic() - self.__last_checkpoint >= self.__checkpoint_seconds
+                or self.__wal.size() >= self.__checkpoint_bytes):
+            self.__checkpoint()
+
+    def run(self):
+        while not (self.__stop_event.is_set() and self.__queue.empty()):
+            if self.__pending_since is None:
+                timeout = self.__batch_seconds
+            else:
+                timeout = max(0.0, self.__batch_seconds - (time.monotonic() - self.__pending_since))
+            if self.__wal is not None:  # Woken up in time for the periodic sync of the write-ahead log
+                timeout = min(timeout, WAL_SYNC_SECONDS)
+
+            try:
+                self.__add_pending(self.__queue.get(timeout=min(timeout, 1.0)))
+                # Drain everything already available, without exceeding the batch size
+                while self.__pending_rows < self.__batch_rows:
+                    self.__add_pending(self.__queue.get_nowait())
+            except Empty:
+                pass
+
+            if self.__wal is not None:
+                try:
+                    self.__wal.sync()
+                except OSError as error:
+                    metrics.inc("wal_errors_total")
+                    logger.error("Failed to sync the write-ahead log: %s", error)
+
+            if (self.__pending_rows >= self.__batch_rows
+                    or (self.__pending_since is not None
+                        and time.monotonic() - self.__pending_since >= self.__batch_seconds)):
+                self.__commit()
+
+        self.__deferred_commits = {log_key: WRITER_MAX_DEFERRED_COMMITS for log_key in self.pending_keys()}
+        self.__commit()  # Commit what is left before stopping
+        if self.__wal is not None:
+            self.__checkpoint()
+            self.__wal.close()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+from include.configuration import LOG_DIR, LOG_STORAGE, LOG_PARTITION_FORMAT
+from include.migration import migrate_storage
+
+# One-shot migration of a single-file sensor logs storage to the float64, daily partitioned layout
+# Usage: python migrate_storage.py [storage_path]   (defaults to the storage used by previous versions of the logger)
+storage_path = sys.argv[1] if len(sys.argv) > 1 else os.getcwd() + LOG_DIR + "/" + LOG_STORAGE
+
+if not os.path.isfile(storage_path):
+    print(f"ERROR: storage {storage_path} not found")
+    sys.exit(1)
+
+print(f"Migrating {storage_path} . . .")
+try:
+    report = migrate_storage(storage_path, LOG_PARTITION_FORMAT)
+except FileExistsError as error:
+    print(f"ERROR: {error}")
+    sys.exit(1)
+for log_key, counts in report.items():
+    print(f"{log_key}: {counts['migrated']} rows migrated, {counts['dropped']} non numeric rows dropped")
+print(f"Migration completed (original storage kept as {storage_path}.bak)")
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from include.configuration import LOG_PARTITION_FORMAT, LOG_STORAGE, SENSOR_LOGS_COLUMNS, \
+    SENSOR_LOGS_TIMESTAMP_COLUMN  # noqa: E402
+from include.migration import migrate_storage  # noqa: E402
+
+LOG_KEY = "A1_TEMPERATURE"
+START = pd.Timestamp("2026-01-01 23:00:00")
+
+
+class MigrateStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage_path = os.path.join(self.directory.name, LOG_STORAGE)
+        old_entries = pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: [str(i) for i in range(100)] + ["nan?"],
+                                    SENSOR_LOGS_TIMESTAMP_COLUMN: [START + pd.Timedelta(minutes=i) for i in range(101)]
+                                    }, columns=SENSOR_LOGS_COLUMNS)
+        with pd.HDFStore(self.storage_path) as old_storage:  # Single-file storage with the values as strings
+            old_storage.append(LOG_KEY, old_entries, format='t', data_columns=True, min_itemsize=15)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def __partition_path(self, day):
+        return os.path.join(self.directory.name, pd.Timestamp(day).strftime(LOG_PARTITION_FORMAT))
+
+    def test_migration(self):
+        report = migrate_storage(self.storage_path, LOG_PARTITION_FORMAT, chunk_rows=30)
+
+        self.assertEqual(report, {"/" + LOG_KEY: {"migrated": 100, "dropped": 1}})
+        self.assertTrue(os.path.isfile(self.storage_path + ".bak"))
+        self.assertFalse(os.path.exists(self.storage_path))
+        first_day = pd.read_hdf(self.__partition_path("2026-01-01"), LOG_KEY)
+        second_day = pd.read_hdf(self.__partition_path("2026-01-02"), LOG_KEY)
+        self.assertEqual(first_day[SENSOR_LOGS_COLUMNS[0]].tolist(), [float(i) for i in range(60)])
+        self.assertEqual(second_day[SENSOR_LOGS_COLUMNS[0]].tolist(), [float(i) for i in range(60, 100)])
+        self.assertEqual([file_name for file_name in os.listdir(self.directory.name)
+                          if file_name.endswith(".migrating")], [])
+
+    def test_existing_partition_is_not_appended_to(self):
+        existing = pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: [1.0],
+                                 SENSOR_LOGS_TIMESTAMP_COLUMN: [START + pd.Timedelta(hours=2)]
+                                 }, columns=SENSOR_LOGS_COLUMNS)
+        existing.to_hdf(self.__partition_path("2026-01-02"), key=LOG_KEY, format='t', data_columns=True)
+
+        with self.assertRaises(FileExistsError):
+            migrate_storage(self.storage_path, LOG_PARTITION_FORMAT, chunk_rows=30)
+
+        # Nothing changed: the original storage is kept, and no partition was created or modified
+        self.assertTrue(os.path.isfile(self.storage_path))
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         sorted([LOG_STORAGE, os.path.basename(self.__partition_path("2026-01-02"))]))
+        self.assertEqual(pd.read_hdf(self.__partition_path("2026-01-02"), LOG_KEY).shape[0], 1)
+
+    def test_migration_after_a_failed_one(self):
+        # A partition left half-written by a migration that was killed
+        leftover = pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: [0.0],
+                                 SENSOR_LOGS_TIMESTAMP_COLUMN: [START]
+                                 }, columns=SENSOR_LOGS_COLUMNS)
+        leftover.to_hdf(self.__partition_path("2026-01-01") + ".migrating", key=LOG_KEY, format='t',
+                        data_columns=True)
+
+        migrate_storage(self.storage_path, LOG_PARTITION_FORMAT, chunk_rows=30)
+
+        self.assertEqual(pd.read_hdf(self.__partition_path("2026-01-01"), LOG_KEY).shape[0], 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from include.configuration import LOG_PARTITION_FORMAT, SENSOR_LOGS_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN  # noqa: E402
+from include.downsampling import aggregate_buckets  # noqa: E402
+from include.rollups import RollupTiers  # noqa: E402
+from include.storage import SensorLogStorage  # noqa: E402
+
+LOG_KEY = "A1_TEMPERATURE"
+
+
+class RollupSelectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = SensorLogStorage(self.directory.name, LOG_PARTITION_FORMAT)
+
+    def tearDown(self):
+        self.storage.close()
+        self.directory.cleanup()
+
+    def __assert_rollups_match_raw(self, since, bucket_seconds):
+        raw_df = aggregate_buckets(self.storage.select_since(LOG_KEY, since), bucket_seconds)
+        rollup_df = self.storage.select_rollup_since(LOG_KEY, since, bucket_seconds)
+
+        self.assertEqual(rollup_df.shape, raw_df.shape)
+        self.assertEqual(rollup_df.columns.tolist(), raw_df.columns.tolist())
+        for column in raw_df.columns:
+            np.testing.assert_allclose(rollup_df[column].to_numpy(dtype="float64"),
+                                       raw_df[column].to_numpy(dtype="float64"))
+
+    def test_rollups_match_the_raw_entries(self):
+        start = datetime.now() - timedelta(minutes=30)
+        for i in range(1200):  # Stored before the restart (older than the hot tier)
+            self.storage.put(LOG_KEY, (float(i % 17), start + timedelta(seconds=i)))
+        self.storage.close()
+        self.storage = SensorLogStorage(self.directory.name, LOG_PARTITION_FORMAT)
+
+        for i in range(600):  # A batch is committed, the rest is pending
+            self.storage.put(LOG_KEY, (float(i % 13), datetime.now()))
+        deadline = time.monotonic() + 10
+        while self.storage.get_writer_stats()["committed_rows"] < 500 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        for bucket_seconds in (60, 300):
+            self.__assert_rollups_match_raw(start, bucket_seconds)
+
+    def test_rollups_include_the_queued_entries(self):
+        since = datetime.now() - timedelta(minutes=5)
+        for i in range(300):  # Not committed yet (queued or pending)
+            self.storage.put(LOG_KEY, (float(i), datetime.now()))
+
+        self.__assert_rollups_match_raw(since, 60)
+        self.assertEqual(self.storage.select_rollup_since(LOG_KEY, since, 60)["max"].max(), 299.0)
+
+
+class RollupTiersRecentEntriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rollups = RollupTiers(self.directory.name, threading.Lock())
+
+    def tearDown(self):
+        self.rollups.close()
+        self.directory.cleanup()
+
+    def test_recent_entries_replace_the_buckets_they_cover(self):
+        start = pd.Timestamp("2026-01-01 12:00:00")
+        entries_df = pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: [float(i % 7) for i in range(600)],
+                                   SENSOR_LOGS_TIMESTAMP_COLUMN: [start + pd.Timedelta(seconds=i) for i in range(600)]
+                                   }, columns=SENSOR_LOGS_COLUMNS)
+        committed_df, pending_df = entries_df.iloc[:400], entries_df.iloc[400:500]
+        recent_since = start + pd.Timedelta(seconds=150)  # The hot tier has every entry since then
+        recent_df = entries_df[entries_df[SENSOR_LOGS_TIMESTAMP_COLUMN] > recent_since]  # Also the queued ones
+        self.rollups.add(LOG_KEY, committed_df)
+
+        rollup_df = self.rollups.select(LOG_KEY, start, 60, pending_df, recent_df, recent_since)
+        raw_df = aggregate_buckets(entries_df, 60)
+        self.assertEqual(rollup_df.shape, raw_df.shape)
+        for column in raw_df.columns:
+            np.testing.assert_allclose(rollup_df[column].to_numpy(dtype="float64"),
+                                       raw_df[column].to_numpy(dtype="float64"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from include.configuration import LOG_PARTITION_FORMAT, SENSOR_LOGS_VALUES_COLUMN  # noqa: E402
+from include.hot_tier import HotTier  # noqa: E402
+from include.storage import SensorLogStorage  # noqa: E402
+
+LOG_KEY = "A1_TEMPERATURE"
+
+
+def _values(log_df):
+    return sorted(log_df[SENSOR_LOGS_VALUES_COLUMN].tolist())
+
+
+class HotTierSelectAfterTest(unittest.TestCase):
+
+    def test_entries_after_a_seq(self):
+        hot_tier = HotTier(capacity=100)
+        now = datetime.now()
+        for i in range(10):
+            hot_tier.append(LOG_KEY, float(i), now + timedelta(seconds=i))
+
+        entries, last_seq = hot_tier.select_after(LOG_KEY, 6)
+        self.assertEqual(_values(entries), [6.0, 7.0, 8.0, 9.0])  # Sequence numbers start from 1
+        self.assertEqual(last_seq, 10)
+        self.assertEqual(hot_tier.select_after(LOG_KEY, 10)[0].shape[0], 0)
+
+    def test_seq_older_than_the_oldest_entry(self):
+        hot_tier = HotTier(capacity=5)
+        now = datetime.now()
+        for i in range(10):
+            hot_tier.append(LOG_KEY, float(i), now + timedelta(seconds=i))
+
+        self.assertIsNone(hot_tier.select_after(LOG_KEY, 4))  # Entry 5 (seq 6) was evicted
+        self.assertEqual(_values(hot_tier.select_after(LOG_KEY, 5)[0]), [5.0, 6.0, 7.0, 8.0, 9.0])
+
+    def test_seq_never_assigned(self):
+        hot_tier = HotTier()
+        hot_tier.append(LOG_KEY, 1.0, datetime.now())
+
+        self.assertIsNone(hot_tier.select_after(LOG_KEY, 2))
+        self.assertIsNone(hot_tier.select_after("B2_LUX", 1))
+        self.assertEqual(hot_tier.select_after("B2_LUX", 0)[1], 0)  # No entries since the start
+
+
+class StorageSeqDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = SensorLogStorage(self.directory.name, LOG_PARTITION_FORMAT)
+
+    def tearDown(self):
+        self.storage.close()
+        self.directory.cleanup()
+
+    def __reopen(self):
+        self.storage.close()
+        self.storage = SensorLogStorage(self.directory.name, LOG_PARTITION_FORMAT)
+
+    def __put(self, values):
+        for value in values:
+            self.assertTrue(self.storage.put(LOG_KEY, (float(value), datetime.now())))
+
+    def __wait_committed(self, rows):
+        deadline = time.monotonic() + 10
+        while self.storage.get_writer_stats()["committed_rows"] < rows and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.storage.get_writer_stats()["committed_rows"], rows)
+
+    def test_epoch_mismatch_forces_a_reload(self):
+        self.__put(range(5))
+        since = datetime.now() - timedelta(minutes=1)
+        logs, seqs = self.storage.select_since_many_with_seq({LOG_KEY: since})
+        seq_mark = (self.storage.epoch, seqs[LOG_KEY])
+        self.assertEqual(seq_mark[1], 5)
+
+        self.__reopen()  # The sequence numbers restart: seq 5 of the old epoch is some other entry now
+        self.__put(range(5, 12))
+        self.assertNotEqual(self.storage.epoch, seq_mark[0])
+        self.assertIsNone(self.storage.select_after_seq(LOG_KEY, seq_mark))
+
+        # The window is retrieved by time again, along with a mark of the new epoch
+        logs, seqs = self.storage.select_since_many_with_seq({LOG_KEY: since})
+        self.assertEqual(_values(logs[LOG_KEY]), [float(i) for i in range(12)])
+        self.assertEqual(seqs[LOG_KEY], 7)
+        self.assertEqual(self.storage.select_after_seq(LOG_KEY, (self.storage.epoch, 7))[0].shape[0], 0)
+
+    def test_no_duplicates_across_the_sources(self):
+        since = datetime.now() - timedelta(minutes=1)
+        self.__put(range(600))  # Stored only (before the restart)
+        self.__reopen()
+        self.__put(range(600, 1100))  # Stored and in the hot tier (a batch triggers a commit)
+        self.__wait_committed(500)
+        self.__put(range(1100, 1150))  # Pending (or still queued) and in the hot tier
+
+        logs, seqs = self.storage.select_since_many_with_seq({LOG_KEY: since})
+        self.assertEqual(_values(logs[LOG_KEY]), [float(i) for i in range(1150)])
+        self.assertEqual(seqs[LOG_KEY], 550)
+
+        self.__put(range(1150, 1160))
+        delta, last_seq = self.storage.select_after_seq(LOG_KEY, (self.storage.epoch, seqs[LOG_KEY]))
+        self.assertEqual(_values(delta), [float(i) for i in range(1150, 1160)])
+        self.assertEqual(last_seq, 560)
+
+
+if __name__ == "__main__":
+    unittest.main()
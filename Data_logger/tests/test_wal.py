@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+DATA_LOGGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DATA_LOGGER_DIR)
+
+from include.configuration import LOG_PARTITION_FORMAT, WAL_FILE  # noqa: E402
+from include.storage import SensorLogStorage  # noqa: E402
+from include.wal import WriteAheadLog, _encode  # noqa: E402
+
+LOG_KEY = "A1_TEMPERATURE"
+
+# Run in a separate process, which dies without closing the storage: 10 entries are committed (not synced) after the
+# checkpoint written when the storage is opened, and 15 entries are in the write-ahead log, the last 5 timestamped
+# before the committed ones (as after a backward step of the clock)
+_CRASH_SCRIPT = """
+import os, sys
+from datetime import datetime, timedelta
+from include.configuration import LOG_PARTITION_FORMAT, WAL_FILE
+from include.storage import SensorLogStorage
+from include.wal import WriteAheadLog
+
+storage_dir = sys.argv[1]
+storage = SensorLogStorage(storage_dir, LOG_PARTITION_FORMAT)
+now = datetime.now()
+entries = [(float(i), now - timedelta(minutes=10) + timedelta(seconds=i)) for i in range(10)]
+entries += [(float(i), now - timedelta(minutes=11) + timedelta(seconds=i)) for i in range(10, 15)]
+wal = WriteAheadLog(os.path.join(storage_dir, WAL_FILE))
+for entry in entries:
+    wal.append("{log_key}", entry)
+wal.sync(force=True)
+storage.append_entries("{log_key}", entries[:10])
+storage.flush(fsync=False)
+os._exit(0)
+""".format(log_key=LOG_KEY)
+
+
+def _entries(amount, start=datetime(2026, 1, 1, 12, 0, 0, 123456)):
+    return [(float(i) / 3, start + timedelta(seconds=i, microseconds=i)) for i in range(amount)]
+
+
+class WriteAheadLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, WAL_FILE)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        wal = WriteAheadLog(self.path)
+        pending = {LOG_KEY: _entries(3)}
+        row_counts = {LOG_KEY: {date(2026, 1, 1): 42}, "B2_LUX": {date(2025, 12, 31): 7}}
+        wal.checkpoint(pending, row_counts)
+        new_entries = _entries(4, start=datetime(2026, 1, 2))
+        for entry in new_entries:
+            wal.append("B2_LUX", entry)
+        wal.close()
+
+        read_row_counts, read_entries = WriteAheadLog(self.path).read()
+        self.assertEqual(read_row_counts, row_counts)
+        self.assertEqual(read_entries, {LOG_KEY: pending[LOG_KEY], "B2_LUX": new_entries})
+
+    def test_torn_record(self):
+        wal = WriteAheadLog(self.path)
+        wal.checkpoint(dict(), dict())
+        entries = _entries(3)
+        for entry in entries:
+            wal.append(LOG_KEY, entry)
+        wal.close()
+        size = os.path.getsize(self.path)
+        record_size = len(_encode(LOG_KEY, entries[0]))
+
+        with open(self.path, "r+b") as wal_file:  # The last record is cut by a crash
+            wal_file.truncate(size - 3)
+        self.assertEqual(WriteAheadLog(self.path).read()[1], {LOG_KEY: entries[:2]})
+
+        with open(self.path, "r+b") as wal_file:  # A byte of the second record is corrupted
+            wal_file.seek(size - record_size - 10)
+            byte = wal_file.read(1)
+            wal_file.seek(size - record_size - 10)
+            wal_file.write(bytes([byte[0] ^ 0xFF]))
+        self.assertEqual(WriteAheadLog(self.path).read()[1], {LOG_KEY: entries[:1]})
+
+
+class WriteAheadLogReplayTest(unittest.TestCase):
+
+    def test_replay_skips_stored_rows(self):
+        with tempfile.TemporaryDirectory() as storage_dir:
+            subprocess.run([sys.executable, "-c", _CRASH_SCRIPT, storage_dir], cwd=DATA_LOGGER_DIR, check=True,
+                           stderr=subprocess.DEVNULL)
+
+            for _ in range(2):  # Replayed once: reopening the storage again changes nothing
+                storage = SensorLogStorage(storage_dir, LOG_PARTITION_FORMAT)
+                try:
+                    stored = storage.select_since(LOG_KEY, datetime.now() - timedelta(hours=1))
+                    self.assertEqual(sorted(stored["values"].tolist()), [float(i) for i in range(15)])
+                finally:
+                    storage.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
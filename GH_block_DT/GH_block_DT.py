@@ -1,13 +1,29 @@
 import Pyro5.api as pyro
 from Pyro5.errors import CommunicationError, ProtocolError
+import logging
 import threading
 from random import randint
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 import pandas as pd
+from math import ceil
 import time
 
 from include.configuration import *
-from include.decorators import AutoRemoveOldLogsCache
+from include.cache_eviction import CacheEvictor
+from include.downsampling import downsample
+from include.feed_cache import FeedCache, feed_cache_key
+from include.hash_ring import HashRing
+from include.load_balancer import LoggerBalancer
+from include.log_format import format_log, log_to_dataframe
+from include.metrics import metrics
+from include.mqtt_tail import MQTTTail
+from include.registry import RegistryCache
+from include.replication import CacheReplicator
+from include.single_flight import SingleFlight
+from include.subscriptions import SubscriptionPump
+
+logger = logging.getLogger(__name__)
 
 
 class GHBlockDT(object):
@@ -22,160 +38,438 @@ class GHBlockDT(object):
 
         self.__is_master = False
         self.__master_id = None
+        self.__term = 0              # Election term of the known master (increased by every election)
+        self.__lease_until = 0.0     # Time until which the master is considered live without hearing from it
+        self.__election_lock = threading.Lock()
+        self.__elections = SingleFlight()  # Concurrent election triggers wait for a single election
+        self.__election_executor = ThreadPoolExecutor(max_workers=ELECTION_MAX_PARALLEL_CONTACTS)
         self.__cache = dict()
-
-        # Applying the decorator to handle the removal of old cache values
-        self.get_sensor_log = pyro.expose(AutoRemoveOldLogsCache(self.__lock,
-                                                                 self.__cache,
-                                                                 logs_ttl_hours=CACHE_LOGS_TTL_HOURS
-                                                                 )(self.get_sensor_log))
-
-    @staticmethod
-    def __iso_format_col_to_datetime(df, column):
-        new_column = df[column].apply(lambda x: datetime.fromisoformat(x))
-        df[column] = new_column
-        return df
+        self.__single_flight = SingleFlight()  # Coalesces concurrent refreshes of the same feed cache
+        self.__registry = RegistryCache()  # Cached name server lookups and pooled proxies
+        self.__hash_ring = HashRing(SHARD_RING_NODES)  # Assignment of the feeds to the loggers
+        self.__balancer = LoggerBalancer(self.__registry)  # Load-aware choice among the replicas of the feeds
+
+        # Thread pushing the new entries of the subscribed feeds to the subscribers
+        self.__subscriptions = SubscriptionPump(self.__refresh_subscribed_feeds,
+                                                self.__cached_entries_after,
+                                                self.__registry
+                                                )
+        self.__subscriptions.start()
+
+        # Thread streaming the cache to the slaves (master), which answer the reads with their replica (slaves)
+        self.__replicator = CacheReplicator(self.__cache,
+                                            self.__refresh_replicated_feeds,
+                                            lambda: self.__is_master,
+                                            lambda: self.__network_id,
+                                            self.__registry
+                                            )
+        self.__replicator.start()
+        self.__replica_clock = None          # Logger time of the last delta received from the master, and local
+        self.__replica_registered_at = None  # (monotonic) time of its arrival; time of the last registration
+
+        # Thread keeping the cache within its age and memory bounds
+        self.__evictor = CacheEvictor(self.__cache, self.__lock)
+        self.__evictor.start()
+
+        # Thread renewing the master lease (master) or checking its expiration (slaves)
+        threading.Thread(target=self.__lease_loop, daemon=True).start()
+
+        # Optional live tail of the block feeds, keeping the caches current without asking the loggers
+        self.__tail = MQTTTail(self.__greenhouse_id, self.__block_id, self.__cache.get) if TWIN_MQTT_TAIL_ENABLED \
+            else None
+
+        metrics.gauge("is_master", lambda: self.__is_master)
+        metrics.gauge("term", lambda: self.__term)
+        metrics.gauge("cached_feeds", lambda: len(self.__cache))
+        metrics.gauge("cached_rows", lambda: sum(feed_cache.rows() for feed_cache in list(self.__cache.values())))
+        metrics.gauge("cached_bytes", lambda: sum(feed_cache.nbytes() for feed_cache in list(self.__cache.values())))
+        metrics.gauge("replicas", self.__replicator.replica_amount)
+        metrics.gauge("subscriptions", self.__subscriptions.subscription_amount)
 
     def set_network_id(self, network_id):
         self.__network_id = network_id
 
-    def lookup_master(self, startup=False):
-        master_id = None
-        no_peers = True
-
-        # Get a list of all analogous digital twins
-        peer_list = list(pyro.locate_ns().yplookup(meta_all=[
-            "DT:GH_block",
-            "greenhouse:" + self.__greenhouse_id,
-            "block:" + self.__block_id
-        ]
-        ).keys()
-                         )
-
-        # If there are other digital twins of the same kind
-        if len(peer_list) > 0:
-            # Try to get the master ID from the peers
-            while master_id is None and len(peer_list) > 0:
-                proxy_name = peer_list.pop(randint(0, len(peer_list) - 1))
-
-                try:
-                    with pyro.Proxy(proxy_name) as proxy:
-                        master_id = proxy.get_master_id()
-                        no_peers = False
-                except CommunicationError:
-                    print("ERROR: tried master lookup on unavailable peer")
-
-        if no_peers:  # If this is the only digital twin of its kind it elects itself master
-            self.__is_master = True
-            self.__master_id = self.__network_id
-        elif master_id is None:  # If the digital twin had peers but none of them knew the master start the election
-            self.initiate_leader_election(initiator=True, startup=startup)
-        else:  # Otherwise, just set the new master ID and check if it is still available
+    def __registered_name(self, meta_all):
+        # Name of a registration with the given metadata (chosen randomly if there are many), asking the name server
+        # again if the cached lookup has no match
+        names = list(self.__registry.yplookup(meta_all).keys())
+        if len(names) == 0:
+            names = list(self.__registry.yplookup(meta_all, fresh=True).keys())
+        if len(names) == 0:
+            raise CommunicationError(f"no object registered with metadata {meta_all}")
+        return names[randint(0, len(names) - 1)]
+
+    def __master_proxy(self):
+        return self.__registry.proxy(self.__registered_name([NETWORK_ID_METADATA_KEY + self.__master_id]))
+
+    def __logger_names(self):
+        names = list(self.__registry.yplookup(["datalogger"]).keys())
+        if len(names) == 0:
+            names = list(self.__registry.yplookup(["datalogger"], fresh=True).keys())
+        if len(names) == 0:
+            raise CommunicationError("no logger registered")
+        return names
+
+    def __feed_key(self, feed_id):
+        return self.__id + "_" + feed_cache_key(feed_id)
+
+    def __feed_logger_names(self, feed_id):
+        # Registered loggers owning a feed on the hash ring (its replicas)
+        owners = set(SHARD_NODE_METADATA_KEY + node
+                     for node in self.__hash_ring.owners(self.__feed_key(feed_id), SHARD_REPLICATION_FACTOR))
+        for fresh in (False, True):
+            owner_names = [name for name, (_, metadata) in self.__registry.yplookup(["datalogger"], fresh=fresh).items()
+                           if len(owners.intersection(metadata)) > 0]
+            if len(owner_names) > 0:
+                return sorted(owner_names)
+        raise CommunicationError(f"no logger owning feed {feed_id} is registered")
+
+    def __query_loggers(self, queries):
+        """
+        Retrieves many feeds from the loggers, with a single call for each group of feeds having the same replicas
+        (sent to the less loaded replica, and hedged if it is slow)
+        :param queries: List of (feed_id, since, seq_mark) tuples (see DataLogger.get_sensor_logs_since_batch)
+        :return: Dictionary of the answer of each feed: received log (columnar format), (epoch, seq) pair of its newest
+                 entry and whether it only has the entries following seq_mark
+        """
+        replica_queries = dict()
+        for feed_id, since, seq_mark in queries:
+            replica_queries.setdefault(tuple(self.__feed_logger_names(feed_id)), list()).append((feed_id, since,
+                                                                                                 seq_mark))
+
+        received_logs = dict()
+        for logger_names, queries_batch in replica_queries.items():
+            received_logs.update(self.__balancer.call(logger_names,
+                                                      lambda proxy, batch=queries_batch:
+                                                      proxy.get_sensor_logs_since_batch(self.__id, batch,
+                                                                                        columnar=True),
+                                                      hedge=LOGGER_HEDGED_QUERIES
+                                                      )["feeds"])
+        return received_logs
+
+    def __peers(self, fresh=True, max_age=None):
+        # Net-IDs of the other digital twins of the same block, by name (membership changes matter for master lookups
+        # and elections, so by default the name server is always contacted)
+        peers = self.__registry.yplookup(["DT:GH_block",
+                                          "greenhouse:" + self.__greenhouse_id,
+                                          "block:" + self.__block_id
+                                          ], fresh=fresh and max_age is None, max_age=max_age)
+        return {name: meta[len(NETWORK_ID_METADATA_KEY):]
+                for name, (_, metadata) in peers.items()
+                for meta in metadata
+                if meta.startswith(NETWORK_ID_METADATA_KEY)
+                and meta != NETWORK_ID_METADATA_KEY + str(self.__network_id)}
+
+    def __election_rank(self, suspected_master_id):
+        # Position this node would have in an election (among the registered peers, except the suspected master)
+        return len([network_id for network_id in self.__peers(fresh=False).values()
+                    if network_id != suspected_master_id and network_id < self.__network_id])
+
+    def __contact_peers(self, peer_names, method, *args):
+        """
+        Calls a remote method on many peers in parallel, each call bounded by a timeout and the whole contact by the
+        election deadline (the peers not answering in time are considered unavailable)
+        :param peer_names: Names of the peers to contact
+        :param method: Name of the remote method
+        :return: Dictionary of the answers of the available peers
+        """
+        def contact(peer_name):
+            proxy = self.__registry.proxy(peer_name)  # Pooled by the election threads, used only for elections
+            proxy._pyroTimeout = ELECTION_PROBE_TIMEOUT_SECONDS
+            try:
+                return getattr(proxy, method)(*args)
+            except CommunicationError:
+                self.__registry.invalidate(peer_name)
+                raise
+
+        futures = {self.__election_executor.submit(contact, peer_name): peer_name for peer_name in peer_names}
+        done, _ = wait(futures, timeout=ELECTION_DEADLINE_SECONDS)
+        answers = dict()
+        for future in done:
+            try:
+                answers[futures[future]] = future.result()
+            except CommunicationError:
+                logger.warning("Unavailable peer - %s", futures[future])
+        return answers
+
+    def __accept_master(self, term, master_id):
+        """
+        Adopts a master announced for a term, unless this node already knows a master for a newer term (or for the
+        same term, with a smaller net-ID: concurrent elections converge on the same master)
+        :return: True if the master was adopted (its lease is renewed)
+        """
+        with self.__election_lock:
+            if term < self.__term or (term == self.__term
+                                      and self.__master_id is not None
+                                      and str(master_id) > self.__master_id):
+                return False
+            changed = (term, str(master_id)) != (self.__term, self.__master_id)
+            was_master = self.__is_master
+            self.__term = term
             self.__master_id = str(master_id)
+            self.__is_master = self.__master_id == self.__network_id
+            self.__lease_until = time.monotonic() + MASTER_LEASE_SECONDS
+
+        if changed:
+            self.__replica_clock = None  # Replication restarts with the new master
+            self.__replica_registered_at = None
+            metrics.inc("master_changes_total")
+            logger.info("Master ID: %s - term: %d - master: %s", self.__master_id, self.__term, self.__is_master)
+        if self.__is_master and not was_master and CACHE_WARMUP_ENABLED:  # Startup as master or promotion
+            self.__start_warm_up()
+        return True
+
+    def __start_warm_up(self):
+        def warm_up():
+            try:
+                with metrics.timer("warm_up_seconds"):
+                    self.__single_flight.do("warm-up", self.__warm_up)
+            except Exception as error:  # The cache is just filled by the reads instead
+                logger.error("Cache warm-up failed: %s", error)
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    def __warm_up(self):
+        """
+        Pulls the standard window of every feed of the block known by the loggers (with a single query to each
+        shard), so that the first reads after the startup or the promotion of a master are answered by the cache.
+        Reads arriving in the meantime wait for the warm-up instead of querying the loggers themselves.
+        Slaves don't warm up: they get the cache of the master through the replication.
+        """
+        feed_ids = set()
+        for logger_name in self.__logger_names():  # Each logger only knows the feeds of its shard
             try:
-                with pyro.Proxy(f"PYROMETA:{NETWORK_ID_METADATA_KEY + master_id}") as master_proxy:
-                    master_proxy.ping()
+                feed_ids.update(self.__registry.proxy(logger_name).get_sensor_source_feed_keys(self.__id))
             except CommunicationError:
-                print("ERROR: Master node unavailable")
-                self.initiate_leader_election(initiator=True, startup=startup)
-        print(f" ================ MASTER LOOKUP ENDED -- MASTER: {self.__master_id}\n")
+                self.__registry.invalidate(logger_name)
+                logger.warning("Unavailable logger during the cache warm-up - %s", logger_name)
+
+        if len(feed_ids) > 0:
+            logger.info("Cache warm-up: %d feeds", len(feed_ids))
+            self.refresh_feed_caches({feed_id: CACHE_WARMUP_WINDOW_SECONDS for feed_id in feed_ids})
+
+    def __has_live_master(self, suspected_master_id=None):
+        return (self.__master_id is not None
+                and self.__master_id != suspected_master_id
+                and (self.__is_master or time.monotonic() < self.__lease_until))
+
+    def lookup_master(self):
+        """
+        Adopts the master known by the peers (probed in parallel), starting an election if none of them has one
+        """
+        peer_views = self.__contact_peers(self.__peers().keys(), "probe")
+
+        if len(peer_views) == 0:  # If this is the only digital twin of its kind it elects itself master
+            self.__accept_master(self.__term + 1, self.__network_id)
+        else:
+            for view in peer_views.values():
+                if view["lease_valid"]:
+                    self.__accept_master(view["term"], view["master_id"])
+            if not self.__has_live_master():  # The peers had no live master: start the election
+                self.initiate_leader_election()
+        logger.info("Master lookup ended - master: %s", self.__master_id)
+
+    def initiate_leader_election(self, suspected_master_id=None):
+        """
+        Elects a new master, in bounded time: every reachable peer is probed in parallel (within the election
+        deadline), the one with the smallest net-ID is chosen and announced to the others for a new term.
+        Concurrent triggers on this node wait for the same election, and no election happens if a live master (other
+        than the suspected one) is already known, here or by any peer
+        :param suspected_master_id: Net-ID of the master that couldn't be reached (if any)
+        """
+        self.__elections.do("election", self.__elect, suspected_master_id)
+
+    def __elect(self, suspected_master_id):
+        if self.__has_live_master(suspected_master_id):  # Another election ended in the meantime
+            return
+
+        metrics.inc("elections_total")
+        with metrics.timer("election_seconds"):
+            self.__hold_election(suspected_master_id)
+
+    def __hold_election(self, suspected_master_id):
+        logger.info("Leader election initiated - suspected master: %s", suspected_master_id)
+        peer_names = list(self.__peers().keys())
+        peer_views = self.__contact_peers(peer_names, "probe")
+
+        # A peer already following a live master (or being it) means the election was already held; an answer of the
+        # suspected master itself means it is alive (only its heartbeats were late)
+        suspected_master_alive = False
+        for view in peer_views.values():
+            if (view["lease_valid"] and view["master_id"] is not None
+                    and (view["master_id"] != suspected_master_id or view["network_id"] == suspected_master_id)):
+                if self.__accept_master(view["term"], view["master_id"]) and view["network_id"] == suspected_master_id:
+                    suspected_master_alive = True
+        if suspected_master_alive or self.__has_live_master(suspected_master_id):
+            metrics.inc("elections_skipped_total")
+            logger.info("Leader election skipped - master: %s", self.__master_id)
+            return
+
+        term = max([self.__term] + [view["term"] for view in peer_views.values()]) + 1
+        master_id = min([self.__network_id] + [view["network_id"] for view in peer_views.values()])
+        self.__accept_master(term, master_id)
+        answers = self.__contact_peers([peer_name for peer_name in peer_names if peer_name in peer_views],
+                                       "announce_master", term, master_id)
+        for peer_term, peer_master_id in answers.values():  # Peers may know a newer master (concurrent election)
+            if peer_master_id is not None:
+                self.__accept_master(peer_term, peer_master_id)
+
+        logger.info("Leader election ended - contenders: %d", len(peer_views) + 1)
+
+    def __lease_loop(self):
+        # The master renews its lease on the followers at every heartbeat; followers whose lease expired start an
+        # election, after a delay growing with their net-ID: usually the node which will be elected starts it, and
+        # the others get its announcement before their own delay ends
+        while True:
+            time.sleep(MASTER_HEARTBEAT_SECONDS)
+            if self.__network_id is None or self.__master_id is None:  # Not started yet
+                continue
+            try:
+                if self.__is_master:
+                    # The peer list is at most MASTER_PEERS_LOOKUP_TTL_SECONDS old, so new peers get a renewal before
+                    # their first lease expires
+                    answers = self.__contact_peers(self.__peers(max_age=MASTER_PEERS_LOOKUP_TTL_SECONDS).keys(),
+                                                   "announce_master",
+                                                   self.__term, self.__network_id)
+                    for peer_term, peer_master_id in answers.values():  # Steps down if a peer knows a newer master
+                        if peer_master_id is not None:
+                            self.__accept_master(peer_term, peer_master_id)
+                elif time.monotonic() > self.__lease_until:
+                    time.sleep(self.__election_rank(self.__master_id) * ELECTION_RANK_DELAY_SECONDS)
+                    if time.monotonic() > self.__lease_until:
+                        metrics.inc("lease_expirations_total")
+                        logger.warning("Master lease expired")
+                        self.initiate_leader_election(suspected_master_id=self.__master_id)
+                elif self.__replica_logger_now() is None:  # Not replicating (new master, or dropped by the master)
+                    self.__register_replica()
+            except Exception as error:  # The lease thread must survive failed lookups (e.g. unavailable ns)
+                logger.error("Lease renewal failed: %s", error)
+
+    def __register_replica(self):
+        # Registrations are spaced by the staleness bound, the master may just have nothing to replicate yet
+        if self.__replica_registered_at is not None \
+                and time.monotonic() - self.__replica_registered_at < REPLICA_MAX_STALENESS_SECONDS:
+            return
+        self.__replica_registered_at = time.monotonic()
+        try:
+            self.__master_proxy().register_replica(self.__network_id)
+        except (CommunicationError, ProtocolError):
+            logger.error("Failed to register as replica of the master node")
+
+    def __replica_logger_now(self):
+        # Current logger time estimated from the last delta of the master, None if the replica is too stale
+        replica_clock = self.__replica_clock
+        if replica_clock is None or time.monotonic() - replica_clock[1] > REPLICA_MAX_STALENESS_SECONDS:
+            return None
+        return replica_clock[0] + timedelta(seconds=time.monotonic() - replica_clock[1])
 
-    @pyro.oneway
     @pyro.expose
-    def initiate_leader_election(self, initiator=False, startup=False):
-        if not initiator and startup:  # Ensures that every node currently online is visible on the ns
-            time.sleep(ELECTION_INITIATION_DELAY_SECONDS)
+    def register_replica(self, network_id):
+        """
+        Slave nodes can call this method on the master to get its cache replicated (see include/replication.py)
+        :param network_id: Net-ID of the slave
+        """
+        if not self.__is_master:
+            raise ProtocolError
 
-        print(f" ================ LEADER ELECTION INITIATED -- INITIATOR: {initiator}")
-        self.__master_id = None
-        self.__is_master = False
-        contenders_id_list = list([self.__network_id])
-
-        # Get a list of all analogous digital twins
-        peer_meta = pyro.locate_ns().yplookup(meta_all=[
-            "DT:GH_block",
-            "greenhouse:" + self.__greenhouse_id,
-            "block:" + self.__block_id
-        ]
-        )
-        peer_list = list(peer_meta.keys())
-        print(peer_list)
-        # For each peer, try to contact it to get its network ID
-        for proxy_name in peer_list:
-            proxy_is_self = False
-            # Check you are not trying to contact yourself
-            for meta in peer_meta[proxy_name][1]:
-                if meta == NETWORK_ID_METADATA_KEY + self.__network_id:
-                    proxy_is_self = True
-
-            if not proxy_is_self:
-                with pyro.Proxy(proxy_name) as proxy:
-                    proxy._pyroMaxRetries = ELECTION_CONTACT_RETRY_ATTEMPTS  # Set the number of retries in case of
-                    peer_id = None                                           # communication failure
-
-                    try:
-                        peer_id = proxy.get_network_id()
-                        if initiator:  # If the initiator is executing it will also activate the other nodes
-                            proxy.initiate_leader_election(startup=startup)
-                    except CommunicationError:
-                        print(f"ERROR: contacted unavailable peer during leader election - {proxy_name}")
-
-                    if peer_id is not None:  # If the peer was contacted successfully, add its net-ID to the list
-                        contenders_id_list.append(peer_id)
-
-        self.__master_id = min(contenders_id_list)  # Set the master as the contender with the smallest net-ID
-        if self.__master_id == self.__network_id:  # If the master net-ID is the same as the node executing, set the
-            self.__is_master = True  # is_master flag to True
-
-        print(contenders_id_list)
-        print(f" ================ LEADER ELECTION ENDED -- MASTER: {self.__is_master}\n"
-              f" ================ MASTER_ID: {self.__master_id}\n")
+        logger.info("New replica: %s", network_id)
+        self.__replicator.add(self.__registered_name([NETWORK_ID_METADATA_KEY + str(network_id)]))
+
+    @pyro.expose
+    def apply_cache_delta(self, master_id, remote_current_timestamp, feeds):
+        """
+        Remote method called by the master to replicate its cache
+        :param master_id: Net-ID of the master sending the delta
+        :param remote_current_timestamp: Logger time of the delta (epoch-ns)
+        :param feeds: Dictionary of the delta of each feed: new entries (columnar format), start of the interval they
+                      cover, covered interval bounds (epoch-ns) and (epoch, seq) mark of the newest entry (or None)
+        :return: False if this node doesn't follow the sender (it won't be sent further deltas)
+        """
+        if self.__is_master or master_id != self.__master_id:
+            return False
+
+        for feed_id, feed_delta in feeds.items():
+            self.__lock.acquire()
+            feed_cache = self.__cache.setdefault(feed_cache_key(feed_id), FeedCache())
+            self.__lock.release()
+
+            feed_cache.merge(log_to_dataframe(feed_delta["log"]),
+                             pd.Timestamp(feed_delta["interval_from"]),
+                             pd.Timestamp(feed_delta["covered_to"]),
+                             feed_delta.get("seq_mark")  # Missing from the deltas of older masters
+                             )
+            feed_cache.evict_before(pd.Timestamp(feed_delta["covered_from"]))  # Eviction watermark of the master
+
+        self.__replica_clock = (pd.Timestamp(remote_current_timestamp), time.monotonic())
+        return True
 
     # TODO: FIX THE CODE REPETITION ISSUE IN THIS METHOD
-    def handle_query_forwarding(self, proxy, feed_id, days=0.0, hours=0.0, minutes=0.0, seconds=0.0):
+    def handle_query_forwarding(self, proxy, queries):
+        """
+        Forwards a batch of queries to the master (or to the loggers, if this node becomes master in the meantime)
+        :param proxy: Proxy of the master node
+        :param queries: List of (feed_id, seconds) pairs
+        :return: Dictionary of the received logs (columnar format) of each feed
+        """
         error = None
         received_log = None
         for i in range(QUERY_FORWARDING_MAX_ATTEMPTS):
             try:
-                if error is not None and self.__is_master:          # In case the node gets elected as Master
-                    received_log = proxy.get_sensor_log(self.__id,  # contact a logger directly
-                                                        feed_id,
-                                                        days=days,
-                                                        hours=hours,
-                                                        minutes=minutes,
-                                                        seconds=seconds
-                                                        )
+                if error is not None and self.__is_master:  # In case the node gets elected as Master
+                    # contact the loggers directly
+                    answers = self.__query_loggers([(feed_id, since, None) for feed_id, since in queries])
+                    received_log = {feed_id: answer["log"] for feed_id, answer in answers.items()}
                 else:
-                    received_log = proxy.forward_query(feed_id, days=days, hours=hours, minutes=minutes, seconds=seconds)
+                    received_log = proxy.forward_batch_query(queries, columnar=True)
                 break
             except ProtocolError as e:
-                print(" >> ERROR: Tried forwarding to another SLAVE node")
+                metrics.inc("forwarding_retries_total")
+                logger.warning("Tried forwarding to another slave node")
                 self.lookup_master()
-                if self.__is_master:  # In case the contacted node was actually a slave, lookup the real master
-                    datalogger_names = list(pyro.locate_ns().yplookup(meta_all=["datalogger"]).keys())
-                    logger_proxy_name = datalogger_names[randint(0, len(datalogger_names) - 1)]
-                    proxy = pyro.Proxy(logger_proxy_name)
-                else:
-                    time.sleep(QUERY_FORWARDING_REDIRECTION_DELAY)
-                    proxy = pyro.Proxy("PYROMETA:" + NETWORK_ID_METADATA_KEY + self.__master_id)
+                if not self.__is_master:  # In case the contacted node was actually a slave, lookup the real master
+                    proxy = self.__master_proxy()
                 error = e
             except CommunicationError as e:  # In case the master goes down, initiate a new leader election
-                print(" >> ERROR: Tried forwarding to unavailable MASTER node")
-                self.initiate_leader_election(initiator=True)
-                if self.__is_master:
-                    datalogger_names = list(pyro.locate_ns().yplookup(meta_all=["datalogger"]).keys())
-                    logger_proxy_name = datalogger_names[randint(0, len(datalogger_names) - 1)]
-                    proxy = pyro.Proxy(logger_proxy_name)
-                else:
-                    time.sleep(QUERY_FORWARDING_REDIRECTION_DELAY)
-                    proxy = pyro.Proxy("PYROMETA:" + NETWORK_ID_METADATA_KEY + self.__master_id)
+                metrics.inc("forwarding_retries_total")
+                logger.warning("Tried forwarding to unavailable master node")
+                self.__registry.invalidate(proxy._pyroUri)
+                self.initiate_leader_election(suspected_master_id=self.__master_id)
+                if not self.__is_master:
+                    proxy = self.__master_proxy()
                 error = e
 
         if error is not None and received_log is None:
+            metrics.inc("forwarding_failures_total")
             raise error
 
         return received_log
 
+    @pyro.expose
+    def probe(self):
+        """
+        Remote method used by the peers looking up the master or holding an election
+        :return: Dictionary with the net-ID of this node, its term, its master and whether the master is live (its
+                 lease isn't expired)
+        """
+        with self.__election_lock:
+            return {"network_id": self.__network_id,
+                    "term": self.__term,
+                    "master_id": self.__master_id,
+                    "lease_valid": self.__has_live_master()
+                    }
+
+    @pyro.expose
+    def announce_master(self, term, master_id):
+        """
+        Remote method called by the elected master (and by the master at every heartbeat, renewing its lease)
+        :param term: Term of the master
+        :param master_id: Net-ID of the master
+        :return: The term and the master known by this node after the announcement
+        """
+        self.__accept_master(term, master_id)
+        with self.__election_lock:
+            return self.__term, self.__master_id
+
     @pyro.expose
     def ping(self):
         return True
@@ -189,7 +483,7 @@ class GHBlockDT(object):
         return self.__master_id
 
     @pyro.expose
-    def forward_query(self, feed_id, days=0.0, hours=0.0, minutes=0.0, seconds=0.0):
+    def forward_query(self, feed_id, days=0.0, hours=0.0, minutes=0.0, seconds=0.0, columnar=False):
         """
         Slave nodes can call this method on the master to forward a query to it, taking advantage of the master
         cache
@@ -198,153 +492,346 @@ class GHBlockDT(object):
         :param hours:
         :param minutes:
         :param seconds:
+        :param columnar: If True the log is returned in the columnar format (see include/log_format.py)
         :return:
         """
         if not self.__is_master:
             raise ProtocolError
 
-        print(" -- EXECUTING QUERY FOR A SLAVE NODE")
-        return self.get_sensor_log(feed_id, days=days, hours=hours, minutes=minutes, seconds=seconds)
-
-    def query_discard_cache(self, proxy, feed_id, days, hours, minutes, seconds):
-        print("START QUERY - DISCARD")
-        if self.__is_master:
-            print(" >> DIRECT QUERY")
-            # TODO: handle the case with unavailable logger
-            received_log = proxy.get_sensor_log(self.__id,
-                                                feed_id,
-                                                days=days,
-                                                hours=hours,
-                                                minutes=minutes,
-                                                seconds=seconds
-                                                )
-        else:
-            print(" >> FORWARDING QUERY TO MASTER")
-            received_log = self.handle_query_forwarding(proxy,
-                                                        feed_id,
-                                                        days=days,
-                                                        hours=hours,
-                                                        minutes=minutes,
-                                                        seconds=seconds
-                                                        )
-
-        self.__cache[feed_id] = dict()
-        received_dataframe = pd.DataFrame(received_log, columns=SENSOR_LOGS_COLUMNS)
-        # Convert the timestamp column from string (iso format) to datetime
-        received_dataframe = self.__iso_format_col_to_datetime(received_dataframe,
-                                                               SENSOR_LOGS_TIMESTAMP_COLUMN
-                                                               )
-        self.__lock.acquire()
-        self.__cache[feed_id]["values"] = received_dataframe
-        self.__lock.release()
-
-        print(" >> DISCARDED CACHED DATA!")
-        return received_dataframe
-
-    def query_keep_cache(self, cached_log, proxy, feed_id, current_timestamp, remote_current_timestamp, delta):
-        print("START QUERY - REUSE")
-
-        # Tries to get the data logs successive to last query (minus a second for possible discrepancies)
-        query_timestamp = cached_log["update_timestamp"] - cached_log["relative_delta"] - timedelta(seconds=1)
-        if self.__is_master:
-            print(" >> DIRECT QUERY")
-            received_log = proxy.get_sensor_log_till_timestamp(self.__id,
-                                                               feed_id,
-                                                               query_timestamp
-                                                               )
-        else:
-            print(" >> FORWARDING QUERY TO MASTER")
-            query_delta = current_timestamp - query_timestamp
-            received_log = self.handle_query_forwarding(proxy,
-                                                        feed_id,
-                                                        days=query_delta.days,
-                                                        seconds=query_delta.seconds + (query_delta.microseconds
-                                                                                       / int(1e+6))
-                                                        )
-
-        # Turn the data into a dataframe and convert the timestamp column from string (iso format) to datetime
-        received_dataframe = self.__iso_format_col_to_datetime(pd.DataFrame(received_log,
-                                                                            columns=SENSOR_LOGS_COLUMNS
-                                                                            ),
-                                                               SENSOR_LOGS_TIMESTAMP_COLUMN
-                                                               )
-
-        self.__lock.acquire()
-        # Concatenate the newly obtained data with the previously existing cached data
-        self.__cache[feed_id]["values"] = pd.concat([cached_log["values"],
-                                                     received_dataframe
-                                                     ], ignore_index=True).drop_duplicates(ignore_index=True)
-
-        # Get the current time from the logger in order to give back an accurate timeslice
-        mask = self.__cache[feed_id]["values"][SENSOR_LOGS_TIMESTAMP_COLUMN] >= remote_current_timestamp - delta
-        ret = self.__cache[feed_id]["values"][mask]
-        self.__lock.release()
-
-        print(" >> REUSED CACHED DATA!")
-        return ret
+        metrics.inc("slave_queries_total")
+        logger.debug("Executing query for a slave node")
+        return self.get_sensor_log(feed_id,
+                                   days=days,
+                                   hours=hours,
+                                   minutes=minutes,
+                                   seconds=seconds,
+                                   columnar=columnar
+                                   )
 
     @pyro.expose
-    def get_sensor_log(self, feed_id, days=0.0, hours=0.0, minutes=0.0, seconds=0.0):
-        datalogger_names = list(pyro.locate_ns().yplookup(meta_all=["datalogger"]).keys())
+    def forward_batch_query(self, queries, columnar=False):
+        """
+        Slave nodes can call this method on the master to forward a batch of queries to it, taking advantage of the
+        master cache
+        :param queries: List of (feed_id, seconds) pairs
+        :param columnar: If True the logs are returned in the columnar format (see include/log_format.py)
+        :return: Dictionary of the log entries of each requested feed
+        """
+        if not self.__is_master:
+            raise ProtocolError
 
-        logger_proxy_name = datalogger_names[randint(0, len(datalogger_names) - 1)]
+        metrics.inc("slave_queries_total")
+        logger.debug("Executing batch query for a slave node")
+        return self.get_sensor_logs(queries, columnar=columnar)
 
-        current_timestamp = datetime.now()
-        delta = timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
-        cache_threshold = current_timestamp - delta
-        cached_log = self.__cache.get(feed_id)
-        log_timestamps = cached_log["values"][SENSOR_LOGS_TIMESTAMP_COLUMN] if cached_log is not None else None
+    def query_logs(self, proxy, fetch_from, remote_current_timestamp, seq_marks=None):
+        """
+        Retrieves the entries of many feeds, each one newer than its own timestamp, with a single call to each logger
+        owning some of them (master) or to the master (slave).
+        The master can also give the (epoch, seq) pair of the newest entry it has for some feeds: their loggers then
+        only send the following entries, if they still have them in memory (see DataLogger.get_sensor_logs_since_batch)
+        :param proxy: Proxy of the master node (slave), unused by the master
+        :param fetch_from: Dictionary of the oldest timestamp to retrieve (logger time) for each feed
+        :param remote_current_timestamp: Current time on the logger
+        :param seq_marks: Dictionary of the (epoch, seq) pair of the newest known entry of some feeds (master only)
+        :return: Dictionary of the dataframe containing the retrieved entries, the (epoch, seq) pair of the newest one
+                 (None if unknown) and whether they only are the entries following the known one, for each feed
+        """
+        if self.__is_master:
+            logger.debug("Direct query")
+            seq_marks = seq_marks if seq_marks is not None else dict()
+            with metrics.timer("logger_query_seconds"):
+                answers = self.__query_loggers([(feed_id, feed_fetch_from.to_pydatetime(), seq_marks.get(feed_id))
+                                                for feed_id, feed_fetch_from in fetch_from.items()])
+            return {feed_id: (log_to_dataframe(answers[feed_id]["log"]),
+                              tuple(answers[feed_id]["seq"]),
+                              answers[feed_id]["delta"])
+                    for feed_id in fetch_from.keys()}
+
+        logger.debug("Forwarding query to master")
+        with metrics.timer("forwarded_query_seconds"):
+            received_logs = self.handle_query_forwarding(proxy,
+                                                         [(feed_id, (remote_current_timestamp
+                                                                     - feed_fetch_from).total_seconds())
+                                                          for feed_id, feed_fetch_from in fetch_from.items()]
+                                                         )
+
+        return {feed_id: (log_to_dataframe(received_logs[feed_id]), None, False) for feed_id in fetch_from.keys()}
+
+    def __get_logger_time(self):
+        local_before = pd.Timestamp.now()
+        remote_current_timestamp = pd.Timestamp(datetime.fromisoformat(
+            self.__balancer.call(self.__logger_names(), lambda proxy: proxy.get_current_time())))
+        if self.__tail is not None:  # Every logger time reading refines the clock offset of the tail
+            self.__tail.update_clock_offset(remote_current_timestamp, local_before, pd.Timestamp.now())
+        return remote_current_timestamp
+
+    def __covered(self, feed_id, start, covered_until):
+        # True if the cache of a feed covers an interval starting at start and reaching at least covered_until
+        feed_cache = self.__cache.get(feed_cache_key(feed_id))
+        return feed_cache is not None and feed_cache.covers(start) and feed_cache.covered_to >= covered_until
+
+    def refresh_feed_caches(self, windows):
+        """
+        Brings the caches of many feeds up to date, each one for a time-window ending at the current logger time
+        :param windows: Dictionary of the length of the time-window in seconds for each feed
+        :return: The current time on the logger (end of the refreshed windows)
+        """
+        if self.__tail is not None:
+            # With a live MQTT tail, the caches reaching the start of the tail are complete up to now: if they also
+            # cover the windows nothing has to be retrieved
+            tail_remote_timestamp = self.__tail.logger_now()
+            complete_since = self.__tail.complete_since()
+            if complete_since is not None and all(
+                    self.__covered(feed_id, tail_remote_timestamp - timedelta(seconds=window_seconds), complete_since)
+                    for feed_id, window_seconds in windows.items()):
+                metrics.inc("cache_tail_hits_total")
+                logger.debug("Live data from the MQTT tail")
+                return tail_remote_timestamp
+
+        if not self.__is_master:
+            # Slaves answer the reads with the cache replicated by the master, as long as it is recent enough and
+            # covers the windows; otherwise the query is forwarded to the master as usual
+            replica_remote_timestamp = self.__replica_logger_now()
+            if replica_remote_timestamp is not None and all(
+                    self.__covered(feed_id,
+                                   replica_remote_timestamp - timedelta(seconds=window_seconds),
+                                   replica_remote_timestamp - timedelta(seconds=REPLICA_MAX_STALENESS_SECONDS))
+                    for feed_id, window_seconds in windows.items()):
+                metrics.inc("cache_replica_hits_total")
+                logger.debug("Data from the replicated cache")
+                return replica_remote_timestamp
 
         # Getting the current time on the server
         try:
-            logger_proxy = pyro.Proxy(logger_proxy_name)
-            remote_current_timestamp = datetime.fromisoformat(logger_proxy.get_current_time())
+            try:
+                remote_current_timestamp = self.__get_logger_time()
+            except CommunicationError:  # The pooled connection may be stale (it was rebuilt): try once more
+                remote_current_timestamp = self.__get_logger_time()
         except (ValueError, CommunicationError):
-            print("ERROR: Failed to reach the logger")
+            logger.error("Failed to reach the logger")
             raise CommunicationError
 
-        if cached_log is not None and type(log_timestamps.min()) != float:
-            remote_update_timestamp = (cached_log["update_timestamp"] - cached_log["relative_delta"])
+        proxy = None if self.__is_master else self.__master_proxy()
+
+        feed_caches = dict()
+        fetch_from = dict()
+        seq_marks = dict()
+        for feed_id, window_seconds in windows.items():
+            window_start = remote_current_timestamp - timedelta(seconds=window_seconds)
+
+            self.__lock.acquire()
+            feed_caches[feed_id] = self.__cache.setdefault(feed_cache_key(feed_id), FeedCache())
+            self.__lock.release()
+
+            if feed_caches[feed_id].covers(window_start):
+                # The cache covers the older end of the time-window: just ask for the entries after the covered
+                # interval (with a small overlap, for entries timestamped before the last query but stored after it)
+                fetch_from[feed_id] = max(window_start,
+                                          feed_caches[feed_id].covered_to
+                                          - timedelta(seconds=CACHE_REFRESH_OVERLAP_SECONDS))
+                # The master retrieved the newest entries from the loggers: they can just send the following ones
+                # (not with a live MQTT tail, whose entries the loggers don't know of)
+                if self.__is_master and self.__tail is None and feed_caches[feed_id].seq_mark is not None:
+                    seq_marks[feed_id] = feed_caches[feed_id].seq_mark
+                metrics.inc("cache_reuses_total")
+                logger.debug("Reusing cached data - %s", feed_id)
+            else:  # Otherwise ask for the whole time-window (the cached entries in it are replaced)
+                fetch_from[feed_id] = window_start
+                metrics.inc("cache_misses_total")
+                logger.debug("Cache miss - %s", feed_id)
+
+        received_logs = self.query_logs(proxy, fetch_from, remote_current_timestamp, seq_marks)
+        for feed_id, (received_dataframe, seq_mark, delta) in received_logs.items():
+            if delta:
+                if feed_caches[feed_id].append_delta(received_dataframe, remote_current_timestamp, seq_marks[feed_id],
+                                                     seq_mark):
+                    metrics.inc("cache_deltas_applied_total")
+                else:  # The cache changed since its mark was read (a concurrent refresh already brought it up to date)
+                    metrics.inc("cache_deltas_discarded_total")
+                continue
+            if feed_id in seq_marks:  # The entries aren't available by sequence number any more
+                metrics.inc("cache_delta_fallbacks_total")
+            feed_caches[feed_id].merge(received_dataframe, fetch_from[feed_id], remote_current_timestamp, seq_mark)
+
+        return remote_current_timestamp
+
+    def __refresh_feeds(self, windows):
+        # Concurrent refreshes of the same feeds with similar windows (same buckets) wait for a single refresh of the
+        # caches, which covers the whole buckets; then each caller extracts its own windows.
+        # While the cache is warming up, refreshes wait for it first (they then only fetch the newest entries)
+        self.__single_flight.wait("warm-up", timeout=CACHE_WARMUP_MAX_WAIT_SECONDS)
+        refresh_windows = {feed_id: (ceil(window_seconds / SINGLE_FLIGHT_WINDOW_BUCKET_SECONDS)
+                                     * SINGLE_FLIGHT_WINDOW_BUCKET_SECONDS)
+                           for feed_id, window_seconds in windows.items()}
+        return self.__single_flight.do(tuple(sorted(refresh_windows.items())),
+                                       self.refresh_feed_caches,
+                                       refresh_windows
+                                       )
+
+    def __refresh_replicated_feeds(self, feed_ids):
+        return self.__refresh_feeds({feed_id: REPLICATION_REFRESH_WINDOW_SECONDS for feed_id in feed_ids})
+
+    def __refresh_subscribed_feeds(self, feed_ids):
+        return self.__refresh_feeds({feed_id: SUBSCRIPTION_REFRESH_WINDOW_SECONDS for feed_id in feed_ids})
+
+    def __cached_entries_after(self, feed_id, timestamp):
+        feed_cache = self.__cache.get(feed_cache_key(feed_id))
+        if feed_cache is None:  # Evicted since the refresh: the entries are pushed after the next one
+            return pd.DataFrame([], columns=SENSOR_LOGS_COLUMNS)
+        cached_entries = feed_cache.window(timestamp)
+        return cached_entries[cached_entries[SENSOR_LOGS_TIMESTAMP_COLUMN] > timestamp]
+
+    def __read_windows(self, windows):
+        """
+        Refreshes the caches of many feeds and extracts their time-windows. The feeds evicted between the refresh and
+        the read (see include/cache_eviction.py) are refreshed again, the last attempt returns whatever is cached
+        :param windows: Dictionary of the time-window (timedelta) of each feed
+        :return: Dictionary of the dataframes containing the entries of each window
+        """
+        logs = dict()
+        for attempt in range(CACHE_READ_MAX_ATTEMPTS):
+            last_attempt = attempt == CACHE_READ_MAX_ATTEMPTS - 1
+            remote_current_timestamp = self.__refresh_feeds({feed_id: window.total_seconds()
+                                                             for feed_id, window in windows.items()})
+            for feed_id, window in list(windows.items()):
+                feed_cache = self.__cache.get(feed_cache_key(feed_id))
+                log_df = (feed_cache.window(remote_current_timestamp - window, covered_only=not last_attempt)
+                          if feed_cache is not None else None)
+                if log_df is not None or last_attempt:
+                    logs[feed_id] = log_df if log_df is not None else pd.DataFrame([], columns=SENSOR_LOGS_COLUMNS)
+                    del windows[feed_id]
+            if len(windows) == 0:
+                break
+            metrics.inc("cache_evicted_reads_total")
+        return logs
 
-            # THESE CONDITIONS WILL BE USED IN THE FOLLOWING IF STATEMENT
+    @pyro.expose
+    def get_sensor_log(self, feed_id, days=0.0, hours=0.0, minutes=0.0, seconds=0.0, columnar=False, aggregate=None):
+        window = timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
 
-            # If the cache threshold is older than the oldest cached data I discard the cached data and query
-            # directly (exception to this rule below)
-            threshold_older_than_all_cache = (remote_update_timestamp - log_timestamps.min() <=
-                                              cached_log["update_timestamp"] - cache_threshold)
-            # UNLESS the last query requested data older or as old as the current request (the threshold is older
-            # than the oldest cached data because there is no data in that time period)
-            last_cache_threshold_older_than_current = (cached_log["last_query_cache_threshold"] <= cache_threshold)
-        else:  # The following values are just standard assignments that will never be truly used
-            threshold_older_than_all_cache = True
-            last_cache_threshold_older_than_current = False
+        return self.get_sensor_logs([(feed_id, window.total_seconds())],
+                                    columnar=columnar,
+                                    aggregate=aggregate
+                                    )[str(feed_id)]
 
-        # If either there are no cached logs, the cached logs are too old, or the oldest cached log
-        # is more recent than the required threshold, just ask for the latest values in the requested time-window
-        if self.__is_master:
-            proxy = logger_proxy
-        else:
-            proxy = pyro.Proxy("PYROMETA:" + NETWORK_ID_METADATA_KEY + self.__master_id)
-            del logger_proxy
+    @pyro.expose
+    def get_sensor_logs(self, queries, columnar=False, aggregate=None):
+        """
+        Remote method to retrieve many feeds with a single call: the caches are refreshed together, with a single
+        query to the logger (master) or to the master (slave) for the entries they don't cover
+        :param queries: List of (feed_id, seconds) pairs
+        :param columnar: If True the logs are returned in the columnar format (see include/log_format.py)
+        :param aggregate: Aggregation computed on the cached entries before sending them (see include/downsampling.py)
+        :return: Dictionary of the log entries of each requested feed
+        """
+        metrics.inc("queries_total")
+        with metrics.timer("query_seconds"):
+            windows = {str(feed_id): timedelta(seconds=float(seconds)) for feed_id, seconds in queries}
+
+            return {feed_id: format_log(downsample(log_df, aggregate), columnar=columnar)
+                    for feed_id, log_df in self.__read_windows(windows).items()}
 
-        if (cached_log is None
-                or cached_log["update_timestamp"] <= cache_threshold
-                or type(log_timestamps.min()) == float  # The function may return float NaN if the cache is empty
-                or (threshold_older_than_all_cache and not last_cache_threshold_older_than_current)):
+    @pyro.expose
+    def subscribe(self, feed_id, callback_uri, since=None, forwarded=False):
+        """
+        Remote method to subscribe to the new entries of a feed, which are pushed to a callback object (exposing a
+        oneway push_sensor_log(subscription_id, feed_id, log) method, the log being in the columnar format).
+        Slave nodes forward the subscription to the master, which refreshes each subscribed feed once for all the
+        subscribers (the slave serves it itself only if the master can't be reached)
+        :param feed_id: Identifier of the kind of sensor feed
+        :param callback_uri: URI of the callback object
+        :param since: Timestamp of the newest entry the subscriber already has (logger time)
+        :param forwarded: True if the subscription was forwarded by another node
+        :return: Identifier of the subscription
+        """
+        if not self.__is_master and not forwarded:
+            try:
+                return self.__master_proxy().subscribe(feed_id, callback_uri, since=since, forwarded=True)
+            except CommunicationError:
+                logger.error("Failed to forward the subscription to the master node, serving it locally")
 
-            ret = self.query_discard_cache(proxy, feed_id, days, hours, minutes, seconds)
+        logger.info("New subscription to %s", feed_id)
+        return self.__subscriptions.add(feed_id, callback_uri, since=since)
 
-        else:  # If the cached values cover the older end of the time-window just ask for the remaining values
-            ret = self.query_keep_cache(cached_log, proxy, feed_id, current_timestamp, remote_current_timestamp, delta)
+    @pyro.expose
+    def unsubscribe(self, subscription_id, forwarded=False):
+        """
+        Remote method to cancel a subscription (see subscribe)
+        :param subscription_id: Identifier of the subscription
+        :param forwarded: True if the request was forwarded by another node
+        :return: True if the subscription existed
+        """
+        if self.__subscriptions.remove(subscription_id):
+            return True
+
+        if not self.__is_master and not forwarded:
+            try:
+                return self.__master_proxy().unsubscribe(subscription_id, forwarded=True)
+            except CommunicationError:
+                logger.error("Failed to forward the unsubscription to the master node")
+        return False
+
+    @pyro.expose
+    def get_replication_stats(self):
+        """
+        Remote method to retrieve the state of the cache replication
+        :return: Dictionary with the amount of replicas (master) and the age in seconds of the replicated cache (slave,
+                 None if it is too stale to be used)
+        """
+        replica_clock = self.__replica_clock
+        return {"replicas": self.__replicator.replica_amount(),
+                "replica_age_seconds": (time.monotonic() - replica_clock[1]
+                                        if replica_clock is not None and self.__replica_logger_now() is not None
+                                        else None)
+                }
+
+    @pyro.expose
+    def get_tail_stats(self):
+        """
+        Remote method to retrieve the counters of the MQTT tail (received, appended and ignored entries)
+        :return: Dictionary of the tail counters, None if the tail is disabled
+        """
+        return self.__tail.get_stats() if self.__tail is not None else None
+
+    @pyro.expose
+    def get_balancer_stats(self):
+        """
+        Remote method to retrieve the counters of the logger choice (calls, failovers, hedged calls and hedge wins)
+        :return: Dictionary of the balancer counters
+        """
+        return self.__balancer.get_stats()
+
+    @pyro.expose
+    def get_coalescing_stats(self):
+        """
+        Remote method to retrieve the counters of the query coalescing (executed and coalesced cache refreshes)
+        :return: Dictionary of the coalescing counters
+        """
+        return self.__single_flight.get_stats()
+
+    @pyro.expose
+    def get_cache_size(self):
+        """
+        Remote method to retrieve the size of the cache
+        :return: Dictionary with the memory used by the cache (bytes), its budget, the amount of cached feeds and
+                 entries, and the size of each feed (see include/cache_eviction.py)
+        """
+        return self.__evictor.get_size()
+
+    @pyro.expose
+    def get_metrics(self):
+        """
+        Remote method to retrieve the metrics of the twin: counters (cache decisions, forwarding retries, elections,
+        ...), gauges (role, cache size, ...) and latency histograms (queries, logger calls, elections, ...)
+        :return: Dictionary of the metrics (see include/metrics.py)
+        """
+        return metrics.snapshot()
 
-        # Update the "last update" timestamp
-        self.__cache[feed_id]["update_timestamp"] = current_timestamp
-        # Update the time delta between the local time and server time
-        self.__cache[feed_id]["relative_delta"] = current_timestamp - remote_current_timestamp
-        # Update the requested time delta of the last executed query
-        self.__cache[feed_id]["last_query_cache_threshold"] = cache_threshold
 
-        return ret.values.tolist()
+logging.basicConfig(level=LOGGING_LEVEL, format=LOGGING_FORMAT)
+if METRICS_HTTP_PORT is not None:
+    metrics.serve(METRICS_HTTP_HOST, METRICS_HTTP_PORT)
 
 daemon = pyro.Daemon()
 ns = pyro.locate_ns()
@@ -356,8 +843,11 @@ net_id = str(uri).split('_')[1].split('@')[0]
 gh_block_obj.set_network_id(network_id=net_id)
 GH_BLOCK_METADATA.add(NETWORK_ID_METADATA_KEY + net_id)
 
-gh_block_obj.lookup_master(startup=True)
+# The twin is registered (and answers) before looking up the master, so that the master heartbeats it before it
+# starts trusting a lease
+request_loop = threading.Thread(target=daemon.requestLoop, daemon=True)
+request_loop.start()
 ns.register(str(uri), uri, metadata=GH_BLOCK_METADATA)
-print(f"Greenhouse block {uri}: READY")
-print(f"Network ID: {net_id}\n")
-daemon.requestLoop()
+gh_block_obj.lookup_master()
+logger.info("Greenhouse block %s: READY - network ID: %s", uri, net_id)
+request_loop.join()
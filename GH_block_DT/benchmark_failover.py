@@ -0,0 +1,114 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import Pyro5.api as pyro
+from Pyro5 import nameserver
+from Pyro5.errors import CommunicationError
+
+from include.configuration import GH_BLOCK_METADATA, NETWORK_ID_METADATA_KEY
+
+# Failover benchmark: a name server and N digital twin processes of the same block are started locally, then the
+# master is killed and the time until the survivors follow a new master is measured (first survivor and all of them).
+# The master is killed --runs times for each cluster size (a new twin replaces it after every run, so that every run
+# measures the same cluster size).
+# Usage (from the GH_block_DT directory): python benchmark_failover.py [--replicas 3 10 30] [--runs R]
+
+
+def _registrations(ns):
+    # Network ID of every registered twin
+    return {name: meta[len(NETWORK_ID_METADATA_KEY):]
+            for name, (_, metadata) in ns.yplookup(meta_all=list(GH_BLOCK_METADATA)).items()
+            for meta in metadata if meta.startswith(NETWORK_ID_METADATA_KEY)}
+
+
+def _master_ids(names):
+    master_ids = dict()
+    for name in names:
+        try:
+            with pyro.Proxy(name) as proxy:
+                proxy._pyroTimeout = 0.5
+                master_ids[name] = proxy.get_master_id()
+        except CommunicationError:
+            master_ids[name] = None
+    return master_ids
+
+
+def _start_twins(ns, amount, env, processes):
+    # Twins are started one at a time, so that each registration can be mapped to its process (added to processes)
+    for _ in range(amount):
+        process = subprocess.Popen([sys.executable, "GH_block_DT.py"], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        while True:
+            new_names = set(_registrations(ns).keys()) - set(processes.keys())
+            if len(new_names) > 0:
+                processes[new_names.pop()] = process
+                break
+            if process.poll() is not None:
+                raise RuntimeError("digital twin process terminated during startup")
+            time.sleep(0.05)
+
+
+def _wait_agreement(names, excluded_master=None, timeout=30):
+    # Waits until every twin follows the same master (other than the excluded one), returning the time at which the
+    # first twin and all the twins followed it
+    start = time.perf_counter()
+    first = None
+    while time.perf_counter() - start < timeout:
+        master_ids = set(_master_ids(names).values())
+        new_master_ids = master_ids - {None, excluded_master}
+        if len(new_master_ids) > 0 and first is None:
+            first = time.perf_counter() - start
+        if len(master_ids) == 1 and len(new_master_ids) == 1:
+            return first, time.perf_counter() - start, new_master_ids.pop()
+        time.sleep(0.01)
+    raise RuntimeError("no agreement on a new master")
+
+
+def run(replicas, runs, ns_uri):
+    env = dict(os.environ, PYRO_NS_PORT=str(ns_uri.port))
+    ns = pyro.Proxy(ns_uri)
+    processes = dict()
+    try:
+        _start_twins(ns, replicas, env, processes)
+        _, _, master_id = _wait_agreement(list(processes.keys()))
+        results = list()
+        for _ in range(runs):
+            registrations = _registrations(ns)
+            master_name = [name for name, network_id in registrations.items() if network_id == master_id][0]
+            processes.pop(master_name).kill()  # Its registration stays on the ns, as after a crash
+            first, everyone, master_id = _wait_agreement(list(processes.keys()), excluded_master=master_id)
+            results.append((first, everyone))
+
+            ns.remove(master_name)  # The killed master is replaced before the next run
+            _start_twins(ns, 1, env, processes)
+            _, _, master_id = _wait_agreement(list(processes.keys()))
+    finally:
+        for process in processes.values():
+            process.kill()
+        for name in _registrations(ns).keys():
+            ns.remove(name)
+
+    first_ms, everyone_ms = np.array(results).T * 1000
+    return {"first_ms": float(np.median(first_ms)), "all_ms": float(np.median(everyone_ms)),
+            "max_all_ms": float(np.max(everyone_ms))}
+
+
+parser = argparse.ArgumentParser(description="Master failover benchmark")
+parser.add_argument("--replicas", type=int, nargs="+", default=[3, 10, 30])
+parser.add_argument("--runs", type=int, default=3)
+parser.add_argument("--ns-port", type=int, default=9190)
+args = parser.parse_args()
+
+ns_uri, ns_daemon, _ = nameserver.start_ns(host="localhost", port=args.ns_port, enableBroadcast=False)
+ns_thread = threading.Thread(target=ns_daemon.requestLoop, daemon=True)
+ns_thread.start()
+
+print(f"{'replicas':>8} {'first_ms':>10} {'all_ms':>10} {'max_all_ms':>11}")
+for replica_amount in args.replicas:
+    result = run(replica_amount, args.runs, ns_uri)
+    print(f"{replica_amount:>8} {result['first_ms']:>10.0f} {result['all_ms']:>10.0f} {result['max_all_ms']:>11.0f}")
+ns_daemon.shutdown()
@@ -0,0 +1,54 @@
+import argparse
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN
+from include.log_format import iso_format_col_to_datetime, encode_log_columnar, decode_log_columnar
+
+# Micro-benchmark of the conversion of received logs to dataframes: per-row datetime.fromisoformat (previous
+# implementation), vectorized pd.to_datetime on the iso strings and the columnar format (no parsing at all).
+# Usage (from the GH_block_DT directory): python benchmark_timestamp_parsing.py [--rows 10000 100000 1000000]
+
+
+def _received_rows(rows):
+    # Rows as they arrive through Pyro in the list format: float values and timestamps in iso format
+    timestamps = pd.date_range(end=datetime.now(), periods=rows, freq="1s") + pd.to_timedelta(np.arange(rows) % 1000,
+                                                                                            unit="us")
+    return [[value, timestamp.isoformat()] for value, timestamp in zip(np.random.normal(25, 1, rows), timestamps)]
+
+
+def _per_row(received_rows):
+    df = pd.DataFrame(received_rows, columns=SENSOR_LOGS_COLUMNS)
+    df[SENSOR_LOGS_TIMESTAMP_COLUMN] = df[SENSOR_LOGS_TIMESTAMP_COLUMN].apply(lambda x: datetime.fromisoformat(x))
+    return df
+
+
+def _vectorized(received_rows):
+    return iso_format_col_to_datetime(pd.DataFrame(received_rows, columns=SENSOR_LOGS_COLUMNS),
+                                      SENSOR_LOGS_TIMESTAMP_COLUMN
+                                      )
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser(description="Timestamp conversion micro-benchmark")
+parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+arguments = parser.parse_args()
+
+for row_amount in arguments.rows:
+    rows = _received_rows(row_amount)
+    encoded_log = encode_log_columnar(_vectorized(rows))
+
+    per_row_seconds = _timed(_per_row, rows)
+    vectorized_seconds = _timed(_vectorized, rows)
+    columnar_seconds = _timed(decode_log_columnar, encoded_log)
+
+    print(f"{row_amount:>8} rows: per-row {per_row_seconds * 1000:9.1f} ms | "
+          f"vectorized {vectorized_seconds * 1000:8.1f} ms ({per_row_seconds / vectorized_seconds:5.1f}x) | "
+          f"columnar {columnar_seconds * 1000:7.1f} ms ({per_row_seconds / columnar_seconds:6.1f}x)")
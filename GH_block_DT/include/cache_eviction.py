@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from include.configuration import CACHE_LOGS_TTL_HOURS, CACHE_MAX_BYTES, CACHE_FEED_MAX_BYTES, CACHE_MAX_FEEDS, \
+    CACHE_EVICTION_PERIOD_SECONDS
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEvictor(threading.Thread):
+
+    def __init__(self, cache, cache_lock, logs_ttl_hours=CACHE_LOGS_TTL_HOURS, max_bytes=CACHE_MAX_BYTES,
+                 feed_max_bytes=CACHE_FEED_MAX_BYTES, max_feeds=CACHE_MAX_FEEDS, period=CACHE_EVICTION_PERIOD_SECONDS):
+        """
+        Thread keeping the feed caches within their age and memory bounds, at every period:
+         - the entries older than the TTL are evicted from every feed
+         - the oldest entries of the feeds over the per-feed budget are evicted, until their newest ones fit in it
+         - while the cache is over the global budget (or holds too many feeds), the least recently read feeds are
+           dropped entirely
+        Memory is accounted as the size of the arrays allocated by each feed (see FeedCache.nbytes).
+        Dropped feeds are just fetched again by the next read, and readers never use a cache evicted after its
+        refresh (see FeedCache.window).
+        :param cache: Dictionary of the feed caches (feed_id: FeedCache)
+        :param cache_lock: Lock guarding the dictionary of the feed caches
+        :param logs_ttl_hours: Age of the oldest entries kept in hours
+        :param max_bytes: Memory budget of the whole cache in bytes
+        :param feed_max_bytes: Memory budget of each feed in bytes
+        :param max_feeds: Maximum amount of cached feeds
+        :param period: Time between two evictions in seconds
+        """
+        super().__init__(daemon=True)
+
+        self.__cache = cache
+        self.__cache_lock = cache_lock
+        self.__logs_ttl = timedelta(hours=logs_ttl_hours)
+        self.__max_bytes = max_bytes
+        self.__feed_max_bytes = min(feed_max_bytes, max_bytes)
+        self.__max_feeds = max_feeds
+        self.__period = period
+        self.__stop_event = threading.Event()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.join()
+
+    def __feeds(self):
+        with self.__cache_lock:
+            return list(self.__cache.items())
+
+    def evict(self):
+        """
+        Runs an eviction immediately
+        :return: Amount of evicted entries and of dropped feeds
+        """
+        threshold = datetime.now() - self.__logs_ttl
+        evicted_rows = 0
+        feeds = self.__feeds()
+        for _, feed_cache in feeds:
+            evicted_rows += feed_cache.evict_before(threshold)
+            if feed_cache.nbytes() > self.__feed_max_bytes:
+                evicted_rows += feed_cache.evict_to_nbytes(self.__feed_max_bytes)
+
+        # Least recently read feeds first
+        cached_bytes = sum(feed_cache.nbytes() for _, feed_cache in feeds)
+        cached_feeds = len(feeds)
+        dropped_feeds = 0
+        for feed_id, feed_cache in sorted(feeds, key=lambda item: item[1].last_used):
+            if cached_bytes <= self.__max_bytes and cached_feeds <= self.__max_feeds:
+                break
+            with self.__cache_lock:
+                if self.__cache.get(feed_id) is not feed_cache:  # Replaced in the meantime
+                    continue
+                del self.__cache[feed_id]
+            cached_bytes -= feed_cache.nbytes()
+            cached_feeds -= 1
+            evicted_rows += feed_cache.rows()
+            dropped_feeds += 1
+
+        metrics.inc("cache_evicted_rows_total", evicted_rows)
+        metrics.inc("cache_dropped_feeds_total", dropped_feeds)
+        if evicted_rows > 0:
+            logger.debug("Cache eviction: %d entries evicted, %d feeds dropped", evicted_rows, dropped_feeds)
+        return evicted_rows, dropped_feeds
+
+    def get_size(self):
+        """
+        :return: Dictionary with the memory used by the cache (bytes), its budget, the amount of cached feeds and
+                 entries, and the entries, memory, covered interval start and idle time (seconds) of each feed
+        """
+        feeds = self.__feeds()
+        return {"bytes": sum(feed_cache.nbytes() for _, feed_cache in feeds),
+                "max_bytes": self.__max_bytes,
+                "feeds": len(feeds),
+                "rows": sum(feed_cache.rows() for _, feed_cache in feeds),
+                "feed_sizes": {feed_id: {"rows": feed_cache.rows(),
+                                         "bytes": feed_cache.nbytes(),
+                                         "covered_from": feed_cache.covered_from,
+                                         "idle_seconds": time.monotonic() - feed_cache.last_used
+                                         }
+                               for feed_id, feed_cache in feeds}
+                }
+
+    def run(self):
+        while not self.__stop_event.wait(self.__period):
+            try:
+                with metrics.timer("cache_eviction_seconds"):
+                    self.evict()
+            except Exception as error:  # The evictor must survive unexpected errors
+                logger.error("Cache eviction failed: %s", error)
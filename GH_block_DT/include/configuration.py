@@ -1,14 +1,65 @@
-GREENHOUSE_ID = "A"
-BLOCK_ID = "1"
+import os
+
+GREENHOUSE_ID = os.environ.get("GREENHOUSE_ID", "A")
+BLOCK_ID = os.environ.get("BLOCK_ID", "1")
 SENSOR_LOGS_TIMESTAMP_COLUMN = "timestamp"
 STORAGE_TIME_PERIOD_DAYS = 1
 SENSOR_LOGS_COLUMNS = list(["values", SENSOR_LOGS_TIMESTAMP_COLUMN])
 GH_BLOCK_METADATA = {"DT:GH_block", "greenhouse:" + str(GREENHOUSE_ID), "block:" + str(BLOCK_ID)}
 NETWORK_ID_METADATA_KEY = "network_id:"
-ELECTION_INITIATION_DELAY_SECONDS = 1
-ELECTION_CONTACT_RETRY_ATTEMPTS = 3
+ELECTION_PROBE_TIMEOUT_SECONDS = 0.5  # Timeout of every call to a peer during elections and heartbeats
+ELECTION_DEADLINE_SECONDS = 1         # Maximum time spent contacting the peers (in parallel) in an election step
+ELECTION_RANK_DELAY_SECONDS = 0.2     # Delay before a slave with an expired lease starts an election, for each
+                                      # peer with a smaller net-ID
+ELECTION_MAX_PARALLEL_CONTACTS = 32
+MASTER_HEARTBEAT_SECONDS = 0.5
+MASTER_LEASE_SECONDS = 1.5            # Time a slave trusts the master without hearing from it
 QUERY_FORWARDING_MAX_ATTEMPTS = 3
-QUERY_FORWARDING_REDIRECTION_DELAY = 2
+REPLICATION_PERIOD_SECONDS = 1
+REPLICATION_PUSH_TIMEOUT_SECONDS = 2
+REPLICATION_REFRESH_WINDOW_SECONDS = 60  # Window refreshed for the replicated feeds (only the new entries are fetched)
+REPLICA_MAX_STALENESS_SECONDS = 5        # Maximum age of the replicated cache for a slave to answer reads with it
 CACHE_LOGS_TTL_HOURS = 1
-CACHE_LOGS_CLEANING_TIME_DELTA_MINUTES = 10
+CACHE_MAX_BYTES = 64 * 1024 * 1024       # Memory budget of the whole cache (16 bytes per cached entry)
+CACHE_FEED_MAX_BYTES = 8 * 1024 * 1024   # Memory budget of each feed
+CACHE_MAX_FEEDS = 1024
+CACHE_EVICTION_PERIOD_SECONDS = 10
+CACHE_READ_MAX_ATTEMPTS = 2  # Refreshes of a feed evicted before its window could be read
+CACHE_WARMUP_ENABLED = True  # If True a node becoming master pulls the recent entries of every feed of its block
+CACHE_WARMUP_WINDOW_SECONDS = CACHE_LOGS_TTL_HOURS * 60 * 60
+CACHE_WARMUP_MAX_WAIT_SECONDS = 30  # Maximum time a read waits for the warm-up in progress
 
+COLUMNAR_FORMAT_TAG = "columnar-v1"
+ISO_TIMESTAMP_FORMAT = "ISO8601"  # Explicit format for pd.to_datetime (pandas >= 2.0, see include/log_format.py)
+CACHE_REFRESH_OVERLAP_SECONDS = 1
+SINGLE_FLIGHT_WINDOW_BUCKET_SECONDS = 60
+NS_LOOKUP_TTL_SECONDS = 5  # Time a name server lookup result is reused
+# Maximum age of the peer list the master heartbeats: always within the lease, minus two heartbeats
+MASTER_PEERS_LOOKUP_TTL_SECONDS = min(NS_LOOKUP_TTL_SECONDS, MASTER_LEASE_SECONDS - 2 * MASTER_HEARTBEAT_SECONDS)
+AGGREGATE_BUCKET_COLUMNS = ["values", "min", "max", "last", "timestamp"]  # "values" holds the mean of the bucket
+AGGREGATE_DEFAULT_BUCKET_SECONDS = 60
+AGGREGATE_DEFAULT_POINTS = 500
+SUBSCRIPTION_PUMP_PERIOD_SECONDS = 1
+SUBSCRIPTION_REFRESH_WINDOW_SECONDS = 60  # Window refreshed for the subscribed feeds (only the new entries are fetched)
+SUBSCRIPTION_HEARTBEAT_SECONDS = 5
+# If enabled ("1") the twin keeps its caches current by tailing the MQTT feeds of its block
+TWIN_MQTT_TAIL_ENABLED = os.environ.get("TWIN_MQTT_TAIL_ENABLED", "0") == "1"
+MQTT_BROKER_IP = os.environ.get("MQTT_BROKER_IP", "localhost")
+MQTT_BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", 1883))
+SENSOR_FEED_TOPIC_FORMAT = "greenhouses/{greenhouse}/{block}/sensors/f/+"
+SHARD_RING_NODES = os.environ.get("SHARD_RING_NODES", "logger-1").split(",")  # Same list as the loggers
+SHARD_REPLICATION_FACTOR = 1
+SHARD_VIRTUAL_NODES = 64
+SHARD_NODE_METADATA_KEY = "shard_node:"
+LOGGER_LOAD_TTL_SECONDS = 1  # Time a load reported by a logger is reused
+LOGGER_HEDGED_QUERIES = True  # If True slow queries are also sent to another replica of the feeds
+LOGGER_HEDGE_MIN_DELAY_SECONDS = 0.05
+LOGGER_HEDGE_WORKERS = 8
+LOGGER_SWEEP_COST_FACTOR = 10  # Cost multiplier of the loggers running the retention sweep
+METRICS_NAMESPACE = "gh_block_dt"
+METRICS_LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_HTTP_HOST = "localhost"
+# Port of the Prometheus text endpoint (/metrics), disabled if not set
+METRICS_HTTP_PORT = int(os.environ["METRICS_HTTP_PORT"]) if "METRICS_HTTP_PORT" in os.environ else None
+LOGGING_LEVEL = os.environ.get("LOGGING_LEVEL", "INFO")  # DEBUG also logs the cache decisions of every query
+LOGGING_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
@@ -0,0 +1,312 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from include.configuration import SENSOR_LOGS_TIMESTAMP_COLUMN, SENSOR_LOGS_COLUMNS
+
+
+def feed_cache_key(feed_id):
+    """
+    Normalizes a feed ID with the rule of the logger feed keys (purely alphabetic IDs are case-insensitive), so that
+    the requested feeds, the replicated ones and the MQTT topics share the same cache
+    :param feed_id: Identifier of the kind of sensor feed
+    :return: Key of the feed in the cache
+    """
+    feed_id = str(feed_id)
+    return feed_id.upper() if feed_id.isalpha() else feed_id
+
+
+class FeedCache(object):
+
+    def __init__(self, initial_capacity=1024):
+        """
+        Cache of the entries of a single feed, kept sorted by timestamp in two NumPy arrays (float64 values and int64
+        epoch-ns timestamps), along with the time interval it covers (every entry of the feed in that interval is in
+        the cache).
+        New entries are appended at the end of the arrays, old ones are evicted from the beginning; windows are
+        extracted with a binary search, and merging a fetched interval only replaces the cached entries inside it.
+        The time of the last read is kept for the eviction across feeds (see include/cache_eviction.py).
+        When the entries come from a logger, the cache also keeps the sequence number of the newest one (with its
+        epoch, see DataLogger.get_sensor_logs_since_batch), so that it can be brought up to date with exactly the
+        following entries (see append_delta).
+        :param initial_capacity: Initial size of the arrays (they are doubled when full)
+        """
+        self.__values = np.empty(initial_capacity, dtype="float64")
+        self.__timestamps = np.empty(initial_capacity, dtype="int64")
+        self.__start = 0
+        self.__end = 0
+        self.__covered_from = None  # Covered interval bounds (epoch-ns)
+        self.__covered_to = None
+        self.__last_used = time.monotonic()  # Time of the last read (or of the creation)
+        self.__seq_mark = None  # (epoch, seq) of the newest entry retrieved from the logger, None if unknown
+        self.__lock = threading.Lock()
+
+    @property
+    def covered_from(self):
+        return pd.Timestamp(self.__covered_from) if self.__covered_from is not None else None
+
+    @property
+    def covered_to(self):
+        return pd.Timestamp(self.__covered_to) if self.__covered_to is not None else None
+
+    @property
+    def last_used(self):
+        return self.__last_used
+
+    @property
+    def seq_mark(self):
+        return self.__seq_mark
+
+    def rows(self):
+        return self.__end - self.__start
+
+    def nbytes(self):
+        # Allocated memory (evictions release it, see __compact)
+        return self.__values.nbytes + self.__timestamps.nbytes
+
+    def covers(self, start, end=None):
+        """
+        :param start: Start of the time interval
+        :param end: End of the time interval (if None only the start is checked)
+        :return: True if every entry of the feed in the interval is in the cache
+        """
+        if self.__covered_from is None:
+            return False
+        return (self.__covered_from <= pd.Timestamp(start).value
+                and (end is None or pd.Timestamp(end).value <= self.__covered_to))
+
+    def __reserve(self, size):
+        # Makes room for size live entries at the beginning of the arrays (compacting and possibly growing them)
+        capacity = max(self.__timestamps.shape[0], 1)
+        while capacity < size:
+            capacity *= 2
+
+        live = self.__end - self.__start
+        values = self.__values if capacity == self.__values.shape[0] else np.empty(capacity, dtype="float64")
+        timestamps = self.__timestamps if capacity == self.__timestamps.shape[0] else np.empty(capacity, dtype="int64")
+        values[:live] = self.__values[self.__start:self.__end]
+        timestamps[:live] = self.__timestamps[self.__start:self.__end]
+        self.__values, self.__timestamps = values, timestamps
+        self.__start, self.__end = 0, live
+
+    @staticmethod
+    def __sorted_entries(log_df):
+        new_timestamps = log_df[SENSOR_LOGS_TIMESTAMP_COLUMN].to_numpy(dtype="datetime64[ns]").view("int64")
+        new_values = log_df[SENSOR_LOGS_COLUMNS[0]].to_numpy(dtype="float64")
+        if np.any(np.diff(new_timestamps) < 0):
+            order = np.argsort(new_timestamps, kind="stable")
+            new_timestamps, new_values = new_timestamps[order], new_values[order]
+        return new_timestamps, new_values
+
+    def merge(self, log_df, interval_from, interval_to, seq_mark=None):
+        """
+        Adds the entries fetched for a time interval: they replace every cached entry of the same interval, so that
+        duplicates are removed by position (only at the overlap with the cached entries) instead of by hashing
+        :param log_df: Dataframe with all the entries of the feed in the interval
+        :param interval_from: Start of the fetched interval
+        :param interval_to: End of the fetched interval
+        :param seq_mark: (epoch, seq) of the newest entry, if the entries are every entry of the logger up to it (the
+                         interval is then extended to the newest entry); None if unknown
+        """
+        interval_from = pd.Timestamp(interval_from).value
+        interval_to = pd.Timestamp(interval_to).value
+        new_timestamps, new_values = self.__sorted_entries(log_df)
+        if seq_mark is not None and new_timestamps.shape[0] > 0:  # Entries stored after the logger time was read
+            interval_to = max(interval_to, int(new_timestamps[-1]))
+        # Entries outside the interval (if any) are ignored, the cache must only contain covered time
+        inside = slice(int(np.searchsorted(new_timestamps, interval_from, side="left")),
+                       int(np.searchsorted(new_timestamps, interval_to, side="right")))
+        new_timestamps, new_values = new_timestamps[inside], new_values[inside]
+
+        with self.__lock:
+            if (self.__covered_from is None
+                    or interval_to < self.__covered_from
+                    or interval_from > self.__covered_to):  # Disjoint intervals: the old entries are discarded
+                self.__start, self.__end = 0, 0
+                self.__covered_from, self.__covered_to = interval_from, interval_to
+            else:
+                self.__covered_from = min(self.__covered_from, interval_from)
+                self.__covered_to = max(self.__covered_to, interval_to)
+
+            cached_timestamps = self.__timestamps[self.__start:self.__end]
+            first = self.__start + int(np.searchsorted(cached_timestamps, interval_from, side="left"))
+            last = self.__start + int(np.searchsorted(cached_timestamps, interval_to, side="right"))
+
+            # Cached entries newer than the interval (appended concurrently) may follow the newest fetched one: the
+            # mark is then unknown (the next update is a merge), as it is if a newer one of the same epoch was known
+            if seq_mark is not None and (last != self.__end or (self.__seq_mark is not None
+                                                                and self.__seq_mark[0] == seq_mark[0]
+                                                                and self.__seq_mark[1] > seq_mark[1])):
+                seq_mark = None
+            self.__seq_mark = tuple(seq_mark) if seq_mark is not None else None
+
+            if last == self.__end:  # Common case: the fetched entries replace the tail of the cache
+                self.__end = first
+                if self.__end + new_timestamps.shape[0] > self.__timestamps.shape[0]:
+                    self.__reserve(self.rows() + new_timestamps.shape[0])
+                self.__values[self.__end:self.__end + new_values.shape[0]] = new_values
+                self.__timestamps[self.__end:self.__end + new_timestamps.shape[0]] = new_timestamps
+                self.__end += new_timestamps.shape[0]
+            else:  # The fetched interval is in the middle of the cached one
+                values = np.concatenate([self.__values[self.__start:first], new_values, self.__values[last:self.__end]])
+                timestamps = np.concatenate([self.__timestamps[self.__start:first],
+                                             new_timestamps,
+                                             self.__timestamps[last:self.__end]
+                                             ])
+                self.__values, self.__timestamps = values, timestamps
+                self.__start, self.__end = 0, timestamps.shape[0]
+                self.__reserve(timestamps.shape[0])
+
+    def append_delta(self, log_df, interval_to, base_seq_mark, seq_mark):
+        """
+        Adds the entries following the newest one of the cache (retrieved by sequence number, so they are neither
+        duplicated nor missing), extending the covered interval up to the newest of them or to interval_to
+        :param log_df: Dataframe with the new entries
+        :param interval_to: Time up to which the entries are known to be complete
+        :param base_seq_mark: (epoch, seq) the entries follow
+        :param seq_mark: (epoch, seq) of the newest entry
+        :return: True if the entries were added, False if the cache changed since base_seq_mark was read (the delta
+                 was already applied by a concurrent update, or the cache was replaced)
+        """
+        new_timestamps, new_values = self.__sorted_entries(log_df)
+        interval_to = pd.Timestamp(interval_to).value
+        with self.__lock:
+            if self.__covered_from is None or self.__seq_mark != tuple(base_seq_mark):
+                return False
+
+            if new_timestamps.shape[0] > 0:
+                if self.__end + new_timestamps.shape[0] > self.__timestamps.shape[0]:
+                    self.__reserve(self.rows() + new_timestamps.shape[0])
+                self.__values[self.__end:self.__end + new_values.shape[0]] = new_values
+                self.__timestamps[self.__end:self.__end + new_timestamps.shape[0]] = new_timestamps
+                if self.__end > self.__start and new_timestamps[0] < self.__timestamps[self.__end - 1]:
+                    # Entry stored late (timestamped before the newest cached one): the tail is sorted again
+                    first = self.__start + int(np.searchsorted(self.__timestamps[self.__start:self.__end],
+                                                               new_timestamps[0], side="right"))
+                    order = first + np.argsort(self.__timestamps[first:self.__end + new_timestamps.shape[0]],
+                                               kind="stable")
+                    self.__values[first:self.__end + new_values.shape[0]] = self.__values[order]
+                    self.__timestamps[first:self.__end + new_timestamps.shape[0]] = self.__timestamps[order]
+                self.__end += new_timestamps.shape[0]
+                interval_to = max(interval_to, int(self.__timestamps[self.__end - 1]))
+
+            self.__covered_to = max(self.__covered_to, interval_to)
+            self.__seq_mark = tuple(seq_mark)
+            return True
+
+    def append(self, value, timestamp, complete_since):
+        """
+        Appends an entry newer than all the cached ones (received live), extending the covered interval up to it.
+        The entry is only appended if the covered interval reaches the moment since which every entry is received
+        live, otherwise the covered interval would include a gap (it is filled by the next merge).
+        :param value: Sensor value
+        :param timestamp: Timestamp of the entry
+        :param complete_since: Timestamp since which every entry of the feed is appended
+        :return: True if the entry was appended
+        """
+        timestamp = pd.Timestamp(timestamp).value
+        with self.__lock:
+            if (self.__covered_from is None
+                    or self.__covered_to < pd.Timestamp(complete_since).value
+                    or timestamp < self.__covered_to):
+                return False
+
+            if self.__end == self.__timestamps.shape[0]:
+                self.__reserve(self.rows() + 1)
+            self.__values[self.__end] = value
+            self.__timestamps[self.__end] = timestamp
+            self.__end += 1
+            self.__covered_to = timestamp
+            self.__seq_mark = None  # The logger doesn't know which entries were received live
+            return True
+
+    def window(self, start, end=None, covered_only=False):
+        """
+        :param start: Oldest timestamp to retrieve
+        :param end: Newest timestamp to retrieve (if None every entry newer than start is retrieved)
+        :param covered_only: If True nothing is retrieved unless the cache covers the start of the window (it may
+                             have been evicted since it was refreshed)
+        :return: Dataframe with the cached entries in the requested window (None if covered_only and the window isn't
+                 covered)
+        """
+        with self.__lock:
+            if covered_only and (self.__covered_from is None or pd.Timestamp(start).value < self.__covered_from):
+                return None
+            self.__last_used = time.monotonic()
+            cached_timestamps = self.__timestamps[self.__start:self.__end]
+            first = self.__start + int(np.searchsorted(cached_timestamps, pd.Timestamp(start).value, side="left"))
+            last = (self.__end if end is None
+                    else self.__start + int(np.searchsorted(cached_timestamps, pd.Timestamp(end).value, side="right")))
+
+            return pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: self.__values[first:last].copy(),
+                                 SENSOR_LOGS_TIMESTAMP_COLUMN: self.__timestamps[first:last].astype("datetime64[ns]")
+                                 }, columns=SENSOR_LOGS_COLUMNS)
+
+    def snapshot(self, start=None):
+        """
+        Atomically reads the covered interval and the cached entries from a timestamp on (used to replicate the cache)
+        :param start: Oldest timestamp to retrieve (if None, or older than the covered interval, every cached entry is
+                      retrieved)
+        :return: Tuple containing the dataframe of the entries, the start of the interval they cover, the covered
+                 interval bounds and the (epoch, seq) mark of the newest entry (None if the cache covers nothing)
+        """
+        with self.__lock:
+            if self.__covered_from is None:
+                return None
+            interval_from = self.__covered_from if start is None else max(pd.Timestamp(start).value,
+                                                                          self.__covered_from)
+            first = self.__start + int(np.searchsorted(self.__timestamps[self.__start:self.__end], interval_from,
+                                                       side="left"))
+            timestamps = self.__timestamps[first:self.__end].astype("datetime64[ns]")
+
+            log_df = pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: self.__values[first:self.__end].copy(),
+                                   SENSOR_LOGS_TIMESTAMP_COLUMN: timestamps
+                                   }, columns=SENSOR_LOGS_COLUMNS)
+            return log_df, pd.Timestamp(interval_from), self.covered_from, self.covered_to, self.__seq_mark
+
+    def __evict_before(self, threshold):
+        # Must be called holding the lock, returns the amount of evicted entries
+        if self.__covered_from is None or threshold <= self.__covered_from:
+            return 0
+        evicted = int(np.searchsorted(self.__timestamps[self.__start:self.__end], threshold, side="left"))
+        self.__start += evicted
+        self.__covered_from = min(threshold, self.__covered_to)
+        self.__compact()
+        return evicted
+
+    def __compact(self, force=False):
+        # Releases the memory of the evicted entries once the live ones use a small part of the arrays (or always, if
+        # forced): they are reallocated at their exact size, then grow again by doubling
+        live = self.__end - self.__start
+        if force or self.__timestamps.shape[0] >= 4 * max(live, 1):
+            self.__values = self.__values[self.__start:self.__end].copy()
+            self.__timestamps = self.__timestamps[self.__start:self.__end].copy()
+            self.__start, self.__end = 0, live
+
+    def evict_before(self, threshold):
+        """
+        Removes the entries older than a threshold (the covered interval shrinks accordingly)
+        :param threshold: Oldest timestamp to keep
+        :return: Amount of evicted entries
+        """
+        with self.__lock:
+            return self.__evict_before(pd.Timestamp(threshold).value)
+
+    def evict_to_nbytes(self, max_nbytes):
+        """
+        Removes the oldest entries until the newest ones fit in a memory budget (the covered interval shrinks
+        accordingly)
+        :param max_nbytes: Memory budget of the feed in bytes
+        :return: Amount of evicted entries
+        """
+        max_rows = max_nbytes // (self.__values.itemsize + self.__timestamps.itemsize)
+        with self.__lock:
+            evicted = 0
+            if self.__end - self.__start > max_rows:
+                threshold = (int(self.__timestamps[self.__end - max_rows]) if max_rows > 0
+                             else self.__covered_to + 1)
+                evicted = self.__evict_before(threshold)
+            if self.nbytes() > max_nbytes:  # The entries fit, but not the spare capacity of the arrays
+                self.__compact(force=True)
+            return evicted
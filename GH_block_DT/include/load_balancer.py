@@ -0,0 +1,144 @@
+import threading
+import time
+from math import inf
+from random import sample
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from Pyro5.errors import CommunicationError
+
+from include.configuration import LOGGER_LOAD_TTL_SECONDS, LOGGER_HEDGE_MIN_DELAY_SECONDS, LOGGER_HEDGE_WORKERS, \
+    LOGGER_SWEEP_COST_FACTOR
+from include.metrics import metrics
+
+
+class LoggerBalancer(object):
+
+    def __init__(self, registry, load_ttl=LOGGER_LOAD_TTL_SECONDS, hedge_min_delay=LOGGER_HEDGE_MIN_DELAY_SECONDS,
+                 hedge_workers=LOGGER_HEDGE_WORKERS):
+        """
+        Chooses which replica of a feed answers a query, instead of picking one uniformly at random.
+        Two random candidates are compared (power of two choices) by their expected cost: the requests outstanding
+        from this twin plus the queries in flight on the logger, weighted by its recent p95 latency, its writer queue
+        fill and whether it is running the retention sweep (see DataLogger.get_load). The reported loads are cached
+        for a short time, so most choices don't cost any remote call.
+        Hedged calls are sent to a second replica when the first one hasn't answered within its own p95 latency: the
+        first answer wins, cutting the tail latency caused by a single slow logger.
+        :param registry: Registry cache providing the proxies of the loggers (see include/registry.py)
+        :param load_ttl: Amount of seconds a reported load is reused
+        :param hedge_min_delay: Minimum time in seconds before sending a hedged request
+        :param hedge_workers: Amount of threads sending the hedged calls
+        """
+        self.__registry = registry
+        self.__load_ttl = load_ttl
+        self.__hedge_min_delay = hedge_min_delay
+        self.__executor = ThreadPoolExecutor(max_workers=hedge_workers)  # Each thread has its own pooled proxies
+
+        self.__lock = threading.Lock()
+        self.__loads = dict()        # Reported load of each logger (expiration, load), None if unreachable
+        self.__outstanding = dict()  # Requests sent by this twin to each logger and not answered yet
+        self.__stats = {"calls": 0,
+                        "failovers": 0,  # Calls repeated on another replica after a communication error
+                        "hedged": 0,     # Calls sent to a second replica because the first one was slow
+                        "hedge_wins": 0  # Hedged calls answered by the second replica first
+                        }
+
+    def __reported_load(self, logger_name):
+        with self.__lock:
+            cached_load = self.__loads.get(logger_name)
+        if cached_load is not None and cached_load[0] > time.monotonic():
+            return cached_load[1]
+
+        try:
+            load = self.__registry.proxy(logger_name).get_load()
+        except CommunicationError:
+            self.__registry.invalidate(logger_name)
+            load = None
+        with self.__lock:
+            self.__loads[logger_name] = (time.monotonic() + self.__load_ttl, load)
+        return load
+
+    def __cost(self, logger_name):
+        load = self.__reported_load(logger_name)
+        if load is None:  # Unreachable logger, chosen only if there's nothing else
+            return inf
+        with self.__lock:
+            outstanding = self.__outstanding.get(logger_name, 0)
+
+        cost = (1 + outstanding + load["in_flight"]) * max(load["p95_ms"], 1.0) * (1 + load["queue_fill"])
+        return cost * LOGGER_SWEEP_COST_FACTOR if load["sweeping"] else cost
+
+    def choose(self, logger_names):
+        """
+        :param logger_names: Names of the replicas able to answer the query
+        :return: The name of the less loaded of two random replicas
+        """
+        if len(logger_names) == 1:
+            return logger_names[0]
+        return min(sample(list(logger_names), 2), key=self.__cost)
+
+    def __hedge_delay(self, logger_name):
+        load = self.__reported_load(logger_name)
+        return max(self.__hedge_min_delay, load["p95_ms"] / 1000 if load is not None else 0.0)
+
+    def __call_logger(self, logger_name, remote_call):
+        with self.__lock:
+            self.__outstanding[logger_name] = self.__outstanding.get(logger_name, 0) + 1
+        try:
+            with metrics.timer("logger_call_seconds"):
+                return remote_call(self.__registry.proxy(logger_name))
+        except CommunicationError:
+            self.__registry.invalidate(logger_name)
+            with self.__lock:
+                self.__loads[logger_name] = (time.monotonic() + self.__load_ttl, None)
+            raise
+        finally:
+            with self.__lock:
+                self.__outstanding[logger_name] -= 1
+
+    def call(self, logger_names, remote_call, hedge=False):
+        """
+        Sends a call to the chosen replica, repeating it on another replica if the first one can't be reached
+        :param logger_names: Names of the replicas able to answer the call
+        :param remote_call: Function taking the proxy of a logger and returning the result of the remote call
+        :param hedge: If True the call is also sent to a second replica when the first one is slow
+        :return: The result of the remote call
+        """
+        primary = self.choose(logger_names)
+        others = [logger_name for logger_name in logger_names if logger_name != primary]
+        with self.__lock:
+            self.__stats["calls"] += 1
+
+        if not hedge or len(others) == 0:
+            try:
+                return self.__call_logger(primary, remote_call)
+            except CommunicationError:
+                if len(others) == 0:
+                    raise
+                with self.__lock:
+                    self.__stats["failovers"] += 1
+                return self.__call_logger(self.choose(others), remote_call)
+
+        futures = [self.__executor.submit(self.__call_logger, primary, remote_call)]
+        done, _ = wait(futures, timeout=self.__hedge_delay(primary))
+        hedged = len(done) == 0
+        # Slow or unreachable primary: the call is also sent to another replica
+        if hedged or isinstance(futures[0].exception(), CommunicationError):
+            futures.append(self.__executor.submit(self.__call_logger, self.choose(others), remote_call))
+            with self.__lock:
+                self.__stats["hedged" if hedged else "failovers"] += 1
+
+        error = None
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except CommunicationError as e:
+                error = e
+                continue
+            if hedged and future is not futures[0]:
+                with self.__lock:
+                    self.__stats["hedge_wins"] += 1
+            return result  # The slower call (if any) completes in the background, its result is discarded
+        raise error
+
+    def get_stats(self):
+        with self.__lock:
+            return dict(self.__stats)
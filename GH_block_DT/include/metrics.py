@@ -0,0 +1,161 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from include.configuration import METRICS_NAMESPACE, METRICS_LATENCY_BUCKETS_SECONDS
+
+
+class Metrics(object):
+
+    def __init__(self, namespace=METRICS_NAMESPACE, latency_buckets=METRICS_LATENCY_BUCKETS_SECONDS):
+        """
+        Process-wide counters, latency histograms and gauges.
+        Recording a value only takes a short lock (histograms have fixed buckets, found with a binary search), the
+        percentiles and the exposition formats are computed when the metrics are read. Gauges are functions
+        evaluated at reading time, so they cost nothing on the hot paths.
+        :param namespace: Prefix of the metric names in the Prometheus exposition
+        :param latency_buckets: Upper bounds (seconds, increasing) of the histogram buckets
+        """
+        self.__namespace = namespace
+        self.__buckets = tuple(latency_buckets)
+        self.__lock = threading.Lock()
+        self.__counters = dict()
+        self.__histograms = dict()  # Count of each bucket (the last one is unbounded) followed by the sum, by name
+        self.__gauges = dict()
+        self.__server = None
+
+    def inc(self, name, amount=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        bucket = bisect.bisect_left(self.__buckets, seconds)
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = [0] * (len(self.__buckets) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Context manager recording its duration in a histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def gauge(self, name, function):
+        """
+        Registers a gauge (replacing the one with the same name, if any)
+        :param name: Name of the gauge
+        :param function: Function without arguments returning the current value
+        """
+        with self.__lock:
+            self.__gauges[name] = function
+
+    def __quantile(self, bucket_counts, quantile):
+        # Linear interpolation inside the bucket containing the quantile (the unbounded one reports its lower bound)
+        rank = quantile * sum(bucket_counts)
+        cumulative = 0
+        for bucket, count in enumerate(bucket_counts):
+            if count > 0 and cumulative + count >= rank:
+                if bucket == len(self.__buckets):
+                    return self.__buckets[-1]
+                lower = self.__buckets[bucket - 1] if bucket > 0 else 0.0
+                return lower + (self.__buckets[bucket] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def __read(self):
+        with self.__lock:
+            counters = dict(self.__counters)
+            histograms = {name: list(histogram) for name, histogram in self.__histograms.items()}
+            gauges = dict(self.__gauges)
+
+        gauge_values = dict()
+        for name, function in gauges.items():
+            try:
+                gauge_values[name] = float(function())
+            except Exception:  # A failing gauge mustn't hide the other metrics
+                continue
+        return counters, histograms, gauge_values
+
+    def snapshot(self):
+        """
+        :return: Dictionary with the counters, the gauges and, for each histogram, the amount of observations, their
+                 sum (seconds), the cumulative bucket counts (by upper bound, the last one being unbounded) and the
+                 estimated p50/p95/p99 (ms)
+        """
+        counters, histograms, gauges = self.__read()
+        return {"counters": counters,
+                "gauges": gauges,
+                "histograms": {name: {"count": sum(histogram[:-1]),
+                                      "sum": histogram[-1],
+                                      "bounds": list(self.__buckets),
+                                      "cumulative": [sum(histogram[:bucket + 1])
+                                                     for bucket in range(len(self.__buckets) + 1)],
+                                      "p50_ms": self.__quantile(histogram[:-1], 0.50) * 1000,
+                                      "p95_ms": self.__quantile(histogram[:-1], 0.95) * 1000,
+                                      "p99_ms": self.__quantile(histogram[:-1], 0.99) * 1000
+                                      }
+                               for name, histogram in histograms.items()}
+                }
+
+    def to_prometheus(self):
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        counters, histograms, gauges = self.__read()
+        lines = list()
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {self.__namespace}_{name} counter", f"{self.__namespace}_{name} {value}"]
+        for name, value in sorted(gauges.items()):
+            lines += [f"# TYPE {self.__namespace}_{name} gauge", f"{self.__namespace}_{name} {value}"]
+        for name, histogram in sorted(histograms.items()):
+            lines.append(f"# TYPE {self.__namespace}_{name} histogram")
+            cumulative = 0
+            for bound, count in zip([str(bound) for bound in self.__buckets] + ["+Inf"], histogram[:-1]):
+                cumulative += count
+                lines.append(f'{self.__namespace}_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{self.__namespace}_{name}_sum {histogram[-1]}", f"{self.__namespace}_{name}_count {cumulative}"]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host, port):
+        """
+        Starts (once per process) a HTTP server exposing the metrics in the Prometheus text format on /metrics
+        :param host: Address the server listens on
+        :param port: Port the server listens on
+        """
+        if self.__server is not None:
+            return
+
+        metrics = self
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # Scrapes aren't logged
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+
+metrics = Metrics()  # Shared by every module of the process
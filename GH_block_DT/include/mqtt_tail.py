@@ -0,0 +1,119 @@
+import logging
+import threading
+import pandas as pd
+import paho.mqtt.client as mqtt
+
+from include.configuration import MQTT_BROKER_IP, MQTT_BROKER_PORT, SENSOR_FEED_TOPIC_FORMAT
+from include.feed_cache import feed_cache_key
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MQTTTail(object):
+
+    def __init__(self, greenhouse_id, block_id, get_feed_cache, broker_ip=MQTT_BROKER_IP,
+                 broker_port=MQTT_BROKER_PORT):
+        """
+        Live tail of the sensor feeds of a block: the twin subscribes to the same MQTT topics the loggers store, and
+        appends the new entries to its feed caches as they arrive (see FeedCache.append).
+        Entries are timestamped in logger time, estimating the offset between the local clock and the logger one
+        (see update_clock_offset), so that they can be merged with the entries retrieved from the loggers.
+        Since the (last) subscription every entry is received, so the caches reaching that moment are complete up to
+        now and recent windows don't need the loggers at all; the loggers only fill the gaps (startup, disconnections).
+        :param greenhouse_id: Identifier of the greenhouse
+        :param block_id: Identifier of the block
+        :param get_feed_cache: Function returning the cache of a feed (or None if it has no cache yet)
+        :param broker_ip: Address of the MQTT broker
+        :param broker_port: Port of the MQTT broker
+        """
+        self.__topic = SENSOR_FEED_TOPIC_FORMAT.format(greenhouse=greenhouse_id, block=block_id)
+        self.__get_feed_cache = get_feed_cache
+
+        self.__lock = threading.Lock()
+        self.__clock_offset = None    # Logger clock minus local clock (unknown until the first logger contact)
+        self.__subscribed = False
+        self.__complete_since = None  # Logger time since which every entry is received
+        self.__stats = {"received": 0,
+                        "appended": 0,   # Entries appended to a feed cache
+                        "ignored": 0     # Entries of feeds without cache, or whose cache has a gap
+                        }
+
+        self.__client = mqtt.Client()
+        self.__client.on_connect = self.__on_connect
+        self.__client.on_subscribe = self.__on_subscribe
+        self.__client.on_disconnect = self.__on_disconnect
+        self.__client.on_message = self.__on_message
+        self.__client.connect(broker_ip, broker_port)
+        self.__client.loop_start()  # The loop also reconnects the client after disconnections
+
+    def logger_now(self):
+        """
+        :return: Estimate of the current logger time (None until the clock offset is known)
+        """
+        with self.__lock:
+            return pd.Timestamp.now() + self.__clock_offset if self.__clock_offset is not None else None
+
+    def complete_since(self):
+        """
+        :return: Logger time since which every entry is received, None if the tail isn't live
+        """
+        with self.__lock:
+            return self.__complete_since
+
+    def update_clock_offset(self, remote_timestamp, local_before, local_after):
+        """
+        Updates the clock offset estimate with a logger time reading
+        :param remote_timestamp: Time read on the logger
+        :param local_before: Local time before the request
+        :param local_after: Local time after the answer
+        """
+        with self.__lock:
+            self.__clock_offset = pd.Timestamp(remote_timestamp) - (local_before + (local_after - local_before) / 2)
+            if self.__subscribed and self.__complete_since is None:
+                self.__complete_since = pd.Timestamp.now() + self.__clock_offset
+
+    def __on_connect(self, client, userdata, flags, rc):
+        client.subscribe(self.__topic)  # Subscribing on every (re)connection
+
+    def __on_subscribe(self, client, userdata, mid, granted_qos):
+        with self.__lock:
+            self.__subscribed = True
+            if self.__clock_offset is not None:
+                self.__complete_since = pd.Timestamp.now() + self.__clock_offset
+        logger.info("MQTT tail live on %s", self.__topic)
+
+    def __on_disconnect(self, client, userdata, rc):
+        with self.__lock:
+            self.__subscribed = False
+            self.__complete_since = None
+        metrics.inc("tail_disconnections_total")
+        logger.error("MQTT tail disconnected")
+
+    def __on_message(self, client, userdata, message):
+        with self.__lock:
+            self.__stats["received"] += 1
+        complete_since = self.complete_since()
+        timestamp = self.logger_now()
+
+        feed_cache = self.__get_feed_cache(feed_cache_key(message.topic.split("/")[-1]))
+        try:
+            appended = (complete_since is not None
+                        and feed_cache is not None
+                        and feed_cache.append(float(message.payload.decode('utf-8')), timestamp, complete_since))
+        except (ValueError, UnicodeDecodeError):
+            logger.warning("MQTT tail received a non numeric payload on %s", message.topic)
+            appended = False
+
+        with self.__lock:
+            self.__stats["appended" if appended else "ignored"] += 1
+
+    def get_stats(self):
+        with self.__lock:
+            stats = dict(self.__stats)
+        stats["live"] = self.__complete_since is not None
+        return stats
+
+    def stop(self):
+        self.__client.loop_stop()
+        self.__client.disconnect()
@@ -0,0 +1,124 @@
+import logging
+import threading
+from datetime import timedelta
+from Pyro5.errors import CommunicationError
+
+from include.configuration import REPLICATION_PERIOD_SECONDS, REPLICATION_PUSH_TIMEOUT_SECONDS, \
+    CACHE_REFRESH_OVERLAP_SECONDS
+from include.log_format import encode_log_columnar
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheReplicator(threading.Thread):
+
+    def __init__(self, cache, refresh, is_master, master_id, registry, period=REPLICATION_PERIOD_SECONDS):
+        """
+        Thread streaming the cache of the master to the registered slaves (replicas), which then answer the reads
+        themselves (see GHBlockDT.apply_cache_delta).
+        At every period the cached feeds are refreshed together (a single upstream query), then each replica gets a
+        delta: for each feed, the entries added since the last delta (from the end of the interval last replicated,
+        with the refresh overlap), the bounds of the covered interval, whose start is the eviction watermark, and the
+        (epoch, seq) mark of the newest entry: a replica elected master goes on refreshing its copy by sequence number.
+        Every delta also carries the current logger time, so the replicas know how stale their copy is.
+        Replicas that can't be reached, or that follow another master, are dropped (they register again).
+        :param cache: Dictionary of the feed caches (feed_id: FeedCache)
+        :param refresh: Function refreshing the caches of a list of feeds, returning the current logger time
+        :param is_master: Function returning True while this node is the master
+        :param master_id: Function returning the net-ID of this node
+        :param registry: Registry cache providing the proxies of the replicas (see include/registry.py)
+        :param period: Time between two deltas in seconds
+        """
+        super().__init__(daemon=True)
+
+        self.__cache = cache
+        self.__refresh = refresh
+        self.__is_master = is_master
+        self.__master_id = master_id
+        self.__registry = registry
+        self.__period = period
+
+        self.__replicas = dict()  # Covered interval last replicated for each feed, by replica name
+        self.__replicas_lock = threading.Lock()
+        self.__stop_event = threading.Event()
+
+    def add(self, replica_name):
+        """
+        Registers a replica (again): it gets the whole cache with the next delta
+        :param replica_name: Registered name of the replica
+        """
+        with self.__replicas_lock:
+            self.__replicas[str(replica_name)] = dict()
+
+    def remove(self, replica_name):
+        with self.__replicas_lock:
+            self.__replicas.pop(str(replica_name), None)
+
+    def replica_amount(self):
+        return len(self.__replicas)
+
+    def stop(self):
+        self.__stop_event.set()
+        self.join()
+
+    def __delta(self, replicated):
+        # Feed deltas since the replicated intervals (updated in place), skipping the unchanged feeds
+        feeds = dict()
+        for feed_id, feed_cache in list(self.__cache.items()):
+            last_interval = replicated.get(feed_id)
+            if last_interval == (feed_cache.covered_from, feed_cache.covered_to):
+                continue
+
+            snapshot = feed_cache.snapshot(last_interval[1] - timedelta(seconds=CACHE_REFRESH_OVERLAP_SECONDS)
+                                           if last_interval is not None else None)
+            if snapshot is None:
+                continue
+            log_df, interval_from, covered_from, covered_to, seq_mark = snapshot
+            feeds[feed_id] = {"log": encode_log_columnar(log_df),
+                              "interval_from": interval_from.value,  # Epoch-ns timestamps
+                              "covered_from": covered_from.value,
+                              "covered_to": covered_to.value,
+                              "seq_mark": list(seq_mark) if seq_mark is not None else None
+                              }
+            replicated[feed_id] = (covered_from, covered_to)
+        return feeds
+
+    def __push(self, replica_name, replicated, remote_current_timestamp):
+        try:
+            proxy = self.__registry.proxy(replica_name)
+            proxy._pyroTimeout = REPLICATION_PUSH_TIMEOUT_SECONDS  # Pooled by this thread only
+            accepted = proxy.apply_cache_delta(self.__master_id(),
+                                               remote_current_timestamp.value,
+                                               self.__delta(replicated)
+                                               )
+        except CommunicationError:
+            metrics.inc("dropped_replicas_total")
+            logger.error("Replica unreachable, dropping %s", replica_name)
+            self.__registry.invalidate(replica_name)
+            accepted = False
+        if not accepted:
+            self.remove(replica_name)
+
+    def __replicate(self):
+        if not self.__is_master():  # Stepped down: the replicas register with the new master
+            with self.__replicas_lock:
+                self.__replicas.clear()
+            return
+
+        with self.__replicas_lock:
+            replicas = list(self.__replicas.items())
+        if len(replicas) == 0 or len(self.__cache) == 0:
+            return
+
+        with metrics.timer("replication_seconds"):
+            remote_current_timestamp = self.__refresh(list(self.__cache.keys()))
+            for replica_name, replicated in replicas:
+                self.__push(replica_name, replicated, remote_current_timestamp)
+
+    def run(self):
+        while not self.__stop_event.wait(self.__period):
+            try:
+                self.__replicate()
+            except Exception as error:  # The replicator must survive failed refreshes (e.g. unavailable logger)
+                logger.error("Cache replication failed: %s", error)
@@ -0,0 +1,68 @@
+import threading
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        """
+        Coalesces concurrent executions of the same operation: while an operation identified by a key is running,
+        other callers asking for the same key wait for it and get its result (or its exception) instead of running
+        it again
+        """
+        self.__lock = threading.Lock()
+        self.__flights = dict()
+        self.__stats = {"executed": 0,   # Operations actually executed
+                        "coalesced": 0   # Calls served by an operation already in flight
+                        }
+
+    def do(self, key, func, *args, **kwargs):
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.__flights[key] = flight
+            self.__stats["executed" if leader else "coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+        return flight.result
+
+    def wait(self, key, timeout=None):
+        """
+        Waits for the operation identified by a key, if it is in flight
+        :param key: Key of the operation
+        :param timeout: Maximum waiting time in seconds
+        :return: True if no operation is in flight anymore
+        """
+        with self.__lock:
+            flight = self.__flights.get(key)
+        return flight is None or flight.done.wait(timeout)
+
+    def get_stats(self):
+        with self.__lock:
+            stats = dict(self.__stats)
+        stats["in_flight"] = len(self.__flights)
+        return stats
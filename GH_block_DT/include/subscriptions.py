@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from uuid import uuid4
+import pandas as pd
+from Pyro5.errors import CommunicationError
+
+from include.configuration import SENSOR_LOGS_TIMESTAMP_COLUMN, SUBSCRIPTION_PUMP_PERIOD_SECONDS, \
+    SUBSCRIPTION_HEARTBEAT_SECONDS
+from include.log_format import encode_log_columnar
+from include.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscription(object):
+
+    def __init__(self, feed_id, callback_uri, since):
+        self.feed_id = feed_id
+        self.callback_uri = callback_uri
+        self.last_pushed = since          # Timestamp of the newest entry pushed (logger time)
+        self.last_push_time = time.monotonic()
+
+
+class SubscriptionPump(threading.Thread):
+
+    def __init__(self, refresh, read_since, registry, period=SUBSCRIPTION_PUMP_PERIOD_SECONDS,
+                 heartbeat=SUBSCRIPTION_HEARTBEAT_SECONDS):
+        """
+        Thread pushing the new entries of the subscribed feeds to the subscribers (Pyro callback objects exposing a
+        oneway push_sensor_log(subscription_id, feed_id, log) method).
+        At every period the caches of all the subscribed feeds are refreshed together (a single upstream query,
+        however many subscribers there are), then each subscriber gets the entries newer than the last ones it got.
+        Subscribers are also pushed an empty log when they got nothing for a while (heartbeat), so that they can tell
+        a quiet feed from a lost subscription; unreachable subscribers are dropped.
+        :param refresh: Function refreshing the caches of a list of feeds, returning the current logger time
+        :param read_since: Function returning the dataframe of the cached entries of a feed newer than a timestamp
+        :param registry: Registry cache providing the proxies of the subscribers (see include/registry.py)
+        :param period: Time between two pushes in seconds
+        :param heartbeat: Maximum time in seconds a subscriber can go without being pushed anything
+        """
+        super().__init__(daemon=True)
+
+        self.__refresh = refresh
+        self.__read_since = read_since
+        self.__registry = registry
+        self.__period = period
+        self.__heartbeat = heartbeat
+
+        self.__subscriptions = dict()
+        self.__released_uris = set()  # Callback URIs no subscription uses any more (their proxies are pump-owned)
+        self.__subscriptions_lock = threading.Lock()
+        self.__stop_event = threading.Event()
+
+    def add(self, feed_id, callback_uri, since=None):
+        """
+        :param feed_id: Identifier of the kind of sensor feed
+        :param callback_uri: URI of the subscriber callback object
+        :param since: Timestamp of the newest entry the subscriber already has (if None only the entries newer than
+                      the first push are pushed)
+        :return: Identifier of the subscription
+        """
+        subscription_id = uuid4().hex
+        with self.__subscriptions_lock:
+            self.__subscriptions[subscription_id] = _Subscription(str(feed_id),
+                                                                  str(callback_uri),
+                                                                  pd.Timestamp(since) if since is not None else None
+                                                                  )
+        return subscription_id
+
+    def remove(self, subscription_id):
+        """
+        :param subscription_id: Identifier of the subscription
+        :return: True if the subscription existed
+        """
+        with self.__subscriptions_lock:
+            subscription = self.__subscriptions.pop(subscription_id, None)
+            if subscription is None:
+                return False
+            if all(other.callback_uri != subscription.callback_uri for other in self.__subscriptions.values()):
+                self.__released_uris.add(subscription.callback_uri)
+            return True
+
+    def subscription_amount(self):
+        return len(self.__subscriptions)
+
+    def stop(self):
+        self.__stop_event.set()
+        self.join()
+
+    def __push(self, subscription_id, subscription, log_df):
+        try:
+            self.__registry.proxy(subscription.callback_uri).push_sensor_log(subscription_id,
+                                                                            subscription.feed_id,
+                                                                            encode_log_columnar(log_df)
+                                                                            )
+            subscription.last_push_time = time.monotonic()
+            metrics.inc("pushes_total")
+        except CommunicationError:
+            metrics.inc("dropped_subscriptions_total")
+            logger.error("Subscriber unreachable, dropping subscription %s", subscription_id)
+            self.__registry.invalidate(subscription.callback_uri)
+            self.remove(subscription_id)
+
+    def __pump(self):
+        with self.__subscriptions_lock:
+            subscriptions = list(self.__subscriptions.items())
+            released_uris, self.__released_uris = self.__released_uris, set()
+        for callback_uri in released_uris:  # The proxies are pooled per thread: they are dropped by the pump thread
+            self.__registry.invalidate(callback_uri)
+        if len(subscriptions) == 0:
+            return
+
+        remote_current_timestamp = self.__refresh(list(set(subscription.feed_id for _, subscription in subscriptions)))
+
+        for subscription_id, subscription in subscriptions:
+            if subscription.last_pushed is None:  # First push: the subscriber gets the entries from now on
+                subscription.last_pushed = remote_current_timestamp
+
+            new_entries = self.__read_since(subscription.feed_id, subscription.last_pushed)
+            if new_entries.shape[0] > 0:
+                subscription.last_pushed = new_entries[SENSOR_LOGS_TIMESTAMP_COLUMN].max()
+            elif time.monotonic() - subscription.last_push_time < self.__heartbeat:
+                continue
+            self.__push(subscription_id, subscription, new_entries)
+
+    def run(self):
+        while not self.__stop_event.wait(self.__period):
+            try:
+                self.__pump()
+            except Exception as error:  # The pump must survive failed refreshes (e.g. unavailable logger)
+                logger.error("Subscription pump failed: %s", error)
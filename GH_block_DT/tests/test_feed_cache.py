@@ -0,0 +1,178 @@
+import os
+import sys
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from include.configuration import SENSOR_LOGS_COLUMNS, SENSOR_LOGS_TIMESTAMP_COLUMN  # noqa: E402
+from include.feed_cache import FeedCache, feed_cache_key  # noqa: E402
+
+START = pd.Timestamp("2026-01-01 12:00:00")
+
+
+def _at(seconds):
+    return START + pd.Timedelta(seconds=seconds)
+
+
+def _log(seconds, values=None):
+    # Entries timestamped at the given seconds after START (valued after them, unless given)
+    return pd.DataFrame({SENSOR_LOGS_COLUMNS[0]: [float(value) for value in (values or seconds)],
+                         SENSOR_LOGS_TIMESTAMP_COLUMN: [_at(second) for second in seconds]
+                         }, columns=SENSOR_LOGS_COLUMNS)
+
+
+def _values(log_df):
+    return log_df[SENSOR_LOGS_COLUMNS[0]].tolist()
+
+
+class FeedCacheMergeTest(unittest.TestCase):
+
+    def test_overlapping_merge_replaces_the_overlap(self):
+        cache = FeedCache()
+        cache.merge(_log(range(0, 10)), _at(0), _at(9))
+        # The fetched interval [5, 15] replaces the cached entries inside it (one of them changed)
+        cache.merge(_log(range(5, 16), values=[50] + list(range(6, 16))), _at(5), _at(15))
+
+        self.assertEqual(_values(cache.window(_at(0))), [0, 1, 2, 3, 4, 50] + list(range(6, 16)))
+        self.assertEqual((cache.covered_from, cache.covered_to), (_at(0), _at(15)))
+
+    def test_merge_inside_the_covered_interval(self):
+        cache = FeedCache()
+        cache.merge(_log(range(0, 10)), _at(0), _at(9))
+        cache.merge(_log([3, 4], values=[30, 40]), _at(2.5), _at(4.5))
+
+        self.assertEqual(_values(cache.window(_at(0))), [0, 1, 2, 30, 40, 5, 6, 7, 8, 9])
+        self.assertEqual((cache.covered_from, cache.covered_to), (_at(0), _at(9)))
+
+    def test_disjoint_merge_discards_the_cached_entries(self):
+        cache = FeedCache()
+        cache.merge(_log(range(0, 5)), _at(0), _at(4))
+        cache.merge(_log(range(20, 25)), _at(20), _at(24))
+
+        self.assertEqual(_values(cache.window(_at(0))), list(range(20, 25)))
+        self.assertEqual((cache.covered_from, cache.covered_to), (_at(20), _at(24)))
+        self.assertFalse(cache.covers(_at(10)))
+
+    def test_merge_ignores_the_entries_outside_the_interval(self):
+        cache = FeedCache()
+        cache.merge(_log(range(0, 10)), _at(2), _at(6))
+
+        self.assertEqual(_values(cache.window(_at(0))), [2, 3, 4, 5, 6])
+
+    def test_merge_keeps_the_newest_seq_mark(self):
+        cache = FeedCache()
+        cache.merge(_log(range(0, 10)), _at(0), _at(9), (1, 10))
+        cache.merge(_log(range(5, 10)), _at(5), _at(9), (1, 8))  # Older mark of the same epoch: unknown
+
+        self.assertIsNone(cache.seq_mark)
+
+        cache.merge(_log(range(5, 12)), _at(5), _at(11), (2, 3))  # New epoch of the logger
+        self.assertEqual(cache.seq_mark, (2, 3))
+
+
+class FeedCacheDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FeedCache()
+        self.cache.merge(_log(range(0, 10)), _at(0), _at(9), (1, 10))
+
+    def test_delta_extends_the_cache(self):
+        self.assertTrue(self.cache.append_delta(_log([10, 11]), _at(12), (1, 10), (1, 12)))
+
+        self.assertEqual(_values(self.cache.window(_at(0))), list(range(0, 12)))
+        self.assertEqual(self.cache.covered_to, _at(12))
+        self.assertEqual(self.cache.seq_mark, (1, 12))
+
+    def test_delta_with_a_stale_seq_mark_is_discarded(self):
+        self.assertTrue(self.cache.append_delta(_log([10]), _at(10), (1, 10), (1, 11)))
+        # A concurrent refresh read the mark before the first delta was applied
+        self.assertFalse(self.cache.append_delta(_log([10]), _at(10), (1, 10), (1, 11)))
+
+        self.assertEqual(_values(self.cache.window(_at(0))), list(range(0, 11)))
+        self.assertEqual(self.cache.seq_mark, (1, 11))
+
+    def test_delta_after_a_live_append_is_discarded(self):
+        self.assertTrue(self.cache.append(10.0, _at(10), _at(9)))
+
+        self.assertIsNone(self.cache.seq_mark)
+        self.assertFalse(self.cache.append_delta(_log([10]), _at(10), (1, 10), (1, 11)))
+
+    def test_late_entry_is_sorted_in(self):
+        self.assertTrue(self.cache.append_delta(_log([8.5, 10]), _at(10), (1, 10), (1, 12)))
+
+        self.assertEqual(_values(self.cache.window(_at(0))), [0, 1, 2, 3, 4, 5, 6, 7, 8, 8.5, 9, 10])
+
+
+class FeedCacheWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FeedCache()
+        self.cache.merge(_log(range(0, 10)), _at(2), _at(9))
+
+    def test_covered_window(self):
+        self.assertEqual(_values(self.cache.window(_at(2), covered_only=True)), list(range(2, 10)))
+        self.assertEqual(_values(self.cache.window(_at(4), _at(6), covered_only=True)), [4, 5, 6])
+
+    def test_window_starting_before_the_covered_interval(self):
+        self.assertIsNone(self.cache.window(_at(2) - pd.Timedelta(nanoseconds=1), covered_only=True))
+        self.assertEqual(_values(self.cache.window(_at(0))), list(range(2, 10)))
+
+    def test_window_of_an_empty_cache(self):
+        self.assertIsNone(FeedCache().window(_at(0), covered_only=True))
+        self.assertEqual(FeedCache().window(_at(0)).shape[0], 0)
+
+
+class FeedCacheEvictionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FeedCache()
+        self.cache.merge(_log(range(0, 100)), _at(0), _at(99))
+
+    def test_eviction_moves_covered_from(self):
+        self.assertEqual(self.cache.evict_before(_at(40)), 40)
+
+        self.assertEqual(self.cache.covered_from, _at(40))
+        self.assertFalse(self.cache.covers(_at(39)))
+        self.assertIsNone(self.cache.window(_at(39), covered_only=True))
+        self.assertEqual(_values(self.cache.window(_at(40), covered_only=True)), list(range(40, 100)))
+
+    def test_eviction_before_the_covered_interval_does_nothing(self):
+        self.assertEqual(self.cache.evict_before(_at(-10)), 0)
+        self.assertEqual(self.cache.covered_from, _at(0))
+
+    def test_eviction_to_a_memory_budget(self):
+        entry_nbytes = 16  # float64 value and int64 timestamp
+        self.assertEqual(self.cache.evict_to_nbytes(30 * entry_nbytes), 70)
+
+        self.assertEqual(self.cache.rows(), 30)
+        self.assertEqual(self.cache.covered_from, _at(70))
+        self.assertLessEqual(self.cache.nbytes(), 30 * entry_nbytes)
+
+    def test_eviction_to_a_budget_compacts_spare_capacity(self):
+        self.cache.evict_before(_at(70))  # 30 live entries left in larger arrays
+        self.assertEqual(self.cache.evict_to_nbytes(30 * 16), 0)
+
+        self.assertEqual(self.cache.rows(), 30)
+        self.assertLessEqual(self.cache.nbytes(), 30 * 16)
+
+    def test_eviction_of_every_entry(self):
+        self.cache.evict_to_nbytes(0)
+
+        self.assertEqual(self.cache.rows(), 0)
+        self.assertEqual(self.cache.covered_from, self.cache.covered_to)
+
+
+class FeedCacheKeyTest(unittest.TestCase):
+
+    def test_alphabetic_feed_ids_are_case_insensitive(self):
+        self.assertEqual(feed_cache_key("temperature"), "TEMPERATURE")
+        self.assertEqual(feed_cache_key("AirHumidity"), "AIRHUMIDITY")
+
+    def test_other_feed_ids_are_kept(self):
+        self.assertEqual(feed_cache_key("co2_ppm"), "co2_ppm")
+
+
+if __name__ == "__main__":
+    unittest.main()